@@ -15,6 +15,8 @@ import os
 import sys
 import json
 import locale
+import marshal
+import hashlib
 
 def get_current_path():
     if getattr(sys, 'frozen', None):
@@ -24,6 +26,86 @@ def get_current_path():
 
     return ret
 
+class StringCatalog(object):
+    """
+    The strings of strings.json are compiled into one marshal file for each language
+    in ~/.cocos, so only the strings of the languages in use are loaded.
+
+    The catalogs are compiled again if the size or the modification time of strings.json is changed.
+    """
+    VERSION = 1
+
+    def __init__(self, cfg_file_path):
+        self._cfg_file_path = cfg_file_path
+        # one folder for each console & python version, the format of marshal depends on the python version
+        catalog_id = "%s|%d.%d" % (os.path.abspath(cfg_file_path), sys.version_info[0], sys.version_info[1])
+        self._catalog_dir = os.path.join(os.path.expanduser("~/.cocos"),
+                                         "strings_%s" % hashlib.md5(catalog_id).hexdigest()[:8])
+        self._cfg_info = None
+
+        try:
+            st = os.stat(cfg_file_path)
+            self._stamp = (StringCatalog.VERSION, st.st_size, st.st_mtime)
+        except OSError:
+            self._stamp = None
+
+    def _get_catalog_path(self, lang):
+        return os.path.join(self._catalog_dir, "%s.marshal" % lang)
+
+    def _load_cfg_info(self):
+        if self._cfg_info is None:
+            f = open(self._cfg_file_path)
+            self._cfg_info = json.load(f, encoding='utf-8')
+            f.close()
+            self._compile()
+
+        return self._cfg_info
+
+    def _compile(self):
+        langs = self._cfg_info.keys()
+        try:
+            if not os.path.isdir(self._catalog_dir):
+                os.makedirs(self._catalog_dir)
+
+            for lang in langs:
+                catalog_path = self._get_catalog_path(lang)
+                tmp_path = "%s.%d.tmp" % (catalog_path, os.getpid())
+                f = open(tmp_path, "wb")
+                marshal.dump((self._stamp, langs, self._cfg_info[lang]), f)
+                f.close()
+                if sys.platform == 'win32' and os.path.exists(catalog_path):
+                    os.remove(catalog_path)
+                os.rename(tmp_path, catalog_path)
+        except Exception:
+            # the catalogs are optional, strings.json is used if they can't be saved
+            pass
+
+    def load(self, lang):
+        """
+        Returns (available languages, strings of the language). The strings are None
+        if the language is not available.
+        """
+        if self._stamp is None:
+            return ([], None)
+
+        if self._cfg_info is None:
+            try:
+                f = open(self._get_catalog_path(lang), "rb")
+                try:
+                    stamp, langs, strings = marshal.load(f)
+                finally:
+                    f.close()
+
+                if stamp == self._stamp:
+                    return (langs, strings)
+            except Exception:
+                # not compiled yet, or compiled by another version
+                pass
+
+        cfg_info = self._load_cfg_info()
+        return (cfg_info.keys(), cfg_info.get(lang))
+
+
 class MultiLanguage(object):
     CONFIG_FILE_NAME = 'strings.json'
     DEFAULT_LANGUAGE = 'en'
@@ -31,12 +113,10 @@ class MultiLanguage(object):
 
     @classmethod
     def get_available_langs(cls):
-        info = cls.get_instance().cfg_info
         ret = []
-        if info is not None:
-            for key in info.keys():
-                if isinstance(key, unicode):
-                    ret.append(key.encode('utf-8'))
+        for key in cls.get_instance().langs:
+            if isinstance(key, unicode):
+                ret.append(key.encode('utf-8'))
 
         return ret
 
@@ -73,6 +153,10 @@ class MultiLanguage(object):
     def set_language(cls, lang):
         cls.get_instance().set_current_language(lang)
 
+    @classmethod
+    def get_language(cls):
+        return cls.get_instance().cur_lang_key
+
     def __init__(self):
         cfg_file_path = os.path.join(get_current_path(), MultiLanguage.CONFIG_FILE_NAME)
 
@@ -91,25 +175,23 @@ class MultiLanguage(object):
         else:
             cur_lang_key = self.get_lang_key(sys_lang)
 
-        # get the strings info
-        if os.path.isfile(cfg_file_path):
-            f = open(cfg_file_path)
-            self.cfg_info = json.load(f, encoding='utf-8')
-            f.close()
-
-            if self.cfg_info.has_key(cur_lang_key):
-                self.cur_lang_strings = self.cfg_info[cur_lang_key]
-            else:
-                self.cur_lang_strings = None
+        # the encoded strings, keyed by the string key
+        self._encoded_strings = {}
 
-            if self.cfg_info.has_key(MultiLanguage.DEFAULT_LANGUAGE):
-                self.default_lang_strings = self.cfg_info[MultiLanguage.DEFAULT_LANGUAGE]
-            else:
-                self.default_lang_strings = None
+        # get the strings of the current language & the default language
+        self.catalog = StringCatalog(cfg_file_path)
+        self.langs, self.default_lang_strings = self.catalog.load(MultiLanguage.DEFAULT_LANGUAGE)
+        if cur_lang_key == MultiLanguage.DEFAULT_LANGUAGE:
+            self.cur_lang_strings = self.default_lang_strings
+        elif cur_lang_key in self.langs:
+            self.cur_lang_strings = self.catalog.load(cur_lang_key)[1]
         else:
-            self.cfg_info = None
             self.cur_lang_strings = None
-            self.default_lang_strings = None
+
+        if self.cur_lang_strings is None:
+            self.cur_lang_key = MultiLanguage.DEFAULT_LANGUAGE
+        else:
+            self.cur_lang_key = cur_lang_key
 
     def get_lang_key(self, sys_lang):
         sys_lang_info = sys_lang.split('_')
@@ -138,8 +220,10 @@ class MultiLanguage(object):
         return ret
 
     def set_current_language(self, lang):
-        if (self.cfg_info is not None) and (self.cfg_info.has_key(lang)):
-            self.cur_lang_strings = self.cfg_info[lang]
+        if lang in self.langs:
+            self.cur_lang_strings = self.catalog.load(lang)[1]
+            self.cur_lang_key = lang
+            self._encoded_strings = {}
         else:
             cocos.Logging.warning(MultiLanguage.get_string('COCOS_WARNING_LANG_NOT_SUPPORT_FMT', lang))
 
@@ -147,6 +231,10 @@ class MultiLanguage(object):
         return self.encoding
 
     def get_current_string(self, key):
+        ret = self._encoded_strings.get(key)
+        if ret is not None:
+            return ret
+
         if self.has_key(key, self.cur_lang_strings):
             ret = self.cur_lang_strings[key]
         elif self.has_key(key, self.default_lang_strings):
@@ -157,4 +245,59 @@ class MultiLanguage(object):
         if isinstance(ret, unicode):
             ret = ret.encode(self.encoding)
 
+        self._encoded_strings[key] = ret
         return ret
+
+
+def _legacy_load(cfg_file_path, lang):
+    # the loading before the catalogs: strings.json is parsed on each start
+    f = open(cfg_file_path)
+    cfg_info = json.load(f, encoding='utf-8')
+    f.close()
+    return (cfg_info.get(lang), cfg_info.get(MultiLanguage.DEFAULT_LANGUAGE))
+
+
+def benchmark(runs=200, lookups=200):
+    """
+    Prints the time to load the strings & look up some of them as a command does at start,
+    by parsing strings.json as before, and by the catalogs. Checks that both load the same strings.
+    """
+    import time
+
+    cfg_file_path = os.path.join(get_current_path(), MultiLanguage.CONFIG_FILE_NAME)
+    # compile the catalogs if they are not up to date
+    StringCatalog(cfg_file_path).load(MultiLanguage.DEFAULT_LANGUAGE)
+
+    for lang in (MultiLanguage.DEFAULT_LANGUAGE, 'zh'):
+        legacy_strings = _legacy_load(cfg_file_path, lang)
+        catalog = StringCatalog(cfg_file_path)
+        catalog_strings = (catalog.load(lang)[1], catalog.load(MultiLanguage.DEFAULT_LANGUAGE)[1])
+        if legacy_strings != catalog_strings:
+            raise Exception("the strings of '%s' in the catalog are different from strings.json" % lang)
+        keys = sorted(legacy_strings[1].keys())[:lookups]
+
+        start = time.time()
+        for i in range(runs):
+            cur_strings, default_strings = _legacy_load(cfg_file_path, lang)
+            for key in keys:
+                cur_strings.get(key, default_strings.get(key)).encode('utf-8')
+        legacy_cost = (time.time() - start) / runs
+
+        start = time.time()
+        for i in range(runs):
+            MultiLanguage.instance = None
+            instance = MultiLanguage.get_instance()
+            if lang != MultiLanguage.DEFAULT_LANGUAGE:
+                instance.set_current_language(lang)
+            for key in keys:
+                instance.get_current_string(key)
+        catalog_cost = (time.time() - start) / runs
+
+        print("%s: %d lookups, strings.json %.2f ms, catalogs %.2f ms"
+              % (lang, len(keys), legacy_cost * 1000, catalog_cost * 1000))
+
+    MultiLanguage.instance = None
+
+
+if __name__ == '__main__':
+    benchmark()
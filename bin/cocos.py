@@ -27,6 +27,20 @@ import gettext
 import json
 import utils
 import re
+import time
+import itertools
+import threading
+import collections
+from cocos_profile import Profiler
+
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        # the backport of os.scandir for python 2
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
 
 
 # FIXME: MultiLanguage should be deprecated in favor of gettext
@@ -43,32 +57,50 @@ class Cocos2dIniParser:
 
         # read global config file
         self.cocos2d_path = os.path.dirname(os.path.abspath(sys.argv[0]))
-        self._cp.read(os.path.join(self.cocos2d_path, "cocos2d.ini"))
+        config_files = self.get_config_files()
+        self._cp.read(config_files[0])
 
         # XXX: override with local config ??? why ???
-        self._cp.read("~/.cocos2d-js/cocos2d.ini")
+        self._cp.read(config_files[1])
 
     def parse_plugins(self):
+        """
+        Returns the plugins keyed by the command name. The values are PluginInfo objects
+        which are used as the plugin classes, the plugin modules are imported only when
+        the plugins are instantiated.
+        """
         classes = {}
 
-        for s in self._cp.sections():
-            if s == 'plugins':
-                for classname in self._cp.options(s):
-                    plugin_class = get_class(classname)
-                    category = plugin_class.plugin_category()
-                    name = plugin_class.plugin_name()
-                    if name is None:
-                        print(MultiLanguage.get_string('COCOS_PARSE_PLUGIN_WARNING_FMT', classname))
-                    if len(category) == 0:
-                        key = name
-                    else:
-                        # combine category & name as key
-                        # eg. 'project_new'
-                        key = category + '_' + name
-                    classes[key] = plugin_class
+        classnames = self.get_plugin_classnames()
+        registry = PluginRegistry(self, classnames)
+        infos = registry.load()
+        if infos is None:
+            infos = [ PluginInfo.from_class(classname, get_class(classname)) for classname in classnames ]
+            registry.save(infos)
+
+        for info in infos:
+            category = info.plugin_category()
+            name = info.plugin_name()
+            if name is None:
+                print(MultiLanguage.get_string('COCOS_PARSE_PLUGIN_WARNING_FMT', info.classname))
+            if len(category) == 0:
+                key = name
+            else:
+                # combine category & name as key
+                # eg. 'project_new'
+                key = category + '_' + name
+            classes[key] = info
         _check_dependencies(classes)
         return classes
 
+    def get_plugin_classnames(self):
+        if self._cp.has_section('plugins'):
+            return self._cp.options('plugins')
+        return []
+
+    def get_config_files(self):
+        return [ os.path.join(self.cocos2d_path, "cocos2d.ini"), "~/.cocos2d-js/cocos2d.ini" ]
+
     def _sanitize_path(self, path):
         if len(path) == 0:
             return None
@@ -118,6 +150,200 @@ class Cocos2dIniParser:
         return ret
 
 
+class PluginInfo(object):
+    """
+    The name, category, brief description & dependencies of a plugin.
+    It can be used as the plugin class: the plugin class is imported when it's called.
+    """
+
+    def __init__(self, classname, name, category, brief, dependencies):
+        self.classname = classname
+        self._name = name
+        self._category = category
+        self._brief = brief
+        self._dependencies = dependencies
+        self._plugin_class = None
+
+    @staticmethod
+    def from_class(classname, plugin_class):
+        info = PluginInfo(classname, plugin_class.plugin_name(), plugin_class.plugin_category(),
+                          plugin_class.brief_description(), plugin_class.depends_on())
+        info._plugin_class = plugin_class
+        return info
+
+    @staticmethod
+    def from_dict(d):
+        # json gives unicode strings, convert them back to the strings given by the plugin classes
+        def to_str(value, encoding='utf-8'):
+            if value is None:
+                return None
+            return value.encode(encoding)
+
+        dependencies = d["depends_on"]
+        if dependencies is not None:
+            dependencies = [ to_str(dep) for dep in dependencies ]
+
+        return PluginInfo(to_str(d["classname"]), to_str(d["name"]), to_str(d["category"]),
+                          to_str(d["brief"], MultiLanguage.get_instance().get_encoding()), dependencies)
+
+    def to_dict(self):
+        brief = self._brief
+        if isinstance(brief, str):
+            brief = brief.decode(MultiLanguage.get_instance().get_encoding())
+
+        return {
+            "classname": self.classname,
+            "name": self._name,
+            "category": self._category,
+            "brief": brief,
+            "depends_on": self._dependencies
+        }
+
+    def get_plugin_class(self):
+        if self._plugin_class is None:
+            self._plugin_class = get_class(self.classname)
+        return self._plugin_class
+
+    def plugin_name(self):
+        return self._name
+
+    def plugin_category(self):
+        return self._category
+
+    def brief_description(self):
+        return self._brief
+
+    def depends_on(self):
+        return self._dependencies
+
+    def __call__(self, *args, **kwargs):
+        return self.get_plugin_class()(*args, **kwargs)
+
+
+class PluginRegistry(object):
+    """
+    Caches the information of the plugins in ~/.cocos, so the plugin modules are not imported
+    for showing the help or finding the command to run.
+
+    The cache is used only if the modification time of the config files, the strings,
+    the scripts in bin folder and all the files of the plugins are not changed.
+    """
+    VERSION = 1
+
+    def __init__(self, ini_parser, classnames):
+        self._ini_parser = ini_parser
+        self._classnames = classnames
+
+        import hashlib
+        # one cache for each console & language, so they don't invalidate the cache of each other
+        cache_id = "%s|%s" % (os.path.abspath(ini_parser.cocos2d_path), MultiLanguage.get_language())
+        path_hash = hashlib.md5(cache_id).hexdigest()[:8]
+        self._cache_path = os.path.join(os.path.expanduser("~/.cocos"), "plugin_registry_%s.json" % path_hash)
+
+        try:
+            self._stamp = self._get_stamp()
+        except Exception:
+            self._stamp = None
+
+    def _find_module_files(self, module_name):
+        import imp
+        f, path, desc = imp.find_module(module_name)
+        if f is not None:
+            f.close()
+
+        if not os.path.isdir(path):
+            return [ path ]
+
+        ret = []
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                if os.path.splitext(name)[1] == ".py":
+                    ret.append(os.path.join(root, name))
+        return ret
+
+    def _get_stamp(self):
+        bin_path = self._ini_parser.cocos2d_path
+        files = self._ini_parser.get_config_files()
+        for name in os.listdir(bin_path):
+            if os.path.splitext(name)[1] in (".py", ".json"):
+                files.append(os.path.join(bin_path, name))
+
+        for classname in self._classnames:
+            parts = classname.split('.')
+            if len(parts) > 1:
+                files.extend(self._find_module_files(parts[0]))
+
+        stamp = {}
+        for file_path in files:
+            if os.path.isfile(file_path):
+                stamp[file_path] = os.path.getmtime(file_path)
+
+        return {
+            "version": COCOS2D_CONSOLE_VERSION,
+            "classnames": self._classnames,
+            "language": [ MultiLanguage.get_language(), MultiLanguage.get_instance().get_encoding() ],
+            "files": stamp
+        }
+
+    def is_changed(self):
+        """
+        Returns True if any file of the stamp is modified since this registry is created.
+        """
+        try:
+            return self._get_stamp() != self._stamp
+        except Exception:
+            return True
+
+    def load(self):
+        """
+        Returns the cached PluginInfo list, or None if the cache is not valid.
+        """
+        if self._stamp is None or not os.path.isfile(self._cache_path):
+            return None
+
+        try:
+            f = open(self._cache_path)
+            cache = json.load(f)
+            f.close()
+
+            if cache.get("registry_version") != PluginRegistry.VERSION:
+                return None
+
+            if cache.get("stamp") != json.loads(json.dumps(self._stamp)):
+                return None
+
+            return [ PluginInfo.from_dict(d) for d in cache["plugins"] ]
+        except Exception:
+            return None
+
+    def save(self, infos):
+        if self._stamp is None:
+            return
+
+        cache = {
+            "registry_version": PluginRegistry.VERSION,
+            "stamp": self._stamp,
+            "plugins": [ info.to_dict() for info in infos ]
+        }
+
+        tmp_path = "%s.%d.tmp" % (self._cache_path, os.getpid())
+        try:
+            cache_dir = os.path.dirname(self._cache_path)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+
+            f = open(tmp_path, "w")
+            json.dump(cache, f)
+            f.close()
+            if os_is_win32() and os.path.exists(self._cache_path):
+                os.remove(self._cache_path)
+            os.rename(tmp_path, self._cache_path)
+        except Exception:
+            # the cache is optional
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
 class Logging:
     # TODO maybe the right way to do this is to use something like colorama?
     RED = '\033[31m'
@@ -126,9 +352,12 @@ class Logging:
     MAGENTA = '\033[35m'
     RESET = '\033[0m'
 
+    # the output is shown in a terminal though stdout is not a tty, by the cocos daemon for example
+    force_colors = False
+
     @staticmethod
     def _print(s, color=None):
-        if color and sys.stdout.isatty() and sys.platform != 'win32':
+        if color and (Logging.force_colors or sys.stdout.isatty()) and sys.platform != 'win32':
             print(color + s + Logging.RESET)
         else:
             print(s)
@@ -172,44 +401,225 @@ class CCPluginError(Exception):
 
 
 class CMDRunner(object):
+    # the number of the last output lines kept in memory, they are shown when the command is failed
+    OUTPUT_TAIL_LINES = 30
+    # the number of the log files kept in ~/.cocos/logs
+    MAX_LOG_FILES = 50
+    # the characters which need the shell to run the command
+    SHELL_CHARS_PATTERN = re.compile(r'[|&;<>()$`*?\[\]{}~#!\n%]')
+
+    _log_index = itertools.count()
+    _output_lock = threading.Lock()
+    _logs_pruned = False
 
     @staticmethod
-    def run_cmd(command, verbose, cwd=None):
-        if verbose:
-            Logging.debug(MultiLanguage.get_string('COCOS_DEBUG_RUNNING_CMD_FMT', ''.join(command)))
-        else:
-            log_path = CCPlugin._log_path()
-            command += ' >"%s" 2>&1' % log_path
+    def _get_program_name(command):
+        # the name of the program in the command line, used as the name of the profiling span
+        if isinstance(command, (list, tuple)):
+            return os.path.basename(command[0])
+
+        match = re.match(r'\s*(?:"([^"]+)"|(\S+))', command)
+        if match is None:
+            return command
+        return os.path.basename(match.group(1) or match.group(2))
+
+    @staticmethod
+    def _format_command(command):
+        if isinstance(command, (list, tuple)):
+            return subprocess.list2cmdline(command)
+        return command
+
+    @staticmethod
+    def _split_command(command):
+        """
+        Returns the arguments to run the command without the shell,
+        or None if the command needs the features of the shell.
+        """
+        if isinstance(command, (list, tuple)):
+            return list(command)
+
+        if sys.platform == 'win32' or CMDRunner.SHELL_CHARS_PATTERN.search(command):
+            return None
+
+        import shlex
+        if isinstance(command, unicode):
+            command = command.encode('utf-8')
+        try:
+            args = shlex.split(command)
+        except ValueError:
+            return None
+
+        if len(args) == 0 or '=' in args[0]:
+            # setting the environment variables
+            return None
+
+        return args
+
+    @staticmethod
+    def _remove_old_logs(log_dir):
+        try:
+            paths = [ os.path.join(log_dir, name) for name in os.listdir(log_dir) if name.endswith(".log") ]
+            if len(paths) < CMDRunner.MAX_LOG_FILES:
+                return
+
+            paths.sort(key=os.path.getmtime)
+            for path in paths[:len(paths) - CMDRunner.MAX_LOG_FILES + 1]:
+                os.remove(path)
+        except OSError:
+            # removed by another process
+            pass
+
+    @staticmethod
+    def new_log_path(name):
+        """
+        Returns the path of a new log file in ~/.cocos/logs. Each command has its own log file,
+        so the commands run at the same time don't overwrite the logs of each other.
+        The commands run for many files should share one log, see run_cmd().
+        """
+        log_dir = os.path.join(os.path.expanduser("~/.cocos"), "logs")
+        if not os.path.isdir(log_dir):
+            try:
+                os.makedirs(log_dir)
+            except OSError:
+                # created by another process
+                pass
+
+        if not CMDRunner._logs_pruned:
+            # once in each process, the logs are not listed again for each command
+            CMDRunner._logs_pruned = True
+            CMDRunner._remove_old_logs(log_dir)
+        file_name = "%s-%d-%d-%s.log" % (time.strftime("%Y%m%d-%H%M%S"), os.getpid(),
+                                         next(CMDRunner._log_index), re.sub(r'[^\w.-]', '_', name)[:32])
+        return os.path.join(log_dir, file_name)
+
+    @staticmethod
+    def _append_log(log_path, data):
+        # written at once with O_APPEND, so the outputs of the commands run at the same time are not mixed
+        if not os.path.isdir(os.path.dirname(log_path)):
+            os.makedirs(os.path.dirname(log_path))
+        fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, 'O_BINARY', 0), 0666)
+        try:
+            while len(data) > 0:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _run(command, verbose, cwd=None, capture=False, log_path=None):
+        """
+        Runs the command, the output is written into a new log file line by line.
+        If `log_path` is specified, the output is appended to it when the command is finished.
+        If `verbose` is True, the command writes into the console directly, so its colors & prompts
+        are kept, and the log is written only if it's failed.
+        Returns (exit code, log path, the last lines of the output, all the output if `capture` is True).
+        """
+        program_name = CMDRunner._get_program_name(command)
+        args = CMDRunner._split_command(command)
+        tail_lines = collections.deque(maxlen=CMDRunner.OUTPUT_TAIL_LINES)
+        output_lines = [] if capture else None
+        # the output of the builds running in threads is still read line by line, see ThreadOutput
+        inherit_output = verbose and not capture and not isinstance(sys.stdout, ThreadOutput)
+        stdout = None if inherit_output else subprocess.PIPE
+        stderr = None if inherit_output else subprocess.STDOUT
+
         sys.stdout.flush()
-        ret = subprocess.call(command, shell=True, cwd=cwd)
+        buffered_log = log_path is not None or inherit_output
+        if log_path is None:
+            log_path = CMDRunner.new_log_path(program_name)
+        if buffered_log:
+            import cStringIO
+            log_file = cStringIO.StringIO()
+        else:
+            log_file = open(log_path, "wb")
+        ret = None
+        try:
+            log_file.write("$ %s\n" % (command if args is None else subprocess.list2cmdline(args)))
+            with Profiler.span(program_name, "command", command=command, cwd=cwd) as span_args:
+                try:
+                    if args is None:
+                        p = subprocess.Popen(command, shell=True, cwd=cwd, stdout=stdout, stderr=stderr)
+                    else:
+                        p = subprocess.Popen(args, cwd=cwd, stdout=stdout, stderr=stderr)
+                except OSError as e:
+                    # the program is not found, the same as the shell does
+                    log_file.write("%s: %s\n" % (program_name, e.strerror))
+                    tail_lines.append("%s: %s\n" % (program_name, e.strerror))
+                    if inherit_output:
+                        sys.stdout.write("%s: %s\n" % (program_name, e.strerror))
+                    ret = 127
+                    span_args["exit_code"] = ret
+                    return (ret, log_path, list(tail_lines), "" if capture else None)
+
+                if inherit_output:
+                    ret = p.wait()
+                    span_args["exit_code"] = ret
+                    log_file.write("# exit code %d, the output is written into the console only\n" % ret)
+                    return (ret, log_path, list(tail_lines), None)
+
+                for line in iter(p.stdout.readline, ''):
+                    log_file.write(line)
+                    tail_lines.append(line)
+                    if output_lines is not None:
+                        output_lines.append(line)
+                    elif verbose:
+                        with CMDRunner._output_lock:
+                            sys.stdout.write(line)
+                            sys.stdout.flush()
+
+                p.stdout.close()
+                ret = p.wait()
+                span_args["exit_code"] = ret
+        finally:
+            if buffered_log and (ret != 0 or not inherit_output):
+                CMDRunner._append_log(log_path, log_file.getvalue())
+            log_file.close()
+
+        return (ret, log_path, list(tail_lines), None if output_lines is None else ''.join(output_lines))
+
+    @staticmethod
+    def _show_output_tail(tail_lines):
+        if len(tail_lines) == 0:
+            return
+
+        with CMDRunner._output_lock:
+            Logging.error(MultiLanguage.get_string('COCOS_ERROR_CMD_OUTPUT_TAIL_FMT', len(tail_lines)))
+            sys.stdout.write(''.join(tail_lines))
+            sys.stdout.flush()
+
+    @staticmethod
+    def run_cmd(command, verbose, cwd=None, log_path=None):
+        """
+        Runs the command, raises CCPluginError if it's failed. The commands run for each file
+        of a plugin should share a log by `log_path`, instead of creating a log for each file.
+        """
+        if verbose:
+            Logging.debug(MultiLanguage.get_string('COCOS_DEBUG_RUNNING_CMD_FMT', CMDRunner._format_command(command)))
+        ret, log_path, tail_lines, output = CMDRunner._run(command, verbose, cwd, log_path=log_path)
         if ret != 0:
-            message = MultiLanguage.get_string('COCOS_ERROR_RUNNING_CMD_RET_FMT', str(ret))
             if not verbose:
-                message += (MultiLanguage.get_string('COCOS_ERROR_CHECK_LOG_FMT', log_path))
+                # the output is already shown in verbose mode
+                CMDRunner._show_output_tail(tail_lines)
+            message = MultiLanguage.get_string('COCOS_ERROR_RUNNING_CMD_RET_FMT', str(ret))
+            message += (MultiLanguage.get_string('COCOS_ERROR_CHECK_LOG_FMT', log_path))
             raise CCPluginError(message, CCPluginError.ERROR_RUNNING_CMD)
 
     @staticmethod
     def output_for(command, verbose):
         if verbose:
-            Logging.debug(MultiLanguage.get_string('COCOS_DEBUG_RUNNING_CMD_FMT', command))
-        else:
-            log_path = CCPlugin._log_path()
+            Logging.debug(MultiLanguage.get_string('COCOS_DEBUG_RUNNING_CMD_FMT', CMDRunner._format_command(command)))
 
-        try:
-            return subprocess.check_output(command, stderr=subprocess.STDOUT, shell=True)
-        except subprocess.CalledProcessError as e:
-            output = e.output
-            message = MultiLanguage.get_string('COCOS_ERROR_RUNNING_CMD')
-
-            if not verbose:
-                with open(log_path, 'w') as f:
-                    f.write(output)
-                message += MultiLanguage.get_string('COCOS_ERROR_CHECK_LOG_FMT', log_path)
-            else:
+        ret, log_path, tail_lines, output = CMDRunner._run(command, verbose, capture=True)
+        if ret != 0:
+            if verbose:
                 Logging.error(output)
-
+            else:
+                CMDRunner._show_output_tail(tail_lines)
+            message = MultiLanguage.get_string('COCOS_ERROR_RUNNING_CMD')
+            message += MultiLanguage.get_string('COCOS_ERROR_CHECK_LOG_FMT', log_path)
             raise CCPluginError(message, CCPluginError.ERROR_RUNNING_CMD)
 
+        return output
+
     @staticmethod
     def convert_path_to_cmd(path):
         """ Escape paths which include spaces to correct style which bash(mac) and cmd(windows) can treat correctly.
@@ -423,17 +833,206 @@ class DataStatistic(object):
             pass
 
 
+class PluginArgs(object):
+    """
+    The arguments for running a plugin in the current process by CCPlugin._run_plugin.
+
+    The options are set by the option strings of the plugin, eg.
+        PluginArgs().set("-s", src_dir).set("--disable-compile", True)
+    True adds the flag, None & False skip the option, and a list adds the option for each value.
+    """
+
+    def __init__(self, *positionals):
+        self.positionals = list(positionals)
+        self.options = []
+
+    def set(self, option, value):
+        self.options = [ item for item in self.options if item[0] != option ]
+        self.options.append((option, value))
+        return self
+
+    def get(self, option, default=None):
+        for key, value in self.options:
+            if key == option:
+                return value
+        return default
+
+    def to_argv(self):
+        argv = list(self.positionals)
+        for option, value in self.options:
+            if value is None or value is False:
+                continue
+
+            if value is True:
+                argv.append(option)
+            elif isinstance(value, (list, tuple)):
+                for item in value:
+                    argv += [ option, item ]
+            else:
+                argv += [ option, value ]
+
+        return [ arg if isinstance(arg, basestring) else str(arg) for arg in argv ]
+
+
+class BuildContext(object):
+    """
+    The objects shared by the plugins run in one invocation, a plugin & its dependencies for example.
+    The project & the platforms are parsed once, and parsed again only if the project config file is changed.
+    """
+
+    def __init__(self):
+        self._projects = {}
+        self._platforms = {}
+        # the plugins may run in several threads, the platforms of "compile" for example
+        self._lock = threading.Lock()
+
+    def get_project(self, start_dir):
+        with self._lock:
+            project = self._projects.get(start_dir)
+            if project is None or project.is_config_changed():
+                project = cocos_project.Project(start_dir)
+                self._projects[start_dir] = project
+
+            return project
+
+    def get_platforms(self, project, platform, proj_dir):
+        key = (project.get_project_dir(), platform, proj_dir)
+        with self._lock:
+            cached = self._platforms.get(key)
+            if cached is not None and cached[0] is project:
+                return cached[1]
+
+            platforms = cocos_project.Platforms(project, platform, proj_dir)
+            self._platforms[key] = (project, platforms)
+            return platforms
+
+
+class ThreadOutput(object):
+    """
+    Replaces sys.stdout while several builds run in threads at the same time.
+    The output of a thread redirected by redirect_thread() is written into its log file,
+    and into the console line by line with a prefix. The output of the other threads
+    is written into the console directly.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def redirect_thread(self, log_file, prefix=None):
+        """
+        Redirects the output of the current thread into the log file. The output is written
+        into the console too if `prefix` is not None.
+        """
+        saved = getattr(self._local, "target", None)
+        self._local.target = [ log_file, prefix, "" ]
+        try:
+            yield
+        finally:
+            self._write_pending()
+            self._local.target = saved
+
+    def _write_pending(self):
+        target = self._local.target
+        if target[1] is not None and len(target[2]) > 0:
+            with self._lock:
+                self.stream.write("%s%s\n" % (target[1], target[2]))
+        target[2] = ""
+
+    def write(self, data):
+        target = getattr(self._local, "target", None)
+        if target is None:
+            with self._lock:
+                self.stream.write(data)
+            return
+
+        log_file, prefix, pending = target
+        log_file.write(data)
+        if prefix is None:
+            return
+
+        lines = (pending + data).split("\n")
+        target[2] = lines.pop()
+        if len(lines) > 0:
+            with self._lock:
+                for line in lines:
+                    self.stream.write("%s%s\n" % (prefix, line))
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        target = getattr(self._local, "target", None)
+        if target is not None:
+            target[0].flush()
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
 #
 # Plugins should be a sublass of CCPlugin
 #
 class CCPlugin(object):
 
-    def _run_cmd(self, command, cwd=None):
-        CMDRunner.run_cmd(command, self._verbose, cwd)
+    _build_context = None
+
+    def set_build_context(self, context):
+        self._build_context = context
+
+    def get_build_context(self):
+        if self._build_context is None:
+            self._build_context = BuildContext()
+        return self._build_context
+
+    def _run_cmd(self, command, cwd=None, log_path=None):
+        CMDRunner.run_cmd(command, self._verbose, cwd, log_path)
 
     def _output_for(self, command):
         return CMDRunner.output_for(command, self._verbose)
 
+    def _run_plugin(self, command, args):
+        """
+        Runs another plugin in the current process, the same as "cocos <command> <args>" does.
+        `args` is a PluginArgs object, or a list of the command line arguments.
+        The plugin shares the build context with this plugin. Returns the plugin object.
+        """
+        plugins = Cocos2dIniParser().parse_plugins()
+        if command not in plugins:
+            raise CCPluginError(MultiLanguage.get_string('COCOS_ERROR_CMD_NOT_FOUND_FMT', command),
+                                CCPluginError.ERROR_CMD_NOT_FOUND)
+
+        if isinstance(args, PluginArgs):
+            argv = args.to_argv()
+        else:
+            argv = list(args)
+        cmd_str = ' '.join([ 'cocos', command ] + argv)
+
+        try:
+            if self._verbose:
+                Logging.debug(MultiLanguage.get_string('COCOS_DEBUG_RUNNING_CMD_FMT', cmd_str))
+                return run_plugin(command, argv, plugins, self.get_build_context())
+
+            # the output goes to a log file, the same as the commands run by _run_cmd
+            log_path = CMDRunner.new_log_path("cocos-%s" % command)
+            try:
+                with redirect_output(log_path):
+                    return run_plugin(command, argv, plugins, self.get_build_context())
+            except CCPluginError as e:
+                message = ' '.join(e.args)
+                message += '\n' + MultiLanguage.get_string('COCOS_ERROR_CHECK_LOG_FMT', log_path)
+                raise CCPluginError(message, e.get_error_no())
+        except SystemExit as e:
+            # argparse exits on the wrong arguments, don't exit the running plugin
+            if e.code is None or e.code == 0:
+                return None
+            raise CCPluginError(MultiLanguage.get_string('COCOS_ERROR_PLUGIN_EXIT_FMT', (cmd_str, e.code)),
+                                CCPluginError.ERROR_WRONG_ARGS)
+
     @classmethod
     def get_cocos2d_path(cls):
         """returns the path where Cocos2d-x is installed"""
@@ -568,7 +1167,7 @@ class CCPlugin(object):
     # override this method and call super.
     def init(self, args):
         self._verbose = (not args.quiet)
-        self._platforms = cocos_project.Platforms(self._project, args.platform, args.proj_dir)
+        self._platforms = self.get_build_context().get_platforms(self._project, args.platform, args.proj_dir)
         if self._platforms.none_active():
             self._platforms.select_one()
 
@@ -617,9 +1216,9 @@ class CCPlugin(object):
         (args, unkonw) = parser.parse_known_args(argv)
 
         if args.src_dir is None:
-            self._project = cocos_project.Project(os.path.abspath(os.getcwd()))
+            self._project = self.get_build_context().get_project(os.path.abspath(os.getcwd()))
         else:
-            self._project = cocos_project.Project(
+            self._project = self.get_build_context().get_project(
                 os.path.abspath(args.src_dir))
 
         args.src_dir = self._project.get_project_dir()
@@ -634,7 +1233,7 @@ class CCPlugin(object):
                                     CCPluginError.ERROR_WRONG_ARGS)
 
         if args.listplatforms and self._project is not None:
-            platforms = cocos_project.Platforms(self._project, args.platform, args.proj_dir)
+            platforms = self.get_build_context().get_platforms(self._project, args.platform, args.proj_dir)
             p = platforms.get_available_platforms().keys()
             print('{"platforms":' + json.dumps(p) + '}')
             sys.exit(0)
@@ -772,22 +1371,283 @@ def version_compare(a, op, b):
         return False    # op ">" and all digits were equal
     return True         # op "==" and all digits were equal
 
+def get_num_of_cpu():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except Exception:
+        print(MultiLanguage.get_string('COMPILE_DETECT_CPU_FAILED'))
+        return 1
+
+def _list_dir(path):
+    """
+    Returns the names of the sub folders and the names of the files in the folder.
+    scandir is used when available, it doesn't need a stat call for each entry.
+    """
+    dir_names = []
+    file_names = []
+    if _scandir is not None:
+        for entry in _scandir(path):
+            if entry.is_dir():
+                dir_names.append(entry.name)
+            elif entry.is_file():
+                file_names.append(entry.name)
+    else:
+        for name in os.listdir(path):
+            full_path = os.path.join(path, name)
+            if os.path.isdir(full_path):
+                dir_names.append(name)
+            elif os.path.isfile(full_path):
+                file_names.append(name)
+
+    return dir_names, file_names
+
+
+def _copy_file_task(task):
+    shutil.copy(task[0], task[1])
+
+
+class FileCopier(object):
+    """
+    Collects the files to copy while walking the folders, then copies them by a thread pool.
+    """
+
+    # copying a few files in threads is slower than copying them one by one
+    MIN_FILES_FOR_THREADS = 16
+
+    def __init__(self, jobs=None):
+        if jobs is None:
+            # the threads wait for the disk most of the time, but they only slow down
+            # the copying on a single core machine
+            cpu_count = get_num_of_cpu()
+            if cpu_count > 1:
+                jobs = min(cpu_count * 2, 16)
+            else:
+                jobs = 1
+        self._jobs = jobs
+        self._tasks = []
+        self._created_dirs = set()
+
+    def make_dir(self, dst_dir):
+        if dst_dir in self._created_dirs:
+            return
+
+        if not os.path.exists(dst_dir):
+            os.makedirs(add_path_prefix(dst_dir))
+        self._created_dirs.add(dst_dir)
+
+    def add_file(self, src_file, dst_dir):
+        self.make_dir(dst_dir)
+        dst_file = os.path.join(dst_dir, os.path.basename(src_file))
+        self._tasks.append((add_path_prefix(src_file), add_path_prefix(dst_file)))
+
+    def copy(self):
+        tasks = self._tasks
+        self._tasks = []
+
+        jobs = min(self._jobs, len(tasks))
+        if jobs > 1 and len(tasks) >= FileCopier.MIN_FILES_FOR_THREADS:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(jobs)
+            try:
+                # use get() with a timeout, so Ctrl-C can interrupt the waiting
+                pool.map_async(_copy_file_task, tasks).get(0xFFFFFFF)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            for task in tasks:
+                _copy_file_task(task)
+
+
+class FileSyncer(FileCopier):
+    """
+    Copies the files like FileCopier, but skips the files not changed since last sync
+    and removes the files copied by last sync which are not copied any more.
+
+    A file is not changed if the size & modification time of both the source file
+    and the copied file are the same as recorded. The records are saved in a manifest file
+    in ~/.cocos for each destination folder, so the files created by others are never touched,
+    and the manifest is not published with the files.
+    """
+    # the manifest in the destination folder, written by the old versions
+    MANIFEST_FILE_NAME = ".cocos_sync_manifest.json"
+    VERSION = 1
+
+    def __init__(self, dst_root, jobs=None):
+        FileCopier.__init__(self, jobs)
+        self._dst_root = dst_root
+        self._manifest_path = FileSyncer._get_manifest_path(dst_root)
+        self._old_files = self._load_manifest()
+        self._files = {}
+        self._copied = []
+        self.skipped_count = 0
+        self.copied_count = 0
+        self.removed_count = 0
+
+    @staticmethod
+    def _get_manifest_path(dst_root):
+        import hashlib
+        dst_root = os.path.abspath(dst_root)
+        if isinstance(dst_root, unicode):
+            dst_root = dst_root.encode('utf-8')
+        path_hash = hashlib.md5(dst_root).hexdigest()[:8]
+        return os.path.join(os.path.expanduser("~/.cocos"), "sync_manifest_%s.json" % path_hash)
+
+    @staticmethod
+    def has_manifest(dst_root):
+        return os.path.isfile(FileSyncer._get_manifest_path(dst_root)) or \
+               os.path.isfile(os.path.join(dst_root, FileSyncer.MANIFEST_FILE_NAME))
+
+    def _load_manifest(self):
+        manifest_path = self._manifest_path
+        if not os.path.isfile(manifest_path):
+            manifest_path = os.path.join(self._dst_root, FileSyncer.MANIFEST_FILE_NAME)
+            if not os.path.isfile(manifest_path):
+                return {}
+
+        try:
+            f = open(manifest_path)
+            manifest = json.load(f)
+            f.close()
+        except Exception:
+            return {}
+
+        if manifest.get("version") != FileSyncer.VERSION:
+            return {}
+
+        return manifest.get("files", {})
+
+    def _key_of(self, dst_file):
+        return os.path.relpath(dst_file, self._dst_root).replace("\\", "/")
+
+    def _is_up_to_date(self, entry, src_file, src_stat, dst_file):
+        if entry is None or entry["src"] != src_file:
+            return False
+
+        if entry["src_size"] != src_stat.st_size or entry["src_mtime"] != src_stat.st_mtime:
+            return False
+
+        # the copied file may be modified or removed by others
+        try:
+            dst_stat = os.stat(add_path_prefix(dst_file))
+        except OSError:
+            return False
+
+        return entry["size"] == dst_stat.st_size and entry["mtime"] == dst_stat.st_mtime
+
+    def add_file(self, src_file, dst_dir):
+        dst_file = os.path.join(dst_dir, os.path.basename(src_file))
+        key = self._key_of(dst_file)
+        src_stat = os.stat(add_path_prefix(src_file))
+        entry = self._old_files.get(key)
+        if self._is_up_to_date(entry, src_file, src_stat, dst_file):
+            self._files[key] = entry
+            self.skipped_count += 1
+            return
+
+        FileCopier.add_file(self, src_file, dst_dir)
+        self._copied.append((key, src_file, src_stat, dst_file))
+
+    def copy(self):
+        FileCopier.copy(self)
+
+        for (key, src_file, src_stat, dst_file) in self._copied:
+            dst_stat = os.stat(add_path_prefix(dst_file))
+            self._files[key] = {
+                "src": src_file,
+                "src_size": src_stat.st_size,
+                "src_mtime": src_stat.st_mtime,
+                "size": dst_stat.st_size,
+                "mtime": dst_stat.st_mtime
+            }
+        self.copied_count += len(self._copied)
+        self._copied = []
+
+    def _remove_file(self, key):
+        dst_file = os.path.join(self._dst_root, key)
+        if os.path.isfile(dst_file):
+            os.remove(add_path_prefix(dst_file))
+            self.removed_count += 1
+
+        # remove the folders which become empty
+        dst_root = os.path.normpath(self._dst_root)
+        folder = os.path.dirname(os.path.normpath(dst_file))
+        while folder != dst_root and folder.startswith(dst_root):
+            if not os.path.isdir(folder) or len(os.listdir(folder)) > 0:
+                break
+            os.rmdir(folder)
+            folder = os.path.dirname(folder)
+
+    def finish(self):
+        """
+        Removes the files which are not copied by this sync, then saves the manifest.
+        """
+        for key in self._old_files:
+            if key not in self._files:
+                self._remove_file(key)
+
+        old_manifest_path = os.path.join(self._dst_root, FileSyncer.MANIFEST_FILE_NAME)
+        if os.path.isfile(old_manifest_path):
+            os.remove(old_manifest_path)
+
+        manifest = {
+            "version": FileSyncer.VERSION,
+            "files": self._files
+        }
+        if not os.path.isdir(os.path.dirname(self._manifest_path)):
+            os.makedirs(os.path.dirname(self._manifest_path))
+        tmp_path = self._manifest_path + ".tmp"
+        f = open(tmp_path, "w")
+        json.dump(manifest, f)
+        f.close()
+        if os.path.exists(self._manifest_path):
+            os.remove(self._manifest_path)
+        os.rename(tmp_path, self._manifest_path)
+
+        Logging.info(MultiLanguage.get_string('COCOS_INFO_SYNC_FILES_FMT',
+                                              (self.copied_count, self.skipped_count, self.removed_count)))
+
+
+def _collect_files_in_dir(copier, src, dst):
+    dir_names, file_names = _list_dir(src)
+    for name in file_names:
+        copier.add_file(os.path.join(src, name), dst)
+
+    for name in dir_names:
+        new_dst = os.path.join(dst, name)
+        copier.make_dir(new_dst)
+        _collect_files_in_dir(copier, os.path.join(src, name), new_dst)
+
+
+def _collect_files_with_rules(copier, src_rootDir, src, dst, rules, is_include):
+    dir_names, file_names = _list_dir(src)
+    for name in dir_names:
+        _collect_files_with_rules(copier, src_rootDir, os.path.join(src, name),
+                                  os.path.join(dst, name), rules, is_include)
+
+    for name in file_names:
+        abs_path = os.path.join(src, name)
+        rel_path = os.path.relpath(abs_path, src_rootDir)
+        if _in_rules(rel_path, rules) == is_include:
+            copier.add_file(abs_path, dst)
+
+
 def copy_files_in_dir(src, dst):
+    copier = FileCopier()
+    _collect_files_in_dir(copier, src, dst)
+    copier.copy()
+
 
-    for item in os.listdir(src):
-        path = os.path.join(src, item)
-        if os.path.isfile(path):
-            path = add_path_prefix(path)
-            copy_dst = add_path_prefix(dst)
-            shutil.copy(path, copy_dst)
-        if os.path.isdir(path):
-            new_dst = os.path.join(dst, item)
-            if not os.path.isdir(new_dst):
-                os.makedirs(add_path_prefix(new_dst))
-            copy_files_in_dir(path, new_dst)
+def copy_files_with_config(config, src_root, dst_root, copier=None):
+    with Profiler.span("copy %s" % config["from"], "copy", src_root=src_root, dst_root=dst_root, config=config):
+        _copy_files_with_config(config, src_root, dst_root, copier)
 
 
-def copy_files_with_config(config, src_root, dst_root):
+def _copy_files_with_config(config, src_root, dst_root, copier):
     src_dir = config["from"]
     dst_dir = config["to"]
 
@@ -805,67 +1665,42 @@ def copy_files_with_config(config, src_root, dst_root):
         exclude_rules = convert_rules(exclude_rules)
 
     copy_files_with_rules(
-        src_dir, src_dir, dst_dir, include_rules, exclude_rules)
+        src_dir, src_dir, dst_dir, include_rules, exclude_rules, copier)
 
 
-def copy_files_with_rules(src_rootDir, src, dst, include=None, exclude=None):
-    if os.path.isfile(src):
-        if not os.path.exists(dst):
-            os.makedirs(add_path_prefix(dst))
-
-        copy_src = add_path_prefix(src)
-        copy_dst = add_path_prefix(dst)
-        shutil.copy(copy_src, copy_dst)
-        return
+def copy_files_with_rules(src_rootDir, src, dst, include=None, exclude=None, copier=None):
+    """
+    Copies the files by `copier` if it's specified, a FileSyncer for example.
+    """
+    if copier is None:
+        copier = FileCopier()
 
-    if (include is None) and (exclude is None):
-        if not os.path.exists(dst):
-            os.makedirs(add_path_prefix(dst))
-        copy_files_in_dir(src, dst)
+    if os.path.isfile(src):
+        copier.add_file(src, dst)
+    elif (include is None) and (exclude is None):
+        copier.make_dir(dst)
+        _collect_files_in_dir(copier, src, dst)
     elif (include is not None):
-        # have include
-        for name in os.listdir(src):
-            abs_path = os.path.join(src, name)
-            rel_path = os.path.relpath(abs_path, src_rootDir)
-            if os.path.isdir(abs_path):
-                sub_dst = os.path.join(dst, name)
-                copy_files_with_rules(
-                    src_rootDir, abs_path, sub_dst, include=include)
-            elif os.path.isfile(abs_path):
-                if _in_rules(rel_path, include):
-                    if not os.path.exists(dst):
-                        os.makedirs(add_path_prefix(dst))
-
-                    abs_path = add_path_prefix(abs_path)
-                    copy_dst = add_path_prefix(dst)
-                    shutil.copy(abs_path, copy_dst)
+        # have include, the exclude rules are ignored
+        _collect_files_with_rules(copier, src_rootDir, src, dst, _compile_rules(include), True)
     elif (exclude is not None):
         # have exclude
-        for name in os.listdir(src):
-            abs_path = os.path.join(src, name)
-            rel_path = os.path.relpath(abs_path, src_rootDir)
-            if os.path.isdir(abs_path):
-                sub_dst = os.path.join(dst, name)
-                copy_files_with_rules(
-                    src_rootDir, abs_path, sub_dst, exclude=exclude)
-            elif os.path.isfile(abs_path):
-                if not _in_rules(rel_path, exclude):
-                    if not os.path.exists(dst):
-                        os.makedirs(add_path_prefix(dst))
-
-                    abs_path = add_path_prefix(abs_path)
-                    copy_dst = add_path_prefix(dst)
-                    shutil.copy(abs_path, copy_dst)
+        _collect_files_with_rules(copier, src_rootDir, src, dst, _compile_rules(exclude), False)
+    copier.copy()
+
+
+def _compile_rules(rules):
+    # re.compile() returns the rules which are already compiled as they are
+    return [re.compile(rule) for rule in rules]
 
 
 def _in_rules(rel_path, rules):
-    ret = False
     path_str = rel_path.replace("\\", "/")
     for rule in rules:
-        if re.match(rule, path_str):
-            ret = True
+        if rule.match(path_str):
+            return True
 
-    return ret
+    return False
 
 
 def convert_rules(rules):
@@ -874,7 +1709,7 @@ def convert_rules(rules):
         ret = rule.replace('.', '\\.')
         ret = ret.replace('*', '.*')
         ret = "%s" % ret
-        ret_rules.append(ret)
+        ret_rules.append(re.compile(ret))
 
     return ret_rules
 
@@ -921,6 +1756,39 @@ def pushd(newDir):
     os.chdir(previousDir)
 
 
+@contextmanager
+def redirect_output(log_path):
+    """
+    Redirects the stdout & stderr of the process, including the sub-processes, into the log file.
+    Only the output of the current thread is redirected if the builds are running in threads.
+    """
+    if isinstance(sys.stdout, ThreadOutput):
+        log_file = open(log_path, 'w')
+        try:
+            with sys.stdout.redirect_thread(log_file):
+                yield
+        finally:
+            log_file.close()
+        return
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = (os.dup(1), os.dup(2))
+    log_file = open(log_path, 'w')
+    try:
+        os.dup2(log_file.fileno(), 1)
+        os.dup2(log_file.fileno(), 2)
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved_fds[0], 1)
+        os.dup2(saved_fds[1], 2)
+        os.close(saved_fds[0])
+        os.close(saved_fds[1])
+        log_file.close()
+
+
 def help():
     print(MultiLanguage.get_string('COCOS_HELP_BRIEF_FMT',
           (sys.argv[0], COCOS2D_CONSOLE_VERSION)))
@@ -938,6 +1806,8 @@ def help():
         print("\t%s%s%s%s" % (category, name,
                               ' ' * (max_name - len(name + category)),
                               plugin_class.brief_description()))
+    print("\t%s%s%s" % ('daemon', ' ' * (max_name - len('daemon')),
+                        MultiLanguage.get_string('COCOS_DAEMON_BRIEF')))
 
     print(MultiLanguage.get_string('COCOS_HELP_AVAILABLE_ARGS_FMT',
                                    MultiLanguage.get_available_langs()))
@@ -947,13 +1817,18 @@ def show_version():
     print(COCOS_ENGINE_VERSION)
     print("Cocos Console %s" % COCOS2D_CONSOLE_VERSION)
 
-def run_plugin(command, argv, plugins):
+def run_plugin(command, argv, plugins, context=None):
     run_directly = False
     if len(argv) > 0:
         if argv[0] in ['--help', '-h']:
             run_directly = True
 
+    # the dependencies share the parsed project with the plugin
+    if context is None:
+        context = BuildContext()
+
     plugin = plugins[command]()
+    plugin.set_build_context(context)
 
     if run_directly:
         plugin.run(argv, None)
@@ -964,10 +1839,11 @@ def run_plugin(command, argv, plugins):
             for dep_name in dependencies:
                 # FIXME check there's not circular dependencies
                 dependencies_objects[dep_name] = run_plugin(
-                    dep_name, argv, plugins)
+                    dep_name, argv, plugins, context)
         # don't print this info. Not useful to users, and generates noise when parsing output
 #        Logging.info(MultiLanguage.get_string('COCOS_INFO_RUNNING_PLUGIN_FMT', plugin.__class__.plugin_name()))
-        plugin.run(argv, dependencies_objects)
+        with Profiler.span("cocos %s" % command, "plugin", argv=argv):
+            plugin.run(argv, dependencies_objects)
         return plugin
 
 
@@ -1005,7 +1881,9 @@ if language is not None:
 else:
     _ = MultiLanguage.get_string
 
-if __name__ == "__main__":
+def main():
+    global COCOS_ENGINE_VERSION, STAT_VERSION
+
     # Parse the arguments, specify the language
     language_arg = '--ol'
     if language_arg in sys.argv:
@@ -1040,6 +1918,19 @@ if __name__ == "__main__":
         sys.argv.pop(idx)
         sys.argv.pop(idx)
 
+    profile_arg = '--profile'
+    if profile_arg in sys.argv:
+        idx = sys.argv.index(profile_arg)
+        if idx == (len(sys.argv) - 1):
+            Logging.error(MultiLanguage.get_string('COCOS_ERROR_PROFILE_NO_VALUE'))
+            sys.exit(CCPluginError.ERROR_WRONG_ARGS)
+
+        Profiler.enable(sys.argv[idx+1])
+
+        # remove the argument '--profile' & the value
+        sys.argv.pop(idx)
+        sys.argv.pop(idx)
+
     # Get the engine version for the DataStat
     cur_path = get_current_path()
     engine_path = os.path.normpath(os.path.join(cur_path, '../../../'))
@@ -1072,6 +1963,10 @@ if __name__ == "__main__":
         sys.exit(0)
 
     try:
+        if sys.argv[1] == 'daemon':
+            import cocos_daemon
+            sys.exit(cocos_daemon.run_daemon_command(sys.argv[2:], main))
+
         plugins = parser.parse_plugins()
         command = sys.argv[1]
         argv = sys.argv[2:]
@@ -1114,3 +2009,8 @@ if __name__ == "__main__":
             raise
     finally:
         DataStatistic.terminate_stat()
+        Profiler.finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# ----------------------------------------------------------------------------
+# cocos_client: sends the command line to the cocos daemon
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+'''
+Sends the command line, the working directory & the environment to the cocos daemon,
+and writes the output of the command back. Falls back to running cocos.py
+if the daemon is not running, or if the input is a terminal: the command runs without
+stdin in the daemon, so it can't prompt the user.
+
+Only the standard modules which are fast to load are used here, see "cocos daemon -h".
+'''
+
+import os
+import sys
+import json
+import socket
+import struct
+
+# disable the daemon by setting this environment variable
+NO_DAEMON_ENV = 'COCOS_NO_DAEMON'
+
+# the types of the frames sent by the daemon
+FRAME_STDOUT = 'o'
+FRAME_STDERR = 'e'
+FRAME_EXIT = 'x'
+# the daemon can't run the command, run it without the daemon
+FRAME_FALLBACK = 'f'
+
+FRAME_HEADER_SIZE = 5
+
+
+def get_socket_path():
+    return os.path.join(os.path.expanduser('~/.cocos'), 'daemon.sock')
+
+
+def get_bin_dir():
+    return os.path.dirname(os.path.realpath(os.path.abspath(__file__)))
+
+
+def pack_frame(frame_type, data):
+    return struct.pack('>cI', frame_type, len(data)) + data
+
+
+def recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        data = sock.recv(size)
+        if len(data) == 0:
+            return None
+        chunks.append(data)
+        size -= len(data)
+    return ''.join(chunks)
+
+
+def recv_frame(sock):
+    """
+    Returns (frame type, data), or (None, None) if the connection is closed.
+    """
+    header = recv_exactly(sock, FRAME_HEADER_SIZE)
+    if header is None:
+        return (None, None)
+
+    frame_type, size = struct.unpack('>cI', header)
+    data = recv_exactly(sock, size)
+    if data is None:
+        return (None, None)
+
+    return (frame_type, data)
+
+
+def run_without_daemon():
+    cocos_py = os.path.join(get_bin_dir(), 'cocos.py')
+    os.execv(sys.executable, [ sys.executable, cocos_py ] + sys.argv[1:])
+
+
+def run_with_daemon():
+    """
+    Returns the exit code of the command, or None if the daemon is not available.
+    """
+    if os.environ.get(NO_DAEMON_ENV) or not hasattr(socket, 'AF_UNIX'):
+        return None
+
+    if sys.stdin.isatty():
+        return None
+
+    socket_path = get_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        request = {
+            'bin_dir': get_bin_dir(),
+            'argv': sys.argv[1:],
+            'cwd': os.getcwd(),
+            'env': dict(os.environ),
+            # the output is written to a terminal, though the command writes to a pipe in the daemon
+            'stdout_isatty': sys.stdout.isatty()
+        }
+        sock.sendall(json.dumps(request) + '\n')
+    except (socket.error, ValueError):
+        sock.close()
+        return None
+
+    try:
+        while True:
+            frame_type, data = recv_frame(sock)
+            if frame_type == FRAME_STDOUT:
+                sys.stdout.write(data)
+                sys.stdout.flush()
+            elif frame_type == FRAME_STDERR:
+                sys.stderr.write(data)
+                sys.stderr.flush()
+            elif frame_type == FRAME_EXIT:
+                return int(data)
+            elif frame_type == FRAME_FALLBACK:
+                return None
+            else:
+                # the daemon is stopped while running the command
+                return 1
+    finally:
+        sock.close()
+
+
+if __name__ == '__main__':
+    try:
+        ret = run_with_daemon()
+    except KeyboardInterrupt:
+        ret = 1
+
+    if ret is None:
+        run_without_daemon()
+
+    sys.exit(ret)
@@ -0,0 +1,417 @@
+#!/usr/bin/python
+# ----------------------------------------------------------------------------
+# cocos_daemon: keeps a warm cocos process to run the commands
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+'''
+"cocos daemon" keeps a cocos process running, which listens on a local unix socket.
+
+The modules, the strings & the plugins are loaded once when the daemon starts.
+Each command sent by the client (cocos_client.py) runs in a process forked from the daemon,
+in the working directory & with the environment of the client. The output is sent back
+to the client while the command is running.
+'''
+
+import os
+import sys
+import json
+import time
+import errno
+import locale
+import select
+import signal
+import socket
+import threading
+import traceback
+import subprocess
+
+import cocos
+import cocos_client
+from MultiLanguage import MultiLanguage
+
+DAEMON_LOG_FILE = 'daemon.log'
+
+# seconds to wait for the daemon process to listen on the socket
+START_TIMEOUT = 10
+
+
+def _send_frame(conn, frame_type, data):
+    conn.sendall(cocos_client.pack_frame(frame_type, data))
+
+
+def _to_str(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _read_request(conn):
+    data = ''
+    while not data.endswith('\n'):
+        chunk = conn.recv(65536)
+        if len(chunk) == 0:
+            return None
+        data += chunk
+
+    return json.loads(data)
+
+
+def _send_control(control):
+    """
+    Sends a control request to the running daemon. Returns False if the daemon is not running.
+    """
+    socket_path = cocos_client.get_socket_path()
+    if not os.path.exists(socket_path):
+        return False
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(START_TIMEOUT)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({ 'control' : control }) + '\n')
+        frame_type, data = cocos_client.recv_frame(sock)
+        return frame_type == cocos_client.FRAME_EXIT
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+def is_daemon_running():
+    return _send_control('ping')
+
+
+class DaemonServer(object):
+    """
+    Listens on the unix socket, and runs the commands in forked processes.
+    """
+
+    def __init__(self, main_func):
+        self._main_func = main_func
+        self._socket_path = cocos_client.get_socket_path()
+        self._bin_dir = cocos_client.get_bin_dir()
+        self._sock = None
+        self._lock = threading.Lock()
+        self._active_count = 0
+        # the fds of the running commands, they are closed in the forked processes
+        self._session_fds = set()
+        self._stopping = False
+        self._stale = False
+        self._registry = None
+
+    def _warm_up(self):
+        # load the strings & import all the plugins, the forked processes share them
+        parser = cocos.Cocos2dIniParser()
+        plugins_path = parser.get_plugins_path()
+        if plugins_path not in sys.path:
+            sys.path.append(plugins_path)
+
+        plugins = parser.parse_plugins()
+        for key in plugins:
+            plugins[key].get_plugin_class()
+
+        self._registry = cocos.PluginRegistry(parser, parser.get_plugin_classnames())
+
+    def _is_stale(self):
+        """
+        The daemon runs the old code if the scripts, the strings or the plugins are modified.
+        """
+        if not self._stale and self._registry.is_changed():
+            self._stale = True
+
+        return self._stale
+
+    def _run_in_child(self, request):
+        daemon_locale = locale.getdefaultlocale()
+        os.environ.clear()
+        for key, value in request['env'].items():
+            os.environ[_to_str(key)] = _to_str(value)
+        if locale.getdefaultlocale() != daemon_locale:
+            # the strings are loaded again in the language of the client
+            MultiLanguage.instance = None
+        if request.get('stdout_isatty'):
+            # the main script & the plugins may use two instances of the cocos module
+            for module in (cocos, sys.modules.get(self._main_func.__module__)):
+                if hasattr(module, 'Logging'):
+                    module.Logging.force_colors = True
+        os.chdir(_to_str(request['cwd']))
+        sys.argv = [ os.path.join(self._bin_dir, 'cocos.py') ] + [ _to_str(arg) for arg in request['argv'] ]
+
+        try:
+            self._main_func()
+            ret = 0
+        except SystemExit as e:
+            if e.code is None:
+                ret = 0
+            elif isinstance(e.code, int):
+                ret = e.code
+            else:
+                sys.stderr.write('%s\n' % e.code)
+                ret = 1
+        except:
+            traceback.print_exc()
+            ret = 1
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        return ret
+
+    def _close_session_fd(self, fd):
+        with self._lock:
+            self._session_fds.discard(fd)
+            os.close(fd)
+
+    def _fork_command(self, conn, request):
+        """
+        Runs the command in a forked process, returns (pid, stdout fd, stderr fd).
+        Only called by the thread accepting the connections, the other threads just relay the output.
+        """
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        # the lock is held, so the fds of the other commands are not closed while forking
+        with self._lock:
+            pid = os.fork()
+            if pid == 0:
+                ret = 1
+                try:
+                    # a new process group, so the sub-processes of the command can be killed together
+                    os.setsid()
+                    devnull = os.open(os.devnull, os.O_RDONLY)
+                    os.dup2(devnull, 0)
+                    os.dup2(out_w, 1)
+                    os.dup2(err_w, 2)
+                    # the command only keeps its own output
+                    for fd in [ devnull, out_r, out_w, err_r, err_w, conn.fileno() ] + list(self._session_fds):
+                        os.close(fd)
+                    self._sock.close()
+
+                    ret = self._run_in_child(request)
+                finally:
+                    os._exit(ret)
+
+            self._session_fds.update([ conn.fileno(), out_r, err_r ])
+            self._active_count += 1
+
+        os.close(out_w)
+        os.close(err_w)
+        return (pid, out_r, err_r)
+
+    def _relay_output(self, conn, pid, out_r, err_r):
+        """
+        Sends the output of the command to the client until the command exits.
+        """
+        try:
+            self._relay_frames(conn, pid, out_r, err_r)
+        except socket.error:
+            pass
+        finally:
+            with self._lock:
+                self._session_fds.discard(conn.fileno())
+                conn.close()
+                self._active_count -= 1
+
+    def _relay_frames(self, conn, pid, out_r, err_r):
+        frame_types = {
+            out_r : cocos_client.FRAME_STDOUT,
+            err_r : cocos_client.FRAME_STDERR
+        }
+        client_gone = False
+        while len(frame_types) > 0:
+            fds = frame_types.keys()
+            if not client_gone:
+                fds.append(conn.fileno())
+
+            try:
+                readable = select.select(fds, [], [])[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd in readable:
+                if fd not in frame_types:
+                    # the client never sends anything else, it's closed
+                    client_gone = True
+                    continue
+
+                data = os.read(fd, 65536)
+                if len(data) == 0:
+                    self._close_session_fd(fd)
+                    del frame_types[fd]
+                    continue
+
+                if not client_gone:
+                    try:
+                        _send_frame(conn, frame_types[fd], data)
+                    except socket.error:
+                        client_gone = True
+
+            if client_gone:
+                # the client is stopped by Ctrl-C for example, stop the command too
+                try:
+                    os.killpg(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+
+        status = os.waitpid(pid, 0)[1]
+        if os.WIFEXITED(status):
+            ret = os.WEXITSTATUS(status)
+        else:
+            ret = 1
+
+        if not client_gone:
+            _send_frame(conn, cocos_client.FRAME_EXIT, str(ret))
+
+    def _handle(self, conn):
+        """
+        Reads the request in the accepting thread. The commands are forked here, never by
+        several threads at once, and the output is relayed by a thread for each command.
+        """
+        relayed = False
+        try:
+            # the client sends the request as soon as it's connected
+            conn.settimeout(START_TIMEOUT)
+            request = _read_request(conn)
+            if request is None:
+                return
+            conn.settimeout(None)
+
+            control = request.get('control')
+            if control is not None:
+                if control == 'stop':
+                    self._stopping = True
+                _send_frame(conn, cocos_client.FRAME_EXIT, '0')
+            elif request.get('bin_dir') != self._bin_dir or self._is_stale():
+                # the client belongs to another console, or the code is changed
+                _send_frame(conn, cocos_client.FRAME_FALLBACK, '')
+            else:
+                pid, out_r, err_r = self._fork_command(conn, request)
+                relayed = True
+                t = threading.Thread(target=self._relay_output, args=(conn, pid, out_r, err_r))
+                t.daemon = True
+                t.start()
+        except (socket.error, ValueError, KeyError):
+            pass
+        finally:
+            if not relayed:
+                conn.close()
+
+    def serve_forever(self):
+        if is_daemon_running():
+            raise cocos.CCPluginError(MultiLanguage.get_string('COCOS_DAEMON_INFO_ALREADY_RUNNING'),
+                                      cocos.CCPluginError.ERROR_OTHERS)
+
+        if os.path.exists(self._socket_path):
+            # left by a daemon which is killed
+            os.remove(self._socket_path)
+
+        self._warm_up()
+
+        socket_dir = os.path.dirname(self._socket_path)
+        if not os.path.isdir(socket_dir):
+            os.makedirs(socket_dir)
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self._socket_path)
+        # only the current user can run commands by the daemon
+        os.chmod(self._socket_path, 0600)
+        self._sock.listen(16)
+        self._sock.settimeout(1)
+
+        try:
+            while not self._stopping:
+                if self._stale and self._active_count == 0:
+                    break
+
+                try:
+                    conn = self._sock.accept()[0]
+                except socket.timeout:
+                    continue
+
+                self._handle(conn)
+        finally:
+            self._sock.close()
+            if os.path.exists(self._socket_path):
+                os.remove(self._socket_path)
+
+        if self._stale and not self._stopping:
+            # restart with the new code
+            cocos.Logging.info(MultiLanguage.get_string('COCOS_DAEMON_INFO_RESTART'))
+            os.execv(sys.executable, [ sys.executable, os.path.join(self._bin_dir, 'cocos.py'), 'daemon', 'run' ])
+
+
+def start_daemon():
+    if is_daemon_running():
+        cocos.Logging.info(MultiLanguage.get_string('COCOS_DAEMON_INFO_ALREADY_RUNNING'))
+        return 0
+
+    bin_dir = cocos_client.get_bin_dir()
+    log_dir = os.path.dirname(cocos_client.get_socket_path())
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    log_path = os.path.join(log_dir, DAEMON_LOG_FILE)
+
+    log_file = open(log_path, 'a')
+    devnull = open(os.devnull, 'r')
+    try:
+        subprocess.Popen([ sys.executable, os.path.join(bin_dir, 'cocos.py'), 'daemon', 'run' ],
+                         stdin=devnull, stdout=log_file, stderr=subprocess.STDOUT,
+                         cwd=bin_dir, close_fds=True, preexec_fn=os.setsid)
+    finally:
+        devnull.close()
+        log_file.close()
+
+    start_time = time.time()
+    while time.time() - start_time < START_TIMEOUT:
+        if is_daemon_running():
+            cocos.Logging.info(MultiLanguage.get_string('COCOS_DAEMON_INFO_STARTED_FMT',
+                                                        cocos_client.get_socket_path()))
+            return 0
+        time.sleep(0.1)
+
+    raise cocos.CCPluginError(MultiLanguage.get_string('COCOS_DAEMON_ERROR_START_FAILED_FMT', log_path),
+                              cocos.CCPluginError.ERROR_OTHERS)
+
+
+def stop_daemon():
+    if _send_control('stop'):
+        cocos.Logging.info(MultiLanguage.get_string('COCOS_DAEMON_INFO_STOPPED'))
+    else:
+        cocos.Logging.info(MultiLanguage.get_string('COCOS_DAEMON_INFO_NOT_RUNNING'))
+    return 0
+
+
+def show_status():
+    if is_daemon_running():
+        cocos.Logging.info(MultiLanguage.get_string('COCOS_DAEMON_INFO_RUNNING_FMT',
+                                                    cocos_client.get_socket_path()))
+    else:
+        cocos.Logging.info(MultiLanguage.get_string('COCOS_DAEMON_INFO_NOT_RUNNING'))
+    return 0
+
+
+def run_daemon_command(argv, main_func):
+    """
+    Handles "cocos daemon <action>". `main_func` runs a cocos command line in sys.argv.
+    """
+    from argparse import ArgumentParser
+    parser = ArgumentParser(prog="cocos daemon",
+                            description=MultiLanguage.get_string('COCOS_DAEMON_BRIEF'))
+    parser.add_argument("action", choices=[ "start", "stop", "status", "run" ],
+                        help=MultiLanguage.get_string('COCOS_DAEMON_ARG_ACTION'))
+    args = parser.parse_args(argv)
+
+    if cocos.os_is_win32():
+        raise cocos.CCPluginError(MultiLanguage.get_string('COCOS_DAEMON_ERROR_NOT_SUPPORTED'),
+                                  cocos.CCPluginError.ERROR_OTHERS)
+
+    if args.action == "start":
+        return start_daemon()
+    elif args.action == "stop":
+        return stop_daemon()
+    elif args.action == "status":
+        return show_status()
+    else:
+        DaemonServer(main_func).serve_forever()
+        return 0
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# ----------------------------------------------------------------------------
+# cocos_profile: records the time spans of the cocos commands
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+'''
+Records the time spans of the cocos commands for "--profile".
+'''
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class Profiler(object):
+    """
+    Records the time spans of the command if it's run with "--profile <trace file>".
+    The spans are saved in the trace event format of Chrome, which can be opened by chrome://tracing.
+    The spans with the most self time (the time not spent in the child spans) are listed at the end.
+    """
+    TOP_COUNT = 10
+
+    _trace_path = None
+    _events = None
+    _start_time = 0
+    _lock = None
+    _local = None
+
+    @staticmethod
+    def enable(trace_path):
+        Profiler._trace_path = os.path.abspath(trace_path)
+        Profiler._events = []
+        Profiler._start_time = time.time()
+        Profiler._lock = threading.Lock()
+        Profiler._local = threading.local()
+
+    @staticmethod
+    def is_enabled():
+        return Profiler._events is not None
+
+    @staticmethod
+    @contextmanager
+    def span(name, category="cocos", **args):
+        """
+        Records the time of the with-statement. The yielded dict is saved as the arguments
+        of the span, so the results can be added into it, the exit code of a command for example.
+        """
+        if not Profiler.is_enabled():
+            yield args
+            return
+
+        stack = getattr(Profiler._local, "stack", None)
+        if stack is None:
+            stack = Profiler._local.stack = []
+
+        # the time of the child spans
+        stack.append(0)
+        start = time.time()
+        try:
+            yield args
+        finally:
+            duration = time.time() - start
+            self_time = duration - stack.pop()
+            if len(stack) > 0:
+                stack[-1] += duration
+
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": int((start - Profiler._start_time) * 1000000),
+                "dur": int(duration * 1000000),
+                "pid": os.getpid(),
+                "tid": threading.current_thread().ident,
+                "args": args
+            }
+            with Profiler._lock:
+                Profiler._events.append((event, self_time))
+
+    @staticmethod
+    def finish():
+        if not Profiler.is_enabled():
+            return
+
+        import cocos
+        from MultiLanguage import MultiLanguage
+
+        events = Profiler._events
+        Profiler._events = None
+
+        try:
+            f = open(Profiler._trace_path, "w")
+            json.dump({ "traceEvents": [ event for event, self_time in events ], "displayTimeUnit": "ms" },
+                      f, indent=1, default=str)
+            f.close()
+            cocos.Logging.info(MultiLanguage.get_string('COCOS_INFO_PROFILE_SAVED_FMT', Profiler._trace_path))
+        except (IOError, OSError) as e:
+            cocos.Logging.warning(MultiLanguage.get_string('COCOS_WARNING_PROFILE_SAVE_FAILED_FMT', str(e)))
+
+        # [ self time, total time, count ] of the spans with the same name
+        summary = {}
+        for event, self_time in events:
+            item = summary.setdefault(event["name"], [ 0, 0, 0 ])
+            item[0] += self_time
+            item[1] += event["dur"] / 1000000.0
+            item[2] += 1
+
+        if len(summary) == 0:
+            return
+
+        top = sorted(summary.items(), key=lambda item: item[1][0], reverse=True)[:Profiler.TOP_COUNT]
+        cocos.Logging.info(MultiLanguage.get_string('COCOS_INFO_PROFILE_SUMMARY_FMT', len(top)))
+        for name, (self_time, total_time, count) in top:
+            print("%10.3f %10.3f %6d  %s" % (self_time, total_time, count, name))
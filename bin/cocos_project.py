@@ -46,7 +46,9 @@ class Project(object):
                                       cocos.CCPluginError.ERROR_PATH_NOT_FOUND)
 
         project_json = os.path.join(proj_path, Project.CONFIG)
+        f = None
         try:
+            config_mtime = os.path.getmtime(project_json)
             f = open(project_json)
             project_info = json.load(f)
             f.close()
@@ -79,6 +81,10 @@ class Project(object):
         self._project_dir = proj_path
         self._project_lang = lang
 
+        # the config is parsed again only if it's modified
+        self._config_mtime = config_mtime
+        self._config_cache = (config_mtime, project_info)
+
         # if is script project, record whether it has native or not
         self._has_native = False
         if (self._is_script_project() and project_info.has_key(Project.KEY_HAS_NATIVE)):
@@ -107,7 +113,8 @@ class Project(object):
     def invoke_custom_step_script(self, event, tp, args):
         try:
             if self._custom_step is not None:
-                self._custom_step.handle_event(event, tp, args)
+                with cocos.Profiler.span("custom step %s" % event, "custom_step", platform=tp):
+                    self._custom_step.handle_event(event, tp, args)
         except Exception as e:
             cocos.Logging.warning(MultiLanguage.get_string('PROJECT_WARNING_CUSTOM_STEP_FAILED_FMT', e))
             raise e
@@ -131,11 +138,31 @@ class Project(object):
 
         return None
 
+    def _get_config_path(self):
+        return os.path.join(self._project_dir, Project.CONFIG)
+
+    def is_config_changed(self):
+        """
+        Returns True if the config file is modified after the project is parsed.
+        """
+        try:
+            return os.path.getmtime(self._get_config_path()) != self._config_mtime
+        except OSError:
+            return True
+
+    def _load_config(self):
+        project_json = self._get_config_path()
+        mtime = os.path.getmtime(project_json)
+        if self._config_cache[0] != mtime:
+            f = open(project_json)
+            project_info = json.load(f)
+            f.close()
+            self._config_cache = (mtime, project_info)
+
+        return self._config_cache[1]
+
     def get_proj_config(self, key):
-        project_json = os.path.join(self._project_dir, Project.CONFIG)
-        f = open(project_json)
-        project_info = json.load(f)
-        f.close()
+        project_info = self._load_config()
 
         ret = None
         if project_info.has_key(key):
@@ -145,6 +172,8 @@ class Project(object):
 
     def write_proj_config(self, key, value):
         project_json = os.path.join(self._project_dir, Project.CONFIG)
+        # the project is still up to date after its own writing, unless the file is changed by others
+        config_changed = self.is_config_changed()
 
         if os.path.isfile(project_json):
             f = open(project_json)
@@ -159,6 +188,9 @@ class Project(object):
         outfile = open(project_json, "w")
         json.dump(project_info, outfile, sort_keys = True, indent = 4)
         outfile.close()
+        self._config_cache = (os.path.getmtime(project_json), project_info)
+        if not config_changed:
+            self._config_mtime = self._config_cache[0]
 
     def get_project_dir(self):
         return self._project_dir
@@ -19,22 +19,26 @@ import platform
 import sys
 import os
 import json
-import time
 import socket
+import subprocess
 import hashlib
 import datetime
 import zlib
-
-import multiprocessing
+import urlparse
 
 # GA related Constants
 
 GA_HOST        = 'www.google-analytics.com'
+GA_URL         = 'http://' + GA_HOST
 GA_PATH        = '/collect'
 GA_APIVERSION  = '1'
 APPNAME     = 'CocosConcole'
 
-TIMEOUT_VALUE = 0.5
+TIMEOUT_VALUE = 5
+
+# GA accepts at most 20 hits in one batch request
+GA_BATCH_PATH  = '/batch'
+GA_MAX_BATCH_EVENTS = 20
 
 # formal tracker ID
 GA_TRACKERID = 'UA-60734607-3'
@@ -44,6 +48,7 @@ GA_TRACKERID = 'UA-60734607-3'
 
 # BI related Constants
 BI_HOST  = 'ark.cocounion.com'
+BI_URL   = 'http://' + BI_HOST
 BI_PATH  = '/as'
 BI_APPID = '433748803'
 
@@ -67,19 +72,262 @@ class Fields(object):
     SCREEN_RESOLUTION = "sr"
 
 
+# the cache files of the old versions, their events are moved to the spools
 GA_CACHE_EVENTS_FILE = 'cache_events'
 GA_CACHE_EVENTS_BAK_FILE = 'cache_event_bak'
+BI_CACHE_EVENTS_FILE = 'bi_cache_events'
+
+GA_CACHE_SPOOL_FILE = 'ga_cache_events.jsonl'
+BI_CACHE_SPOOL_FILE = 'bi_cache_events.jsonl'
+
+# the events to send are handed to the sender process by the outbox file
+OUTBOX_FILE = 'stat_outbox.jsonl'
+OUTBOX_DRAIN_COUNT = 100
+SENDER_LOCK_FILE = 'stat_sender.lock'
 
 local_cfg_path = os.path.expanduser('~/.cocos')
 local_cfg_file = os.path.join(local_cfg_path, GA_CACHE_EVENTS_FILE)
 local_cfg_bak_file = os.path.join(local_cfg_path, GA_CACHE_EVENTS_BAK_FILE)
-file_in_use_lock = multiprocessing.Lock()
-bak_file_in_use_lock = multiprocessing.Lock()
+bi_cfg_file = os.path.join(local_cfg_path, BI_CACHE_EVENTS_FILE)
+sender_lock_file = os.path.join(local_cfg_path, SENDER_LOCK_FILE)
 
+# the argument to run this script as the sender process
+SENDER_ARG = '--send-events'
 
-BI_CACHE_EVENTS_FILE = 'bi_cache_events'
-bi_cfg_file = os.path.join(local_cfg_path, BI_CACHE_EVENTS_FILE)
-bi_file_in_use_lock = multiprocessing.Lock()
+# the argument to check the sender against a local server
+SELF_TEST_ARG = '--self-test'
+
+class FileLock(object):
+    """
+    A lock shared by processes, by locking a file.
+    """
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+        self.f = None
+
+    def acquire(self, blocking=True):
+        lock_dir = os.path.dirname(self.lock_file)
+        if not os.path.isdir(lock_dir):
+            os.makedirs(lock_dir)
+
+        f = open(self.lock_file, 'a')
+        try:
+            if cocos.os_is_win32():
+                import msvcrt
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                f.seek(0)
+                msvcrt.locking(f.fileno(), mode, 1)
+            else:
+                import fcntl
+                mode = fcntl.LOCK_EX if blocking else (fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(f.fileno(), mode)
+        except (IOError, OSError):
+            f.close()
+            if blocking:
+                raise
+            return False
+
+        self.f = f
+        return True
+
+    def release(self):
+        if self.f is None:
+            return
+
+        try:
+            if cocos.os_is_win32():
+                import msvcrt
+                self.f.seek(0)
+                msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.f.close()
+            self.f = None
+
+class EventSpool(object):
+    """
+    A file of events, one JSON line for each event.
+
+    The events are appended to the end of the file, and drained from the cursor saved
+    in the cursor file, so neither of them rewrites the file. The drained part is removed
+    when it's large enough. All the operations are protected by a lock shared by processes.
+    """
+    COMPACT_SIZE = 64 * 1024
+
+    def __init__(self, spool_file):
+        self.spool_file = spool_file
+        self.cursor_file = spool_file + '.cursor'
+        self.lock = FileLock(spool_file + '.lock')
+
+    def _count_lines(self, offset):
+        f = open(self.spool_file, 'rb')
+        f.seek(offset)
+        count = 0
+        for line in f:
+            count += 1
+        f.close()
+        return count
+
+    def _read_cursor(self):
+        """
+        Returns (offset, count): the position of the first event not drained & the number of events left.
+        """
+        if not os.path.isfile(self.spool_file):
+            return (0, 0)
+
+        try:
+            f = open(self.cursor_file)
+            cursor = json.load(f)
+            f.close()
+            offset = cursor['offset']
+            count = cursor['count']
+            if offset <= os.path.getsize(self.spool_file):
+                return (offset, count)
+        except:
+            pass
+
+        # the cursor file is missing or broken
+        return (0, self._count_lines(0))
+
+    def _write_file(self, file_path, data):
+        tmp_path = '%s.%d.tmp' % (file_path, os.getpid())
+        f = open(tmp_path, 'wb')
+        f.write(data)
+        f.close()
+        if cocos.os_is_win32() and os.path.exists(file_path):
+            os.remove(file_path)
+        os.rename(tmp_path, file_path)
+
+    def _save_cursor(self, offset, count):
+        if count <= 0:
+            # all the events are drained
+            for file_path in (self.spool_file, self.cursor_file):
+                if os.path.isfile(file_path):
+                    os.remove(file_path)
+            return
+
+        if offset >= EventSpool.COMPACT_SIZE:
+            # remove the drained part
+            f = open(self.spool_file, 'rb')
+            f.seek(offset)
+            data = f.read()
+            f.close()
+            self._write_file(self.spool_file, data)
+            offset = 0
+
+        self._write_file(self.cursor_file, json.dumps({ 'offset' : offset, 'count' : count }))
+
+    def append(self, events, max_events=None):
+        """
+        Appends the events. If there are more than `max_events` events, the oldest ones are dropped.
+        """
+        if len(events) == 0:
+            return
+
+        self.lock.acquire()
+        try:
+            offset, count = self._read_cursor()
+
+            f = open(self.spool_file, 'ab')
+            f.write(''.join([ json.dumps(e) + '\n' for e in events ]))
+            f.close()
+            count += len(events)
+
+            if max_events is not None and count > max_events:
+                # skip the oldest events
+                f = open(self.spool_file, 'rb')
+                f.seek(offset)
+                for i in range(count - max_events):
+                    f.readline()
+                offset = f.tell()
+                f.close()
+                count = max_events
+
+            self._save_cursor(offset, count)
+        finally:
+            self.lock.release()
+
+    def drain(self, max_count=None):
+        """
+        Returns at most `max_count` events from the cursor, and moves the cursor after them.
+        """
+        if not os.path.isfile(self.spool_file):
+            return []
+
+        self.lock.acquire()
+        try:
+            offset, count = self._read_cursor()
+            if max_count is None or max_count > count:
+                max_count = count
+
+            f = open(self.spool_file, 'rb')
+            f.seek(offset)
+            lines = []
+            for i in range(max_count):
+                line = f.readline()
+                if len(line) == 0:
+                    break
+                lines.append(line)
+            offset = f.tell()
+            f.close()
+
+            self._save_cursor(offset, count - len(lines))
+        finally:
+            self.lock.release()
+
+        events = []
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # the line is broken, skip it
+                continue
+
+        return events
+
+    def has_events(self):
+        return os.path.isfile(self.spool_file)
+
+outbox_spool = EventSpool(os.path.join(local_cfg_path, OUTBOX_FILE))
+ga_cache_spool = EventSpool(os.path.join(local_cfg_path, GA_CACHE_SPOOL_FILE))
+bi_cache_spool = EventSpool(os.path.join(local_cfg_path, BI_CACHE_SPOOL_FILE))
+
+def use_cache_dir(cache_dir):
+    """
+    Keeps the outbox, the cached events & the sender lock in another folder instead of ~/.cocos.
+    """
+    global local_cfg_path, local_cfg_file, local_cfg_bak_file, bi_cfg_file, sender_lock_file
+    global outbox_spool, ga_cache_spool, bi_cache_spool
+    local_cfg_path = cache_dir
+    local_cfg_file = os.path.join(cache_dir, GA_CACHE_EVENTS_FILE)
+    local_cfg_bak_file = os.path.join(cache_dir, GA_CACHE_EVENTS_BAK_FILE)
+    bi_cfg_file = os.path.join(cache_dir, BI_CACHE_EVENTS_FILE)
+    sender_lock_file = os.path.join(cache_dir, SENDER_LOCK_FILE)
+    outbox_spool = EventSpool(os.path.join(cache_dir, OUTBOX_FILE))
+    ga_cache_spool = EventSpool(os.path.join(cache_dir, GA_CACHE_SPOOL_FILE))
+    bi_cache_spool = EventSpool(os.path.join(cache_dir, BI_CACHE_SPOOL_FILE))
+
+def append_outbox_event(is_ga, event):
+    """
+    Appends an event to the outbox file. It's cheap, so the command is not blocked by the statistics.
+    """
+    outbox_spool.append([ { 'ga' if is_ga else 'bi' : event } ])
+
+def take_outbox_events():
+    """
+    Returns the next events in the outbox file as (ga_events, bi_events).
+    """
+    ga_events = []
+    bi_events = []
+    for record in outbox_spool.drain(OUTBOX_DRAIN_COUNT):
+        if 'ga' in record:
+            ga_events.append(record['ga'])
+        elif 'bi' in record:
+            bi_events.append(record['bi'])
+
+    return (ga_events, bi_events)
 
 def get_user_id():
     node = uuid.getnode()
@@ -216,7 +464,7 @@ def gen_bi_event(event, event_value):
 
     return ret
 
-def get_bi_params(events, event_value, multi_events=False, engine_versio=''):
+def get_bi_params(events, event_value, multi_events=False, engine_version=''):
     if cocos.os_is_win32():
         system_str = 'windows'
         ver_info = sys.getwindowsversion()
@@ -259,162 +507,59 @@ def get_bi_params(events, event_value, multi_events=False, engine_versio=''):
 
     return params
 
-def cache_event(event, is_ga=True, multi_events=False):
-    if is_ga:
-        cache_ga_event(event)
-    else:
-        cache_bi_event(event, multi_events)
-
-# BI cache events related methods
-def cache_bi_event(event, multi_events=False):
-    bi_file_in_use_lock.acquire()
+def take_legacy_cached_events(cfg_file):
+    """
+    Returns the events in the cache file of the old versions, and removes the file.
+    """
+    if not os.path.isfile(cfg_file):
+        return []
 
-    outFile = None
     try:
-        # get current cached events
-        cache_events = get_bi_cached_events(need_lock=False)
-
-        if multi_events:
-            need_cache_size = len(event)
-        else:
-            need_cache_size = 1
-
-        # delete the oldest events if there are too many events.
-        events_size = len(cache_events)
-        if events_size >= Statistic.MAX_CACHE_EVENTS:
-            start_idx = events_size - (Statistic.MAX_CACHE_EVENTS - need_cache_size)
-            cache_events = cache_events[start_idx:]
-
-        # cache the new event
-        if multi_events:
-            for e in event:
-                cache_events.append(e)
-        else:
-            cache_events.append(event)
-
-        # write file
-        outFile = open(bi_cfg_file, 'w')
-        json.dump(cache_events, outFile)
-        outFile.close()
+        f = open(cfg_file)
+        cached_events = json.load(f)
+        f.close()
+        os.remove(cfg_file)
     except:
-        if outFile is not None:
-            outFile.close()
-    finally:
-        bi_file_in_use_lock.release()
-
-def get_bi_cached_events(need_lock=True):
-    if not os.path.isfile(bi_cfg_file):
         cached_events = []
-    else:
-        f = None
-        try:
-            if need_lock:
-                bi_file_in_use_lock.acquire()
-
-            f = open(bi_cfg_file)
-            cached_events = json.load(f)
-            f.close()
-
-            if not isinstance(cached_events, list):
-                cached_events = []
-        except:
-            cached_events = []
-        finally:
-            if f is not None:
-                f.close()
 
-            if need_lock:
-                bi_file_in_use_lock.release()
+    if not isinstance(cached_events, list):
+        cached_events = []
 
     return cached_events
 
-# GA cache events related methods
-def get_ga_cached_events(is_bak=False, need_lock=True):
-    if is_bak:
-        cfg_file = local_cfg_bak_file
-        lock = bak_file_in_use_lock
-    else:
-        cfg_file = local_cfg_file
-        lock = file_in_use_lock
-
-    if not os.path.isfile(cfg_file):
-        cached_events = []
+def cache_bi_event(event, multi_events=False):
+    if multi_events:
+        events = event
     else:
-        f = None
-        try:
-            if need_lock:
-                lock.acquire()
-
-            f = open(cfg_file)
-            cached_events = json.load(f)
-            f.close()
-
-            if not isinstance(cached_events, list):
-                cached_events = []
-        except:
-            cached_events = []
-        finally:
-            if f is not None:
-                f.close()
-            if need_lock:
-                lock.release()
+        events = [ event ]
 
-    return cached_events
+    try:
+        bi_cache_spool.append(events, Statistic.MAX_CACHE_EVENTS)
+    except:
+        pass
 
 def cache_ga_event(event):
-    file_in_use_lock.acquire()
-
-    outFile = None
     try:
-        # get current cached events
-        cache_events = get_ga_cached_events(is_bak=False, need_lock=False)
-
-        # delete the oldest events if there are too many events.
-        events_size = len(cache_events)
-        if events_size >= Statistic.MAX_CACHE_EVENTS:
-            start_idx = events_size - (Statistic.MAX_CACHE_EVENTS - 1)
-            cache_events = cache_events[start_idx:]
-
-        # cache the new event
-        cache_events.append(event)
-
-        # write file
-        outFile = open(local_cfg_file, 'w')
-        json.dump(cache_events, outFile)
-        outFile.close()
+        ga_cache_spool.append([ event ], Statistic.MAX_CACHE_EVENTS)
     except:
-        if outFile is not None:
-            outFile.close()
-    finally:
-        file_in_use_lock.release()
-
-def pop_bak_ga_cached_event():
-    bak_file_in_use_lock.acquire()
-    events = get_ga_cached_events(is_bak=True, need_lock=False)
-
-    if len(events) > 0:
-        e = events[0]
-        events = events[1:]
-        outFile = None
-        try:
-            outFile = open(local_cfg_bak_file, 'w')
-            json.dump(events, outFile)
-            outFile.close()
-        except:
-            if outFile:
-                outFile.close()
-    else:
-        e = None
-
-    bak_file_in_use_lock.release()
-
-    return e
+        pass
 
-def do_send_ga_cached_event(engine_version):
-    e = pop_bak_ga_cached_event()
-    while(e is not None):
-        do_send(e, 0, is_ga=True, multi_events=False, engine_version=engine_version)
-        e = pop_bak_ga_cached_event()
+def take_ga_cached_events():
+    """
+    Returns all the GA cached events and removes them from the cache.
+    """
+    events = take_legacy_cached_events(local_cfg_bak_file)
+    events.extend(take_legacy_cached_events(local_cfg_file))
+    events.extend(ga_cache_spool.drain())
+    return events[-Statistic.MAX_CACHE_EVENTS:]
+
+def take_bi_cached_events():
+    """
+    Returns all the BI cached events and removes them from the cache.
+    """
+    events = take_legacy_cached_events(bi_cfg_file)
+    events.extend(bi_cache_spool.drain())
+    return events[-Statistic.MAX_CACHE_EVENTS:]
 
 def get_params_str(event, event_value, is_ga=True, multi_events=False, engine_version=''):
     if is_ga:
@@ -431,95 +576,161 @@ def get_params_str(event, event_value, is_ga=True, multi_events=False, engine_ve
 
     return params_str
 
-def do_http_request(event, event_value, is_ga=True, multi_events=False, engine_version=''):
-    ret = False
-    conn = None
-    try:
-        params_str = get_params_str(event, event_value, is_ga, multi_events, engine_version)
-        if is_ga:
-            host_url = GA_HOST
-            host_path = GA_PATH
-        else:
-            host_url = BI_HOST
-            host_path = BI_PATH
-
-        socket.setdefaulttimeout(TIMEOUT_VALUE)
+class EventSender(object):
+    """
+    Sends the events in batches. The connection of each host is kept alive for all the requests.
+    The events failed to send are cached, they are sent next time.
 
-        conn = httplib.HTTPConnection(host_url, timeout=TIMEOUT_VALUE)
-        conn.request(method="POST", url=host_path, body=params_str)
+    `ga_url` & `bi_url` are the base urls of the servers, a local server for testing for example.
+    """
+    def __init__(self, engine_version, ga_url=GA_URL, bi_url=BI_URL):
+        self.engine_version = engine_version
+        self.ga_url = ga_url
+        self.bi_url = bi_url
+        self.conns = {}
+
+    def _post(self, base_url, path, body):
+        parts = urlparse.urlsplit(base_url)
+        host = (parts.scheme, parts.netloc)
+        url = parts.path.rstrip('/') + path
+        # retry once with a new connection, the server may close a kept-alive connection
+        for i in range(2):
+            conn = self.conns.get(host)
+            if conn is None:
+                if parts.scheme == 'https':
+                    conn = httplib.HTTPSConnection(parts.netloc, timeout=TIMEOUT_VALUE)
+                else:
+                    conn = httplib.HTTPConnection(parts.netloc, timeout=TIMEOUT_VALUE)
+                self.conns[host] = conn
+
+            try:
+                conn.request(method="POST", url=url, body=body)
+                response = conn.getresponse()
+                # read the whole response, so the connection can be used again
+                response.read()
+                # status is 2xx mean the request is success.
+                return response.status >= 200 and response.status < 300
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                del self.conns[host]
+
+        return False
+
+    def send_ga_events(self, events, event_value):
+        for i in range(0, len(events), GA_MAX_BATCH_EVENTS):
+            batch = events[i:i + GA_MAX_BATCH_EVENTS]
+            try:
+                lines = [ get_params_str(e, event_value, True, False, self.engine_version) for e in batch ]
+                if len(batch) == 1:
+                    ret = self._post(self.ga_url, GA_PATH, lines[0])
+                else:
+                    ret = self._post(self.ga_url, GA_BATCH_PATH, '\n'.join(lines))
+            except Exception:
+                ret = False
+
+            if not ret:
+                for e in batch:
+                    cache_ga_event(e)
+
+    def send_bi_events(self, events, event_value):
+        if len(events) == 0:
+            return
 
-        response = conn.getresponse()
-        res = response.status
-        if res >= 200 and res < 300:
-            # status is 2xx mean the request is success.
-            ret = True
-        else:
+        try:
+            body = get_params_str(events, event_value, False, True, self.engine_version)
+            ret = self._post(self.bi_url, BI_PATH, body)
+        except Exception:
             ret = False
-    except:
-        pass
-    finally:
-        if conn:
-            conn.close()
 
-    return ret
+        if not ret:
+            cache_bi_event(events, multi_events=True)
 
-def do_send(event, event_value, is_ga=True, multi_events=False, engine_version=''):
+    def send_cached_events(self):
+        if GA_ENABLED:
+            events = take_ga_cached_events()
+            self.send_ga_events(events, 0)
+
+        if BI_ENABLED:
+            events = take_bi_cached_events()
+            self.send_bi_events(events, 0)
+
+    def close(self):
+        for host in self.conns:
+            self.conns[host].close()
+        self.conns = {}
+
+def run_sender(engine_version, ga_url=GA_URL, bi_url=BI_URL):
+    """
+    Sends the events in the outbox & the cached events.
+    Only one sender runs at the same time, the others exit at once.
+    """
+    lock = FileLock(sender_lock_file)
+    if not lock.acquire(blocking=False):
+        return
+
+    sender = EventSender(engine_version, ga_url, bi_url)
     try:
-        ret = do_http_request(event, event_value, is_ga, multi_events, engine_version)
-        if not ret:
-            # request failed, cache the event
-            cache_event(event, is_ga, multi_events)
-    except:
-        pass
+        sender.send_cached_events()
+
+        # the events may be added while sending
+        while True:
+            ga_events, bi_events = take_outbox_events()
+            if len(ga_events) == 0 and len(bi_events) == 0:
+                break
+
+            if GA_ENABLED:
+                sender.send_ga_events(ga_events, 1)
+            if BI_ENABLED:
+                sender.send_bi_events(bi_events, 1)
+    finally:
+        sender.close()
+        lock.release()
+
+def start_sender(engine_version):
+    """
+    Starts a detached sender process, the command doesn't wait for it.
+    """
+    if getattr(sys, 'frozen', None):
+        # can't run this script by the frozen executable, send the events in this process
+        run_sender(engine_version)
+        return
+
+    script_path = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+    args = [ sys.executable, script_path, SENDER_ARG, engine_version ]
+    devnull = open(os.devnull, 'r+')
+    kwargs = {
+        'stdin': devnull,
+        'stdout': devnull,
+        'stderr': devnull,
+        'cwd': os.path.dirname(script_path)
+    }
+    if cocos.os_is_win32():
+        DETACHED_PROCESS = 0x00000008
+        CREATE_NEW_PROCESS_GROUP = 0x00000200
+        kwargs['creationflags'] = DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['close_fds'] = True
+        # a new session, so the sender is not killed with the command by Ctrl-C
+        kwargs['preexec_fn'] = os.setsid
+
+    try:
+        subprocess.Popen(args, **kwargs)
+    finally:
+        devnull.close()
 
 class Statistic(object):
 
     MAX_CACHE_EVENTS = 50
-    MAX_CACHE_PROC = 5
 
     def __init__(self, engine_version):
-        self.process_pool = []
         self.engine_version = engine_version
-        if cocos.os_is_win32():
-            multiprocessing.freeze_support()
+        self.need_send = False
 
     def send_cached_events(self):
-        try:
-            # send GA cached events
-            if GA_ENABLED:
-                events = get_ga_cached_events()
-                event_size = len(events)
-                if event_size == 0:
-                    return
-
-                # rename the file
-                if os.path.isfile(local_cfg_bak_file):
-                    os.remove(local_cfg_bak_file)
-                os.rename(local_cfg_file, local_cfg_bak_file)
-
-                # create processes to handle the events
-                proc_num = min(event_size, Statistic.MAX_CACHE_PROC)
-                for i in range(proc_num):
-                    p = multiprocessing.Process(target=do_send_ga_cached_event, args=(self.engine_version,))
-                    p.start()
-                    self.process_pool.append(p)
-
-            # send BI cached events
-            if BI_ENABLED:
-                events = get_bi_cached_events()
-                event_size = len(events)
-                if event_size == 0:
-                    return
-
-                # remove the cached events file
-                if os.path.isfile(bi_cfg_file):
-                    os.remove(bi_cfg_file)
-
-                p = multiprocessing.Process(target=do_send, args=(events, 0, False, True, self.engine_version,))
-                p.start()
-                self.process_pool.append(p)
-        except:
-            pass
+        # the cached events are sent by the sender process
+        if (GA_ENABLED and (ga_cache_spool.has_events() or os.path.isfile(local_cfg_file))) or \
+           (BI_ENABLED and (bi_cache_spool.has_events() or os.path.isfile(bi_cfg_file))):
+            self.need_send = True
 
     def send_event(self, category, action, label):
         try:
@@ -527,34 +738,114 @@ class Statistic(object):
 
             # send event to GA
             if GA_ENABLED:
-                p = multiprocessing.Process(target=do_send, args=(event, 1, True, False, self.engine_version,))
-                p.start()
-                self.process_pool.append(p)
+                append_outbox_event(True, event)
+                self.need_send = True
 
             # send event to BI
             if BI_ENABLED:
                 # add timestamp
-                event.append(get_time_stamp())
-                p = multiprocessing.Process(target=do_send, args=(event, 1, False, False, self.engine_version,))
-                p.start()
-                self.process_pool.append(p)
+                append_outbox_event(False, event + [ get_time_stamp() ])
+                self.need_send = True
         except:
             pass
 
     def terminate_stat(self):
-        # terminate sub-processes
-        if len(self.process_pool) > 0:
-            alive_count = 0
-            for p in self.process_pool:
-                if p.is_alive():
-                    alive_count += 1
-
-            if alive_count > 0:
-                time.sleep(1)
-                for p in self.process_pool:
-                    if p.is_alive():
-                        p.terminate()
-
-        # remove the backup file
-        if os.path.isfile(local_cfg_bak_file):
-            os.remove(local_cfg_bak_file)
+        # the events are sent in background, the command exits at once
+        if self.need_send:
+            self.need_send = False
+            try:
+                start_sender(self.engine_version)
+            except:
+                pass
+
+def self_test():
+    """
+    Spools events, and sends them by run_sender to a stand-in server on 127.0.0.1.
+    Checks the batches received, the caching of the events when the server fails,
+    and the sending of the cached events. The files are kept in a temp folder.
+    """
+    import tempfile
+    import shutil
+    import threading
+    import BaseHTTPServer
+
+    class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.getheader('Content-Length', '0')))
+            self.server.requests.append((self.path, body, self.client_address))
+            self.send_response(self.server.status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    def take_events():
+        events = []
+        for (path, body, client_address) in server.requests:
+            for line in body.split('\n'):
+                params = urlparse.parse_qs(line)
+                events.append((path, params[Fields.EVENT_LABEL][0], params[Fields.EVENT_VALUE][0]))
+        client_ports = set([ client_address[1] for (path, body, client_address) in server.requests ])
+        del server.requests[:]
+        return (events, client_ports)
+
+    def check(condition, message):
+        if not condition:
+            raise Exception('stat self test failed: ' + message)
+
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.requests = []
+    server.status = 200
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    ga_url = 'http://127.0.0.1:%d/ga' % server.server_address[1]
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        use_cache_dir(cache_dir)
+
+        # 45 events are sent in 3 batches through one connection
+        for i in range(45):
+            append_outbox_event(True, [ 'cocos', 'self_test', '%d' % i ])
+        run_sender('self-test', ga_url=ga_url)
+        events, client_ports = take_events()
+        check([ e[1] for e in events ] == [ '%d' % i for i in range(45) ], 'the events are lost or reordered')
+        check(set([ e[0] for e in events ]) == set([ '/ga' + GA_BATCH_PATH ]), 'the events are not batched')
+        check(len(client_ports) == 1, 'the connection is not kept alive')
+        check(not outbox_spool.has_events(), 'the outbox is not drained')
+
+        # the events failed to send are cached
+        server.status = 500
+        for i in range(3):
+            append_outbox_event(True, [ 'cocos', 'self_test', 'cached%d' % i ])
+        run_sender('self-test', ga_url=ga_url)
+        take_events()
+        check(ga_cache_spool.has_events(), 'the failed events are not cached')
+
+        # and sent by the next sender, with the value of the cached events
+        server.status = 200
+        run_sender('self-test', ga_url=ga_url)
+        events, client_ports = take_events()
+        check([ (e[1], e[2]) for e in events ] == [ ('cached%d' % i, '0') for i in range(3) ],
+              'the cached events are not sent')
+        check(not ga_cache_spool.has_events(), 'the cache is not drained')
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(cache_dir)
+
+    print('stat sender self test passed')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == SENDER_ARG:
+        try:
+            run_sender(sys.argv[2])
+        except:
+            pass
+    elif len(sys.argv) > 1 and sys.argv[1] == SELF_TEST_ARG:
+        self_test()
@@ -0,0 +1,312 @@
+#!/usr/bin/python
+# ----------------------------------------------------------------------------
+# cocos_watch: watches the source folders for "--watch"
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+'''
+Watches the source folders of a command run with "--watch", and calls back
+with the changed files when a burst of changes is finished.
+
+The folders are watched by inotify on linux, and polled on the other systems.
+'''
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import traceback
+
+import cocos
+from MultiLanguage import MultiLanguage
+
+# seconds without any change which finish a burst of changes
+DEBOUNCE_TIME = 0.3
+
+# the callback is called at most this seconds after the first change, even if the files keep changing
+MAX_DELAY = 3
+
+# seconds between two scans of the folders if inotify is not available
+POLL_INTERVAL = 1
+
+# the temporary files of the editors
+_IGNORED_SUFFIXES = ( '~', '.swp', '.swx', '.tmp' )
+
+# inotify(7)
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0x800
+_IN_CLOEXEC = 0x80000
+
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | \
+              _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_inotify():
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1.argtypes = [ ctypes.c_int ]
+        libc.inotify_add_watch.argtypes = [ ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32 ]
+        return libc
+    except (ImportError, OSError, AttributeError):
+        return None
+
+
+class FileWatcher(object):
+    """
+    `folders` are (folder, recursive) pairs. Only the files with `extensions` are reported
+    if it's specified. The files in the `excluded` folders & the hidden files are ignored.
+    """
+
+    def __init__(self, folders, extensions=None, excluded=None):
+        self._folders = [ (os.path.abspath(folder), recursive) for (folder, recursive) in folders ]
+        self._extensions = extensions
+        self._excluded = [ os.path.join(os.path.abspath(path), '') for path in (excluded or []) ]
+        self._inotify_fd = None
+        # watch descriptor -> (folder, recursive)
+        self._watches = {}
+        self._snapshot = None
+        self._warned = False
+
+        libc = _load_inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd >= 0:
+                self._libc = libc
+                self._inotify_fd = fd
+                for (folder, recursive) in self._folders:
+                    self._add_watches(folder, recursive)
+
+        if self._inotify_fd is None:
+            self._snapshot = self._scan()
+
+    def is_polling(self):
+        return self._inotify_fd is None
+
+    def close(self):
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def _is_excluded(self, path):
+        name = os.path.basename(path)
+        if name.startswith('.') or name.endswith(_IGNORED_SUFFIXES):
+            return True
+
+        path = os.path.join(path, '')
+        for excluded in self._excluded:
+            if path.startswith(excluded):
+                return True
+
+        return False
+
+    def _is_watched_file(self, path):
+        if self._is_excluded(path):
+            return False
+
+        if self._extensions is not None and os.path.splitext(path)[1] not in self._extensions:
+            return False
+
+        return True
+
+    def _walk(self, folder, recursive):
+        """
+        Yields the folders & the files in the folder, except the excluded ones.
+        """
+        yield (folder, True)
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return
+
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.isdir(path):
+                if recursive and not self._is_excluded(path):
+                    for item in self._walk(path, recursive):
+                        yield item
+            elif self._is_watched_file(path):
+                yield (path, False)
+
+    def _add_watches(self, folder, recursive):
+        """
+        Watches the folder, returns the files in it.
+        """
+        files = []
+        for (path, is_dir) in self._walk(folder, recursive):
+            if not is_dir:
+                files.append(path)
+                continue
+
+            if isinstance(path, unicode):
+                path = path.encode(sys.getfilesystemencoding())
+            wd = self._libc.inotify_add_watch(self._inotify_fd, path, _WATCH_MASK)
+            if wd >= 0:
+                self._watches[wd] = (path, recursive)
+            elif not self._warned:
+                # the max count of the watches is reached for example (fs.inotify.max_user_watches)
+                import ctypes
+                cocos.Logging.warning(MultiLanguage.get_string('COCOS_WARNING_WATCH_FAILED_FMT',
+                                                               (path, os.strerror(ctypes.get_errno()))))
+                self._warned = True
+
+        return files
+
+    def _read_events(self, timeout):
+        """
+        Returns the changed files, an empty set if nothing is changed in `timeout` seconds.
+        """
+        deadline = time.time() + timeout
+        changed = set()
+        # the events of the ignored files don't count
+        while len(changed) == 0:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                readable = select.select([ self._inotify_fd ], [], [], remaining)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if len(readable) > 0:
+                self._parse_events(os.read(self._inotify_fd, 65536), changed)
+
+        return changed
+
+    def _parse_events(self, data, changed):
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip('\0')
+            offset += name_len
+
+            if mask & _IN_Q_OVERFLOW:
+                # some events are lost, rebuild all
+                changed.update([ folder for (folder, recursive) in self._folders ])
+                continue
+
+            watch = self._watches.get(wd)
+            if watch is None:
+                continue
+            if mask & _IN_IGNORED:
+                # the folder is removed
+                del self._watches[wd]
+                continue
+            if len(name) == 0:
+                continue
+
+            folder, recursive = watch
+            path = os.path.join(folder, name)
+            if mask & _IN_ISDIR:
+                if recursive and (mask & (_IN_CREATE | _IN_MOVED_TO)) and not self._is_excluded(path):
+                    # the files in the new folder are changed too
+                    changed.update(self._add_watches(path, recursive))
+                elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                    changed.add(path)
+            elif self._is_watched_file(path):
+                changed.add(path)
+
+    def _scan(self):
+        snapshot = {}
+        for (folder, recursive) in self._folders:
+            for (path, is_dir) in self._walk(folder, recursive):
+                if is_dir:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime)
+
+        return snapshot
+
+    def _poll(self, timeout):
+        time.sleep(timeout)
+        snapshot = self._scan()
+        changed = set()
+        for path, state in snapshot.items():
+            if self._snapshot.get(path) != state:
+                changed.add(path)
+        for path in self._snapshot:
+            if path not in snapshot:
+                changed.add(path)
+        self._snapshot = snapshot
+
+        return changed
+
+    def _get_changes(self, timeout):
+        if self._inotify_fd is not None:
+            return self._read_events(timeout)
+        else:
+            return self._poll(timeout)
+
+    def wait_changes(self):
+        """
+        Blocks until some files are changed, and the changes are finished. Returns the changed files.
+        """
+        changed = set()
+        while len(changed) == 0:
+            changed = self._get_changes(POLL_INTERVAL)
+
+        # wait until nothing is changed in DEBOUNCE_TIME, a "git checkout" changes many files for example
+        start_time = time.time()
+        while time.time() - start_time < MAX_DELAY:
+            more = self._get_changes(DEBOUNCE_TIME if self._inotify_fd is not None else POLL_INTERVAL)
+            if len(more) == 0:
+                break
+            changed.update(more)
+
+        return changed
+
+
+def watch(folders, callback, extensions=None, excluded=None):
+    """
+    Calls `callback` with the changed files after each burst of changes, until Ctrl-C is pressed.
+    The errors of the callback are shown, and the folders are still watched.
+    """
+    watcher = FileWatcher(folders, extensions, excluded)
+    try:
+        mode = 'polling' if watcher.is_polling() else 'inotify'
+        cocos.Logging.info(MultiLanguage.get_string('COCOS_INFO_WATCHING_FMT',
+                                                    (', '.join([ folder for (folder, recursive) in folders ]), mode)))
+        while True:
+            changed = watcher.wait_changes()
+            cocos.Logging.info(MultiLanguage.get_string('COCOS_INFO_WATCH_CHANGED_FMT', len(changed)))
+            for path in sorted(changed)[:10]:
+                cocos.Logging.info('    %s' % path)
+
+            try:
+                callback(changed)
+            except cocos.CCPluginError as e:
+                cocos.Logging.error(str(e))
+            except KeyboardInterrupt:
+                raise
+            except Exception:
+                # a file removed while building, or a half saved project.json for example,
+                # the next change may fix it
+                cocos.Logging.error(traceback.format_exc())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
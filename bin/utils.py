@@ -6,6 +6,8 @@ import sys
 import shutil
 import cocos
 import re
+import json
+import hashlib
 
 VS_VERSION_MAP = {
     2012 : "11.0",
@@ -236,3 +238,140 @@ def get_engine_version(engine_path):
         pass
 
     return ret
+
+def get_file_md5(file_path):
+    md5 = hashlib.md5()
+    f = open(file_path, "rb")
+    try:
+        for chunk in iter(lambda: f.read(65536), b''):
+            md5.update(chunk)
+    finally:
+        f.close()
+    return md5.hexdigest()
+
+class BuildManifest(object):
+    """
+    Records the state (path, size, mtime & md5) of the source files of a build,
+    so the files not changed since last build can be skipped.
+
+    The recorded states are dropped if the parameters of the build are changed,
+    but the recorded files are still used to find the removed ones.
+    """
+    VERSION = 1
+
+    def __init__(self, manifest_path, params, rebuild=False):
+        self.manifest_path = manifest_path
+        self.params = params
+        self.old_entries = {}
+        self.old_data = {}
+        # the files of last build, even if their states are dropped
+        self.old_files = {}
+        self.entries = {}
+        self.data = {}
+        self._pending = {}
+
+        self._load(rebuild)
+
+    def _load(self, rebuild):
+        if not os.path.isfile(self.manifest_path):
+            return
+
+        try:
+            f = open(self.manifest_path)
+            manifest = json.load(f)
+            f.close()
+        except Exception:
+            return
+
+        if manifest.get("version") != BuildManifest.VERSION:
+            return
+
+        self.old_files = manifest.get("files", {})
+        if rebuild or manifest.get("params") != self.params:
+            return
+
+        self.old_entries = manifest.get("files", {})
+        self.old_data = manifest.get("data", {})
+
+    def check(self, key, src_file, output_files=None):
+        """
+        Returns True if the source file is not changed since last build and the output files exist.
+        The md5 is only computed when the size or modification time is changed.
+        """
+        src_stat = os.stat(src_file)
+        info = {
+            "src": src_file,
+            "size": src_stat.st_size,
+            "mtime": src_stat.st_mtime
+        }
+
+        entry = self.old_entries.get(key)
+        up_to_date = False
+        if entry is not None and entry.get("src") == src_file and entry.get("size") == info["size"]:
+            up_to_date = True
+            if output_files is not None:
+                for output_file in output_files:
+                    if not os.path.isfile(output_file):
+                        up_to_date = False
+                        break
+
+            if up_to_date:
+                if entry.get("mtime") == info["mtime"]:
+                    info["hash"] = entry.get("hash")
+                else:
+                    info["hash"] = get_file_md5(src_file)
+                    up_to_date = (info["hash"] == entry.get("hash"))
+
+        if up_to_date:
+            self.entries[key] = info
+        else:
+            self._pending[key] = info
+
+        return up_to_date
+
+    def update(self, key):
+        """
+        Records the state of the file checked by `check()`, after it's processed successfully.
+        The file is not recorded if it's changed while it's processed, so it's processed again next build.
+        """
+        info = self._pending.pop(key)
+        if "hash" not in info:
+            info["hash"] = get_file_md5(info["src"])
+
+        try:
+            src_stat = os.stat(info["src"])
+        except OSError:
+            return
+        if src_stat.st_size == info["size"] and src_stat.st_mtime == info["mtime"]:
+            self.entries[key] = info
+
+    def removed_entries(self):
+        """
+        Returns the keys recorded in last build whose source files are removed.
+        """
+        ret = []
+        for key in self.old_files:
+            if key in self.entries or key in self._pending:
+                continue
+
+            if not os.path.exists(self.old_files[key].get("src", "")):
+                ret.append(key)
+
+        return ret
+
+    def save(self):
+        manifest = {
+            "version": BuildManifest.VERSION,
+            "params": self.params,
+            "files": self.entries,
+            "data": self.data
+        }
+
+        # write to a temp file first, so an interrupted build won't leave a broken manifest
+        tmp_path = self.manifest_path + ".tmp"
+        f = open(tmp_path, "w")
+        json.dump(manifest, f, sort_keys=True, indent=1)
+        f.close()
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        os.rename(tmp_path, self.manifest_path)
@@ -628,24 +628,27 @@ class AndroidBuilder(object):
         app_android_root = self.app_android_root
         res_files = self.res_files
 
-        # remove app_android_root/assets if it exists
-        if os.path.isdir(assets_dir):
-            shutil.rmtree(assets_dir)
-
         # generate parameters for custom steps
         target_platform = cocos_project.Platforms.ANDROID
         cur_custom_step_args = custom_step_args.copy()
         cur_custom_step_args["assets-dir"] = assets_dir
 
+        # remove app_android_root/assets if it's not synchronized by cocos before
+        if os.path.isdir(assets_dir) and not cocos.FileSyncer.has_manifest(assets_dir):
+            shutil.rmtree(assets_dir)
+
         # make dir
-        os.mkdir(assets_dir)
+        if not os.path.isdir(assets_dir):
+            os.makedirs(assets_dir)
  
         # invoke custom step : pre copy assets
         self._project.invoke_custom_step_script(cocos_project.Project.CUSTOM_STEP_PRE_COPY_ASSETS, target_platform, cur_custom_step_args)
 
-        # copy resources
+        # copy resources, only the changed files are copied
+        syncer = cocos.FileSyncer(assets_dir)
         for cfg in res_files:
-            cocos.copy_files_with_config(cfg, app_android_root, assets_dir)
+            cocos.copy_files_with_config(cfg, app_android_root, assets_dir, syncer)
+        syncer.finish()
 
         # invoke custom step : post copy assets
         self._project.invoke_custom_step_script(cocos_project.Project.CUSTOM_STEP_POST_COPY_ASSETS, target_platform, cur_custom_step_args)
@@ -6,6 +6,9 @@ from MultiLanguage import MultiLanguage
 import sys
 import subprocess
 
+from bundler import JsBundler
+from publisher import WebPublisher
+
 
 JDK_1_7 = "1.7"
 JDK_1_6 = "1.6"
@@ -33,6 +36,156 @@ def check_jdk_version():
 
     return jdk_version
 
+class ModuleGraph(object):
+    """
+    The modules in moduleConfig.json of the engine. A module is a list of js files & other modules,
+    the modules are expanded before the files which are listed after them.
+
+    The graph is loaded once for each moduleConfig.json, and loaded again if the file is modified.
+    """
+
+    CONFIG_FILE = "moduleConfig.json"
+
+    # (engine dir, mtime of moduleConfig.json) -> ModuleGraph
+    _cache = {}
+
+    @staticmethod
+    def get(engine_dir):
+        config_path = os.path.join(engine_dir, ModuleGraph.CONFIG_FILE)
+        key = (os.path.normcase(os.path.realpath(engine_dir)), os.path.getmtime(config_path))
+        graph = ModuleGraph._cache.get(key)
+        if graph is None:
+            # the graph of an old moduleConfig.json is useless
+            for old_key in ModuleGraph._cache.keys():
+                if old_key[0] == key[0]:
+                    del ModuleGraph._cache[old_key]
+            graph = ModuleGraph(config_path)
+            ModuleGraph._cache[key] = graph
+
+        return graph
+
+    def __init__(self, config_path):
+        self._config_path = config_path
+        f = open(config_path)
+        try:
+            module_cfg = json.load(f)
+        finally:
+            f.close()
+
+        self.boot_file = module_cfg["bootFile"]
+
+        # module name -> [ (is module, name of the module or the js file) ]
+        self._modules = {}
+        for name, items in module_cfg["module"].items():
+            deps = []
+            for item in items:
+                ext = os.path.splitext(item)[1]
+                if ext == "":
+                    deps.append((True, item))
+                elif ext == ".js":
+                    deps.append((False, item))
+            self._modules[name] = deps
+
+        # module name -> the js files of the module & the modules it depends on
+        self._expanded = {}
+
+    def _expand(self, name, visited, js_list):
+        if name in visited:
+            return
+        visited.add(name)
+
+        deps = self._modules.get(name)
+        if deps is None:
+            raise cocos.CCPluginError(MultiLanguage.get_string('COMPILE_ERROR_WEB_MODULE_NOT_FOUND_FMT',
+                                                               (name, self._config_path)),
+                                      cocos.CCPluginError.ERROR_WRONG_CONFIG)
+
+        for is_module, item in deps:
+            if is_module:
+                self._expand(item, visited, js_list)
+            elif item not in visited:
+                visited.add(item)
+                js_list.append(item)
+
+    def get_module_files(self, name):
+        files = self._expanded.get(name)
+        if files is None:
+            files = []
+            self._expand(name, set(), files)
+            self._expanded[name] = files
+
+        return files
+
+    def resolve(self, modules):
+        """
+        Returns the js files of the modules in the loading order, each file is listed once.
+        """
+        added = set([ self.boot_file ])
+        js_list = [ self.boot_file ]
+        for name in modules:
+            for item in self.get_module_files(name):
+                if item not in added:
+                    added.add(item)
+                    js_list.append(item)
+
+        return js_list
+
+
+def get_js_lists(engine_dir, project_json):
+    """
+    Returns the js files of the engine modules (relative to the engine dir)
+    and the js files of the project (relative to the project dir), in the loading order.
+    """
+    modules = list(project_json.get("modules", ["core"]))
+    renderMode = project_json.get("renderMode", 0)
+    mainJs = project_json.get("main", "main.js")
+    userJsList = list(project_json.get("jsList", []))
+
+    if renderMode != 1 and "base4webgl" not in modules:
+        modules[0:0] = ["base4webgl"]
+
+    ccJsList = ModuleGraph.get(engine_dir).resolve(modules)
+
+    userJsList.append(mainJs)
+
+    return (ccJsList, userJsList)
+
+
+def get_js_files(project_dir, project_json):
+    """
+    Returns the absolute paths of all the js files to compile, in the loading order.
+    """
+    engine_dir = os.path.normpath(os.path.join(project_dir, project_json["engineDir"]))
+    ccJsList, userJsList = get_js_lists(engine_dir, project_json)
+
+    files = []
+    for base_dir, js_list in ((engine_dir, ccJsList), (project_dir, userJsList)):
+        for item in js_list:
+            path = os.path.normpath(os.path.join(base_dir, item))
+            if not os.path.isfile(path):
+                raise cocos.CCPluginError(MultiLanguage.get_string('COMPILE_ERROR_FILE_NOT_FOUND_FMT', path),
+                                          cocos.CCPluginError.ERROR_PATH_NOT_FOUND)
+            files.append(path)
+
+    return files
+
+
+def bundle_js(js_files, output_dir, build_opts):
+    """
+    Bundles the js files by the python bundler instead of the closure compiler.
+    The source map is generated with the paths relative to the output dir.
+    """
+    files = [ (path, os.path.relpath(path, output_dir).replace('\\', '/')) for path in js_files ]
+
+    source_map_path = None
+    if build_opts.get("sourceMapOpened"):
+        source_map_path = os.path.join(output_dir, "sourcemap")
+
+    output_path = os.path.join(output_dir, build_opts["outputFileName"])
+    cocos.Logging.info(MultiLanguage.get_string('COMPILE_INFO_WEB_BUNDLE_FMT', (len(files), output_path)))
+    JsBundler(files, output_path, source_map_path).bundle()
+
+
 def gen_buildxml(project_dir, project_json, output_dir, build_opts):
     # get engine dir (not real)
     engineDir = project_json["engineDir"]
@@ -53,28 +206,7 @@ def gen_buildxml(project_dir, project_json, output_dir, build_opts):
         download_cmd_path = os.path.join(tools_dir, os.pardir, os.pardir, os.pardir)
         subprocess.call("python %s -f" % (os.path.join(download_cmd_path, "download-bin.py")), shell=True, cwd=download_cmd_path)
 
-    try:
-        f = open(os.path.join(engine_dir, "moduleConfig.json"))
-        module_cfg = json.load(f)
-    finally:
-        f.close()
-
-    ccModuleMap = module_cfg["module"]
-    modules = project_json.get("modules", ["core"])
-    renderMode = project_json.get("renderMode", 0)
-    mainJs = project_json.get("main", "main.js")
-    ccJsList = [module_cfg["bootFile"]]
-    userJsList = project_json.get("jsList", [])
-
-    if renderMode != 1 and "base4webgl" not in modules:
-        modules[0:0] = ["base4webgl"]
-
-    for item in modules:
-        arr = _getJsListOfModule(ccModuleMap, item)
-        if arr != None:
-            ccJsList += arr
-
-    userJsList.append(mainJs)
+    ccJsList, userJsList = get_js_lists(engine_dir, project_json)
 
     buildXmlTempFile = open(os.path.join(tools_dir, "template", "build.xml"))
 
@@ -108,38 +240,5 @@ def gen_buildxml(project_dir, project_json, output_dir, build_opts):
     buildXmlOutputFile.close()
 
 
-_jsAddedCache = {}
-
-def _getJsListOfModule(moduleMap, moduleName):
-    if _jsAddedCache.get(moduleName) != None:
-        return None
-    _jsAddedCache[moduleName] = True
-    jsList = []
-    tempList = moduleMap[moduleName]
-
-    for item in tempList:
-        if _jsAddedCache.get(item):
-            continue
-        extname = os.path.splitext(item)[1]
-
-        if extname == None or extname == "":
-            arr = _getJsListOfModule(moduleMap, item)
-            if arr != None:
-                jsList += arr
-        elif extname == ".js":
-            jsList.append(item)
-
-        _jsAddedCache[item] = True
-
-    return jsList
-
-
 def _getFileArrStr(jsList):
-    str = ""
-
-    index = 0
-    for item in jsList:
-        str += '                <file name="' + item + '"/>\r\n'
-
-    return str
-
+    return ''.join([ '                <file name="%s"/>\r\n' % item for item in jsList ])
@@ -0,0 +1,482 @@
+#!/usr/bin/python
+# ----------------------------------------------------------------------------
+# bundler: concatenates & minifies the js files of a web project
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+'''
+Bundles the js files of a web project without the closure compiler.
+
+The files are read line by line, the comments & the useless white spaces are removed,
+and the lines are written to the output file one by one. The line breaks are kept,
+so the automatic semicolon insertion of javascript works as in the source files.
+A source map (version 3) which maps each output line to its source line is generated too.
+
+The files should be ECMAScript 5, the same as the closure compiler is configured in template/build.xml.
+
+    python plugins/plugin_compile/build_web/bundler.py
+
+checks the minifier with the cases where a '/' is easy to take for the wrong token.
+'''
+
+import os
+import sys
+import json
+
+if __name__ == '__main__':
+    # run as a script for the self test, see self_test()
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'bin'))
+
+import cocos
+from MultiLanguage import MultiLanguage
+
+# the keywords which can be followed by a regular expression literal
+_REGEX_KEYWORDS = frozenset([ 'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete',
+                              'void', 'throw', 'case', 'do', 'else', 'yield' ])
+
+# the punctuators after which a '/' starts a regular expression literal,
+# except '++', '--' & the '}' of an object literal, after which it's a division
+_REGEX_PUNCTUATORS = frozenset('(,=:[!&|?{};~+-*%<>^}')
+
+# the keywords after which a '{' starts a block instead of an object literal
+_BLOCK_KEYWORDS = frozenset([ 'do', 'else' ])
+
+# the value in the stack of the braces for the '${' of a template literal
+_TEMPLATE_BRACE = 'template'
+
+# a new file starting with these characters may be joined to the last statement of the previous file
+_UNSAFE_START_CHARS = frozenset('([+-/`')
+
+_BASE64_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+
+def _is_word_char(c):
+    return c.isalnum() or c in '_$\\' or ord(c) >= 0x80
+
+
+def _encode_vlq(value):
+    vlq = (-value << 1) | 1 if value < 0 else value << 1
+    encoded = ''
+    while True:
+        digit = vlq & 0x1F
+        vlq >>= 5
+        if vlq > 0:
+            digit |= 0x20
+        encoded += _BASE64_CHARS[digit]
+        if vlq == 0:
+            return encoded
+
+
+class JsMinifier(object):
+    """
+    Removes the comments & the white spaces of a js file, one line after another.
+    The state of the comments, strings & regular expressions is kept between the lines.
+    """
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._in_comment = False
+        # the quote of the string which is continued on the next line
+        self._in_string = None
+        # the last token which isn't a white space, decides whether '/' starts a regular expression
+        self._last_char = ''
+        self._last_word = ''
+        # the last token ends an expression though it's a punctuator: '++', '--' or the '}' of an object
+        self._division_next = False
+        # whether each of the open braces starts an object literal, or a block, or is the '${' of a template
+        self._braces = []
+        # whether the text of a template literal is continued on the next line
+        self._in_template = False
+
+    def _error(self, token, line_no):
+        raise cocos.CCPluginError(MultiLanguage.get_string('COMPILE_ERROR_WEB_JS_SYNTAX_FMT',
+                                                           (token, self._file_path, line_no)),
+                                  cocos.CCPluginError.ERROR_BUILD_FAILED)
+
+    def is_in_template(self):
+        """
+        Whether the next line starts in the text of a template literal,
+        so it's kept as it is even if it's empty.
+        """
+        return self._in_template
+
+    def _regex_allowed(self):
+        if self._last_char == '':
+            return True
+        if self._division_next:
+            return False
+        if _is_word_char(self._last_char):
+            return self._last_word in _REGEX_KEYWORDS
+        return self._last_char in _REGEX_PUNCTUATORS
+
+    def _is_object_start(self):
+        # whether a '{' after the last token starts an object literal
+        if self._last_char == '' or self._division_next:
+            return False
+        if _is_word_char(self._last_char):
+            return self._last_word in _REGEX_KEYWORDS and self._last_word not in _BLOCK_KEYWORDS
+        if self._last_char == ':':
+            # a property of an object, or a label or a case of a block
+            return len(self._braces) > 0 and self._braces[-1]
+        return self._last_char in _REGEX_PUNCTUATORS and self._last_char not in '{};'
+
+    def _append_space(self, out, next_char):
+        # a space is kept only if the tokens around it would be joined
+        if len(out) == 0:
+            return
+        prev = out[-1][-1]
+        if (_is_word_char(prev) and _is_word_char(next_char)) or \
+           (prev == next_char and prev in '+-/') or \
+           (prev.isdigit() and next_char == '.'):
+            out.append(' ')
+
+    def minify_line(self, line, line_no):
+        """
+        Returns (column of the first token in the source line, minified line).
+        The minified line is empty if there is nothing but comments & spaces in the line.
+        """
+        out = []
+        first_col = None
+        space = False
+        i = 0
+        n = len(line)
+
+        while i < n:
+            if self._in_comment:
+                end = line.find('*/', i)
+                if end < 0:
+                    return (first_col, ''.join(out))
+                self._in_comment = False
+                space = True
+                i = end + 2
+                continue
+
+            if self._in_template:
+                # the text of a template literal is copied as it is, till the end or a '${'
+                start = i
+                if first_col is None:
+                    first_col = i
+                while i < n:
+                    c = line[i]
+                    if c == '\\':
+                        i += 2
+                    elif c == '`':
+                        i += 1
+                        self._in_template = False
+                        self._last_char = c
+                        break
+                    elif c == '$' and i + 1 < n and line[i + 1] == '{':
+                        i += 2
+                        self._in_template = False
+                        self._braces.append(_TEMPLATE_BRACE)
+                        # an expression starts, as after a '('
+                        self._last_char = '('
+                        break
+                    else:
+                        i += 1
+                out.append(line[start:min(i, n)])
+                if self._in_template:
+                    # the line break is a part of the template
+                    return (first_col, ''.join(out))
+                self._last_word = ''
+                self._division_next = False
+                continue
+
+            if self._in_string is not None:
+                start = i
+                quote = self._in_string
+                if first_col is None:
+                    first_col = i
+                while i < n:
+                    c = line[i]
+                    if c == '\\':
+                        i += 2
+                    elif c == quote:
+                        i += 1
+                        self._in_string = None
+                        break
+                    else:
+                        i += 1
+                out.append(line[start:min(i, n)])
+                if self._in_string is not None:
+                    # continued on the next line only if the line ends with a backslash
+                    if not line.endswith('\\'):
+                        self._error(quote, line_no)
+                    return (first_col, ''.join(out))
+                self._last_char = quote
+                self._division_next = False
+                continue
+
+            c = line[i]
+            if c in ' \t\f\v\r\n':
+                space = True
+                i += 1
+                continue
+
+            if c == '/' and i + 1 < n and line[i + 1] == '/':
+                break
+
+            if c == '/' and i + 1 < n and line[i + 1] == '*':
+                self._in_comment = True
+                space = True
+                i += 2
+                continue
+
+            if first_col is None:
+                first_col = i
+            if space:
+                self._append_space(out, c)
+                space = False
+
+            if c == '"' or c == "'":
+                self._in_string = c
+                out.append(c)
+                i += 1
+                continue
+
+            if c == '`':
+                self._in_template = True
+                out.append(c)
+                i += 1
+                continue
+
+            if c == '/' and self._regex_allowed():
+                start = i
+                i += 1
+                in_class = False
+                while i < n:
+                    c = line[i]
+                    if c == '\\':
+                        i += 2
+                        continue
+                    i += 1
+                    if c == '[':
+                        in_class = True
+                    elif c == ']':
+                        in_class = False
+                    elif c == '/' and not in_class:
+                        break
+                else:
+                    self._error('/', line_no)
+                # the flags are handled as a word
+                out.append(line[start:i])
+                self._last_char = '/'
+                self._last_word = ''
+                self._division_next = False
+                continue
+
+            if _is_word_char(c):
+                start = i
+                while i < n and _is_word_char(line[i]):
+                    i += 1
+                word = line[start:i]
+                out.append(word)
+                self._last_char = word[-1]
+                self._last_word = word
+                self._division_next = False
+                continue
+
+            if c in '+-' and i + 1 < n and line[i + 1] == c:
+                # a '/' can't start a regular expression after the increment & decrement operators
+                out.append(c + c)
+                self._last_char = c
+                self._last_word = ''
+                self._division_next = True
+                i += 2
+                continue
+
+            is_object_end = False
+            if c == '{':
+                self._braces.append(self._is_object_start())
+            elif c == '}' and len(self._braces) > 0:
+                is_object_end = self._braces.pop()
+                if is_object_end == _TEMPLATE_BRACE:
+                    # the end of the expression, the text of the template continues
+                    out.append(c)
+                    self._in_template = True
+                    i += 1
+                    continue
+
+            out.append(c)
+            self._last_char = c
+            self._last_word = ''
+            self._division_next = is_object_end
+            i += 1
+
+        return (first_col, ''.join(out))
+
+    def finish(self, line_no):
+        if self._in_comment:
+            self._error('/*', line_no)
+        if self._in_string is not None:
+            self._error(self._in_string, line_no)
+        if self._in_template:
+            self._error('`', line_no)
+
+
+class SourceMap(object):
+    """
+    Collects the mappings of the output lines & writes them in the source map format version 3.
+    """
+
+    def __init__(self, file_name):
+        self._file_name = file_name
+        self._sources = []
+        self._lines = []
+        self._last_source = 0
+        self._last_line = 0
+        self._last_col = 0
+
+    def add_source(self, source):
+        self._sources.append(source)
+        return len(self._sources) - 1
+
+    def add_line(self, source_index=None, line=0, col=0):
+        if source_index is None:
+            self._lines.append('')
+            return
+
+        segment = _encode_vlq(0) + _encode_vlq(source_index - self._last_source) + \
+                  _encode_vlq(line - self._last_line) + _encode_vlq(col - self._last_col)
+        self._lines.append(segment)
+        self._last_source = source_index
+        self._last_line = line
+        self._last_col = col
+
+    def save(self, path):
+        source_map = {
+            "version": 3,
+            "file": self._file_name,
+            "sources": self._sources,
+            "names": [],
+            "mappings": ';'.join(self._lines)
+        }
+        f = open(path, "w")
+        try:
+            json.dump(source_map, f)
+        finally:
+            f.close()
+
+
+class JsBundler(object):
+    """
+    Writes the minified js files into one file. `files` are (absolute path, path in the source map).
+    """
+
+    def __init__(self, files, output_path, source_map_path=None):
+        self._files = files
+        self._output_path = output_path
+        self._source_map_path = source_map_path
+
+    def _check_files(self):
+        for path, source in self._files:
+            if not os.path.isfile(path):
+                raise cocos.CCPluginError(MultiLanguage.get_string('COMPILE_ERROR_FILE_NOT_FOUND_FMT', path),
+                                          cocos.CCPluginError.ERROR_PATH_NOT_FOUND)
+
+    def _write_file(self, out, path, source_index, source_map):
+        minifier = JsMinifier(path)
+        first_line = True
+        line_no = 0
+        f = open(path, "rb")
+        try:
+            for line in f:
+                if line_no == 0 and line.startswith('\xef\xbb\xbf'):
+                    line = line[3:]
+                line_no += 1
+                in_template = minifier.is_in_template()
+                col, text = minifier.minify_line(line.rstrip('\r\n'), line_no)
+                if len(text) == 0 and not in_template:
+                    continue
+
+                if first_line:
+                    first_line = False
+                    if text[0] in _UNSAFE_START_CHARS:
+                        out.write(';\n')
+                        if source_map is not None:
+                            source_map.add_line()
+
+                out.write(text)
+                out.write('\n')
+                if source_map is not None:
+                    source_map.add_line(source_index, line_no - 1, col)
+        finally:
+            f.close()
+
+        minifier.finish(line_no)
+
+    def bundle(self):
+        self._check_files()
+
+        source_map = None
+        if self._source_map_path is not None:
+            source_map = SourceMap(os.path.basename(self._output_path))
+
+        # the output file is replaced only if all the files are bundled
+        tmp_path = self._output_path + ".tmp"
+        out = open(tmp_path, "wb")
+        try:
+            for path, source in self._files:
+                source_index = None
+                if source_map is not None:
+                    source_index = source_map.add_source(source)
+                self._write_file(out, path, source_index, source_map)
+        except:
+            out.close()
+            os.remove(tmp_path)
+            raise
+        out.close()
+
+        if os.path.exists(self._output_path):
+            os.remove(self._output_path)
+        os.rename(tmp_path, self._output_path)
+
+        if source_map is not None:
+            source_map.save(self._source_map_path)
+
+
+# (source, minified) pairs of the cases where a '/' is easy to take for the wrong token
+_SELF_TEST_CASES = [
+    ('var a = b++ / 2;', 'var a=b++/2;'),
+    ('var c = {}/2;', 'var c={}/2;'),
+    ('var d = x-- / 2 / 1;', 'var d=x--/2/1;'),
+    ('var e = {a: {b: 1} / 2};', 'var e={a:{b:1}/2};'),
+    ('if (a) {}\n/a  ,b/.test(s);', 'if(a){}\n/a  ,b/.test(s);'),
+    ('function f() {\n    return {a: 1}\n}\n/a  ,b/g.test(s);', 'function f(){\nreturn{a:1}\n}\n/a  ,b/g.test(s);'),
+    ('switch (a) { case 1: {} /a  ,b/.test(s) }', 'switch(a){case 1:{}/a  ,b/.test(s)}'),
+    ('x = a + +b - -c + ++d - --e;', 'x=a+ +b- -c+ ++d- --e;'),
+    ('a = b\n++c', 'a=b\n++c'),
+    ('var r = /[/]  x/; // comment', 'var r=/[/]  x/;'),
+    ('var s = "a // b" + \'/* c */\'; /* d */', 'var s="a // b"+\'/* c */\';'),
+    ('var t = `a  b ${ x  +  1 } c`;', 'var t=`a  b ${x+1} c`;'),
+    ('var u = `\n    a // b\n\n  /* c */ ${ {a: 1}.a }`  / 2;', 'var u=`\n    a // b\n\n  /* c */ ${{a:1}.a}`/2;'),
+    ('var v = `a ${ `b ${ c + `d` } \\` e` } f`;', 'var v=`a ${`b ${c+`d`} \\` e`} f`;'),
+    ('var w = `${ a }${ function () { return {}; } }`;', 'var w=`${a}${function(){return{};}}`;'),
+]
+
+
+def self_test():
+    """
+    Checks the minified lines of the cases in _SELF_TEST_CASES.
+    """
+    for source, expected in _SELF_TEST_CASES:
+        minifier = JsMinifier('<self test>')
+        lines = []
+        line_no = 0
+        for line in source.split('\n'):
+            line_no += 1
+            in_template = minifier.is_in_template()
+            text = minifier.minify_line(line, line_no)[1]
+            if len(text) > 0 or in_template:
+                lines.append(text)
+        minifier.finish(line_no)
+
+        result = '\n'.join(lines)
+        if result != expected:
+            raise Exception('the minified js is wrong:\n%s\nexpected:\n%s\nresult:\n%s' % (source, expected, result))
+
+    print('%d minifier cases passed' % len(_SELF_TEST_CASES))
+
+
+if __name__ == '__main__':
+    self_test()
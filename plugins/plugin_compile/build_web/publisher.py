@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# ----------------------------------------------------------------------------
+# publisher: publishes a web project incrementally
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+'''
+Keeps the state of the publish folder of a web project between the builds.
+
+The js files are compiled again only if one of them or the build options are changed.
+The compiled js file is named by its content (game.<md5>.min.js for example), so the caches
+of the browsers & the CDN servers never serve an old file with the same name.
+
+An asset manifest (asset-manifest.json) lists the md5 of all the published files,
+and the files changed or removed since the last publish, so only they need to be uploaded.
+'''
+
+import os
+import json
+
+import cocos
+import utils
+from MultiLanguage import MultiLanguage
+
+# the md5 of the input js files, and the name of the compiled js file
+JS_MANIFEST_FILE = ".cocos_web_js.json"
+
+# the md5 of the published files
+ASSET_HASHES_FILE = ".cocos_web_assets.json"
+
+ASSET_MANIFEST_FILE = "asset-manifest.json"
+
+# the length of the md5 in the name of the compiled js file
+HASH_LENGTH = 8
+
+# the files in the publish folder which aren't published
+_IGNORED_FILES = frozenset([ ASSET_MANIFEST_FILE, "build.xml" ])
+
+
+def _rel_path(path, start):
+    return os.path.relpath(path, start).replace("\\", "/")
+
+
+class WebPublisher(object):
+    """
+    `js_files` are the absolute paths of the js files to compile,
+    `build_opts` are the options of compiling them.
+    """
+
+    def __init__(self, publish_dir, js_files, build_opts):
+        self._publish_dir = publish_dir
+        self._js_files = js_files
+        self._output_file_name = build_opts["outputFileName"]
+        params = {
+            "options": build_opts,
+            "files": js_files
+        }
+        self._js_manifest = utils.BuildManifest(os.path.join(publish_dir, JS_MANIFEST_FILE), params)
+        self.js_output_name = self._js_manifest.old_data.get("output")
+
+    def is_js_up_to_date(self):
+        """
+        Returns True if the compiled js file exists, and the js files are not changed since it's compiled.
+        """
+        output_files = None
+        if self.js_output_name is not None:
+            output_files = [ os.path.join(self._publish_dir, self.js_output_name) ]
+
+        up_to_date = self.js_output_name is not None
+        for path in self._js_files:
+            # all the files are checked, so the states of them are recorded
+            if not self._js_manifest.check(path, path, output_files):
+                up_to_date = False
+
+        if up_to_date:
+            self._js_manifest.data["output"] = self.js_output_name
+            self._js_manifest.save()
+
+        return up_to_date
+
+    def _fix_source_map(self, source_map_path):
+        f = open(source_map_path)
+        try:
+            source_map = json.load(f)
+        finally:
+            f.close()
+
+        # the closure compiler writes the absolute paths of the js files
+        sources = []
+        for source in source_map.get("sources", []):
+            if os.path.isabs(source):
+                source = _rel_path(source, self._publish_dir)
+            sources.append(source.replace("\\", "/"))
+        source_map["sources"] = sources
+        source_map["file"] = self.js_output_name
+
+        f = open(source_map_path, "w")
+        try:
+            json.dump(source_map, f)
+        finally:
+            f.close()
+
+    def finish_js(self, source_map_path=None):
+        """
+        Renames the compiled js file by its md5, and records the states of the js files.
+        """
+        output_path = os.path.join(self._publish_dir, self._output_file_name)
+        name_parts = self._output_file_name.split(".", 1)
+        name_parts.insert(1, utils.get_file_md5(output_path)[:HASH_LENGTH])
+        output_name = ".".join(name_parts)
+
+        hashed_path = os.path.join(self._publish_dir, output_name)
+        if os.path.exists(hashed_path):
+            os.remove(hashed_path)
+        os.rename(output_path, hashed_path)
+
+        old_name = self.js_output_name
+        if old_name is not None and old_name != output_name:
+            old_path = os.path.join(self._publish_dir, old_name)
+            if os.path.isfile(old_path):
+                os.remove(old_path)
+        self.js_output_name = output_name
+
+        if source_map_path is not None and os.path.isfile(source_map_path):
+            self._fix_source_map(source_map_path)
+
+        for path in self._js_files:
+            if path not in self._js_manifest.entries:
+                self._js_manifest.update(path)
+        self._js_manifest.data["output"] = output_name
+        self._js_manifest.save()
+
+    def write_file(self, name, content):
+        """
+        Writes the file in the publish folder only if the content is changed,
+        so the file isn't uploaded or copied again.
+        """
+        path = os.path.join(self._publish_dir, name)
+        if os.path.isfile(path):
+            f = open(path, "rb")
+            try:
+                if f.read() == content:
+                    return
+            finally:
+                f.close()
+
+        f = open(path, "wb")
+        try:
+            f.write(content)
+        finally:
+            f.close()
+
+    def _walk_published_files(self):
+        for root, dirs, files in os.walk(self._publish_dir):
+            dirs[:] = [ name for name in dirs if not name.startswith(".") ]
+            for name in files:
+                path = os.path.join(root, name)
+                rel_path = _rel_path(path, self._publish_dir)
+                if name.startswith(".") or rel_path in _IGNORED_FILES:
+                    continue
+                yield (rel_path, path)
+
+    def save_asset_manifest(self):
+        """
+        Saves the md5 of the published files, the md5 is only computed for the files changed.
+        """
+        hashes = utils.BuildManifest(os.path.join(self._publish_dir, ASSET_HASHES_FILE), {})
+        files = {}
+        changed = []
+        for rel_path, path in sorted(self._walk_published_files()):
+            if not hashes.check(rel_path, path):
+                hashes.update(rel_path)
+                changed.append(rel_path)
+            entry = hashes.entries[rel_path]
+            files[rel_path] = {
+                "md5": entry["hash"],
+                "size": entry["size"]
+            }
+
+        removed = sorted([ key for key in hashes.old_entries if key not in hashes.entries ])
+        hashes.save()
+
+        asset_manifest = {
+            "entries": {
+                self._output_file_name: self.js_output_name
+            },
+            "files": files,
+            "changed": changed,
+            "removed": removed
+        }
+        self.write_file(ASSET_MANIFEST_FILE, json.dumps(asset_manifest, sort_keys=True, indent=1))
+
+        cocos.Logging.info(MultiLanguage.get_string('COMPILE_INFO_WEB_ASSET_MANIFEST_FMT',
+                                                    (os.path.join(self._publish_dir, ASSET_MANIFEST_FILE),
+                                                     len(changed), len(removed))))
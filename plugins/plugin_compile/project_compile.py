@@ -12,7 +12,6 @@
 
 __docformat__ = 'restructuredtext'
 
-import multiprocessing
 import cocos
 from MultiLanguage import MultiLanguage
 import cocos_project
@@ -208,11 +207,7 @@ class CCPluginCompile(cocos.CCPlugin):
             raise cocos.CCPluginError(error_msg, cocos.CCPluginError.ERROR_WRONG_ARGS)
 
     def get_num_of_cpu(self):
-        try:
-            return multiprocessing.cpu_count()
-        except Exception:
-            print MultiLanguage.get_string('COMPILE_DETECT_CPU_FAILED')
-            return 1
+        return cocos.get_num_of_cpu()
 
     def _get_output_dir(self):
         project_dir = self._project.get_project_dir()
@@ -365,27 +360,21 @@ class CCPluginCompile(cocos.CCPlugin):
         if not self._compile_script and not self._lua_encrypt:
             return False
 
-        cocos_cmd_path = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "cocos")
         rm_ext = ".lua"
-        compile_cmd = "\"%s\" luacompile -s \"%s\" -d \"%s\"" % (cocos_cmd_path, src_dir, dst_dir)
+        compile_args = cocos.PluginArgs().set("-s", src_dir).set("-d", dst_dir).set("-j", str(self._jobs))
 
         if not self._compile_script:
-            compile_cmd = "%s --disable-compile" % compile_cmd
+            compile_args.set("--disable-compile", True)
         elif build_64:
-            compile_cmd = "%s --bytecode-64bit" % compile_cmd
+            compile_args.set("--bytecode-64bit", True)
 
         if self._lua_encrypt:
-            add_para = ""
-            if self._lua_encrypt_key is not None:
-                add_para = "%s -k %s" % (add_para, self._lua_encrypt_key)
-
-            if self._lua_encrypt_sign is not None:
-                add_para = "%s -b %s" % (add_para, self._lua_encrypt_sign)
+            compile_args.set("-e", True)
+            compile_args.set("-k", self._lua_encrypt_key)
+            compile_args.set("-b", self._lua_encrypt_sign)
 
-            compile_cmd = "%s -e %s" % (compile_cmd, add_para)
-
-        # run compile command
-        self._run_cmd(compile_cmd)
+        # run the luacompile plugin in this process
+        self._run_plugin("luacompile", compile_args)
 
         # remove the source scripts
         self._remove_file_with_ext(dst_dir, rm_ext)
@@ -399,12 +388,11 @@ class CCPluginCompile(cocos.CCPlugin):
         if not self._compile_script:
             return False
 
-        cocos_cmd_path = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "cocos")
         rm_ext = ".js"
-        compile_cmd = "\"%s\" jscompile -s \"%s\" -d \"%s\"" % (cocos_cmd_path, src_dir, dst_dir)
 
-        # run compile command
-        self._run_cmd(compile_cmd)
+        # run the jscompile plugin in this process
+        compile_args = cocos.PluginArgs().set("-s", src_dir).set("-d", dst_dir).set("--jobs", str(self._jobs))
+        self._run_plugin("jscompile", compile_args)
 
         # remove the source scripts
         self._remove_file_with_ext(dst_dir, rm_ext)
@@ -1280,8 +1268,6 @@ class CCPluginCompile(cocos.CCPlugin):
         f = open(os.path.join(project_dir, "project.json"))
         project_json = json.load(f)
         f.close()
-        engine_dir = os.path.join(project_json["engineDir"])
-        realEngineDir = os.path.normpath(os.path.join(project_dir, engine_dir))
         publish_dir = os.path.normpath(os.path.join(project_dir, output_dir, CCPluginCompile.WEB_PLATFORM_FOLDER_NAME))
 
         # need to config in options of command
@@ -1292,50 +1278,49 @@ class CCPluginCompile(cocos.CCPlugin):
                 "sourceMapOpened" : True if self._has_sourcemap else False
                 }
 
-        if os.path.exists(publish_dir):
+        # the publish dir is kept if it's synchronized by cocos before,
+        # so only the changed resources are copied
+        if os.path.exists(publish_dir) and not cocos.FileSyncer.has_manifest(publish_dir):
             shutil.rmtree(publish_dir)
-        os.makedirs(publish_dir)
+        if not os.path.exists(publish_dir):
+            os.makedirs(publish_dir)
 
-        # generate build.xml
-        build_web.gen_buildxml(project_dir, project_json, publish_dir, buildOpt)
+        # the js files are compiled again only if they or the options are changed
+        js_files = build_web.get_js_files(project_dir, project_json)
+        publisher = build_web.WebPublisher(publish_dir, js_files, buildOpt)
+        sourceMapPath = os.path.join(publish_dir, "sourcemap")
+        if publisher.is_js_up_to_date():
+            cocos.Logging.info(MultiLanguage.get_string('COMPILE_INFO_WEB_JS_UP_TO_DATE_FMT',
+                                                        publisher.js_output_name))
+        else:
+            if os.path.exists(sourceMapPath):
+                os.remove(sourceMapPath)
 
-        outputJsPath = os.path.join(publish_dir, buildOpt["outputFileName"])
-        if os.path.exists(outputJsPath) == True:
-            os.remove(outputJsPath)
+            if not self._web_advanced:
+                # the closure compiler is only necessary for the advanced mode,
+                # bundle the js files without starting java & ant
+                build_web.bundle_js(js_files, publish_dir, buildOpt)
+            else:
+                # generate build.xml
+                build_web.gen_buildxml(project_dir, project_json, publish_dir, buildOpt)
 
+                outputJsPath = os.path.join(publish_dir, buildOpt["outputFileName"])
+                if os.path.exists(outputJsPath) == True:
+                    os.remove(outputJsPath)
 
-        # call closure compiler
-        ant_root = cocos.check_environment_variable('ANT_ROOT')
-        ant_path = os.path.join(ant_root, 'ant')
-        self._run_cmd("%s -f %s" % (ant_path, os.path.join(publish_dir, 'build.xml')))
+                # call closure compiler
+                ant_root = cocos.check_environment_variable('ANT_ROOT')
+                ant_path = os.path.join(ant_root, 'ant')
+                self._run_cmd("%s -f %s" % (ant_path, os.path.join(publish_dir, 'build.xml')))
 
-        # handle sourceMap
-        sourceMapPath = os.path.join(publish_dir, "sourcemap")
-        if os.path.exists(sourceMapPath):
-            smFile = open(sourceMapPath)
-            try:
-                smContent = smFile.read()
-            finally:
-                smFile.close()
-
-            dir_to_replace = project_dir
-            if cocos.os_is_win32():
-                dir_to_replace = project_dir.replace('\\', '\\\\')
-            smContent = smContent.replace(dir_to_replace, os.path.relpath(project_dir, publish_dir))
-            smContent = smContent.replace(realEngineDir, os.path.relpath(realEngineDir, publish_dir))
-            smContent = smContent.replace('\\\\', '/')
-            smContent = smContent.replace('\\', '/')
-            smFile = open(sourceMapPath, "w")
-            smFile.write(smContent)
-            smFile.close()
+            # the paths in the source map are made relative to the publish dir
+            publisher.finish_js(sourceMapPath)
 
         # handle project.json
         del project_json["engineDir"]
         del project_json["modules"]
         del project_json["jsList"]
-        project_json_output_file = open(os.path.join(publish_dir, "project.json"), "w")
-        project_json_output_file.write(json.dumps(project_json))
-        project_json_output_file.close()
+        publisher.write_file("project.json", json.dumps(project_json))
 
         # handle index.html
         indexHtmlFile = open(os.path.join(project_dir, "index.html"))
@@ -1346,31 +1331,33 @@ class CCPluginCompile(cocos.CCPlugin):
         reg1 = re.compile(r'<script\s+src\s*=\s*("|\')[^"\']*CCBoot\.js("|\')\s*><\/script>')
         indexContent = reg1.sub("", indexContent)
         mainJs = project_json.get("main") or "main.js"
-        indexContent = indexContent.replace(mainJs, buildOpt["outputFileName"])
-        indexHtmlOutputFile = open(os.path.join(publish_dir, "index.html"), "w")
-        indexHtmlOutputFile.write(indexContent)
-        indexHtmlOutputFile.close()
-        
-        # copy res dir
+        indexContent = indexContent.replace(mainJs, publisher.js_output_name)
+        publisher.write_file("index.html", indexContent)
+
+        # copy res dir, only the changed files are copied
+        syncer = cocos.FileSyncer(publish_dir)
         if cfg_obj.copy_res is None:
-            dst_dir = os.path.join(publish_dir, 'res')
-            src_dir = os.path.join(project_dir, 'res')
-            if os.path.exists(dst_dir):
-                shutil.rmtree(dst_dir)
-            shutil.copytree(src_dir, dst_dir)
+            copy_res = [ { "from" : "res", "to" : "res" } ]
         else:
-            for cfg in cfg_obj.copy_res:
-                cocos.copy_files_with_config(cfg, project_dir, publish_dir)
+            copy_res = cfg_obj.copy_res
+        for cfg in copy_res:
+            cocos.copy_files_with_config(cfg, project_dir, publish_dir, syncer)
+        syncer.finish()
 
-        # copy to the output directory if necessary
+        publisher.save_asset_manifest()
+
+        # copy to the output directory if necessary, only the changed files are copied
         pub_dir = os.path.normcase(publish_dir)
         out_dir = os.path.normcase(os.path.normpath(self._output_dir))
         if pub_dir != out_dir:
             cpy_cfg = {
                 "from" : pub_dir,
-                "to" : out_dir
+                "to" : out_dir,
+                "exclude" : [ ".cocos_*" ]
             }
-            cocos.copy_files_with_config(cpy_cfg, pub_dir, out_dir)
+            syncer = cocos.FileSyncer(out_dir)
+            cocos.copy_files_with_config(cpy_cfg, pub_dir, out_dir, syncer)
+            syncer.finish()
 
     def build_linux(self):
         if not self._platforms.is_linux_active():
@@ -1408,12 +1395,12 @@ class CCPluginCompile(cocos.CCPlugin):
             os.makedirs(build_dir)
 
         build_mode = 'Debug' if self._is_debug_mode() else 'Release'
-        with cocos.pushd(build_dir):
-            debug_state = 'ON' if self._is_debug_mode() else 'OFF'
-            self._run_cmd('cmake -DCMAKE_BUILD_TYPE=%s -DDEBUG_MODE=%s %s' % (build_mode, debug_state, os.path.relpath(cmakefile_dir, build_dir)))
+        # run in the build dir by cwd, the current dir is shared by the platforms built at the same time
+        debug_state = 'ON' if self._is_debug_mode() else 'OFF'
+        self._run_cmd('cmake -DCMAKE_BUILD_TYPE=%s -DDEBUG_MODE=%s %s' % (build_mode, debug_state, os.path.relpath(cmakefile_dir, build_dir)),
+                      cwd=build_dir)
 
-        with cocos.pushd(build_dir):
-            self._run_cmd('make -j%s' % self._jobs)
+        self._run_cmd('make -j%s' % self._jobs, cwd=build_dir)
 
         # move file
         output_dir = self._output_dir
@@ -1511,7 +1498,108 @@ class CCPluginCompile(cocos.CCPlugin):
                 return name, fullname
         return (None, None)
 
+    def _parse_platforms(self, argv):
+        """
+        Returns (platforms, jobs, output dir, the other arguments) if several platforms are specified
+        by "-p", eg. "-p android,linux,web". Returns None if there is only one platform.
+        """
+        if "-h" in argv or "--help" in argv:
+            return None
+
+        from argparse import ArgumentParser
+        parser = ArgumentParser(prog="cocos %s" % self.__class__.plugin_name(), add_help=False)
+        parser.add_argument("-p", "--platform", dest="platform")
+        parser.add_argument("-j", "--jobs", dest="jobs", type=int)
+        parser.add_argument("-o", "--output-dir", dest="output_dir")
+        (args, other_args) = parser.parse_known_args(argv)
+
+        if args.platform is None or "," not in args.platform:
+            return None
+
+        platforms = []
+        for platform in args.platform.lower().split(","):
+            platform = platform.strip()
+            if len(platform) > 0 and platform not in platforms:
+                platforms.append(platform)
+
+        return (platforms, args.jobs, args.output_dir, other_args)
+
+    def _build_platforms(self, platforms, jobs, output_dir, other_args):
+        """
+        Builds the platforms in threads. The builds share the parsed project, and the jobs are divided
+        among the builds. The output of each build is written into its own log file,
+        and into the console with the platform name as prefix.
+        """
+        if jobs is None:
+            jobs = self.get_num_of_cpu()
+        build_count = max(1, min(len(platforms), jobs))
+        build_jobs = max(1, jobs // build_count)
+        cocos.Logging.info(MultiLanguage.get_string('COMPILE_INFO_BUILD_PLATFORMS_FMT',
+                                                    (', '.join(platforms), build_count, build_jobs)))
+
+        plugins = cocos.Cocos2dIniParser().parse_plugins()
+        context = self.get_build_context()
+        builds = []
+        for platform in platforms:
+            argv = other_args + [ "-p", platform, "-j", str(build_jobs) ]
+            if output_dir is not None:
+                argv += [ "-o", os.path.join(output_dir, platform) ]
+            log_path = cocos.CMDRunner.new_log_path("compile-%s" % platform)
+            cocos.Logging.info(MultiLanguage.get_string('COMPILE_INFO_PLATFORM_LOG_FMT', (platform, log_path)))
+            builds.append((platform, argv, log_path))
+
+        output = sys.stdout
+        if not isinstance(output, cocos.ThreadOutput):
+            output = cocos.ThreadOutput(sys.stdout)
+            sys.stdout = output
+
+        def build(build_info):
+            platform, argv, log_path = build_info
+            log_file = open(log_path, "w")
+            try:
+                with output.redirect_thread(log_file, "[%s] " % platform):
+                    try:
+                        cocos.run_plugin("compile", argv, plugins, context)
+                        return None
+                    except cocos.CCPluginError as e:
+                        cocos.Logging.error(' '.join(e.args))
+                        return ' '.join(e.args)
+                    except SystemExit as e:
+                        # argparse exits on the wrong arguments
+                        return str(e.code)
+                    except Exception as e:
+                        import traceback
+                        traceback.print_exc(file=output)
+                        return str(e)
+            finally:
+                log_file.close()
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(build_count)
+        try:
+            results = pool.map_async(build, builds).get(0xFFFFFFF)
+        finally:
+            pool.terminate()
+            if sys.stdout is output:
+                sys.stdout = output.stream
+
+        failed = []
+        for (platform, argv, log_path), error in zip(builds, results):
+            if error is None:
+                cocos.Logging.info(MultiLanguage.get_string('COMPILE_INFO_PLATFORM_SUCCEED_FMT', platform))
+            else:
+                failed.append(MultiLanguage.get_string('COMPILE_ERROR_PLATFORM_FAILED_FMT',
+                                                       (platform, error, log_path)))
+
+        if len(failed) > 0:
+            raise cocos.CCPluginError('\n'.join(failed), cocos.CCPluginError.ERROR_BUILD_FAILED)
+
     def run(self, argv, dependencies):
+        multi_platforms = self._parse_platforms(argv)
+        if multi_platforms is not None:
+            self._build_platforms(*multi_platforms)
+            return
+
         self.parse_args(argv)
         cocos.Logging.info(MultiLanguage.get_string('COMPILE_INFO_BUILD_MODE_FMT', self._mode))
         self._update_build_cfg()
@@ -1527,13 +1615,10 @@ class CCPluginCompile(cocos.CCPlugin):
         # invoke the custom step: pre-build
         self._project.invoke_custom_step_script(cocos_project.Project.CUSTOM_STEP_PRE_BUILD, target_platform, args_build_copy)
 
-        self.build_android()
-        self.build_ios()
-        self.build_mac()
-        self.build_win32()
-        self.build_web()
-        self.build_linux()
-        self.build_metro()
+        for build_phase in (self.build_android, self.build_ios, self.build_mac, self.build_win32,
+                            self.build_web, self.build_linux, self.build_metro):
+            with cocos.Profiler.span(build_phase.__name__, "build", platform=target_platform):
+                build_phase()
 
         # invoke the custom step: post-build
         self._project.invoke_custom_step_script(cocos_project.Project.CUSTOM_STEP_POST_BUILD, target_platform, args_build_copy)
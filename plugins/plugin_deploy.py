@@ -77,6 +77,8 @@ class CCPluginDeploy(cocos.CCPlugin):
         compile_dep = dependencies['compile']
         self.sub_url = compile_dep.sub_url
         self.run_root = compile_dep.run_root
+        # "run --watch" builds the project again when the files are changed
+        self.compile_dep = compile_dep
 
     def deploy_win32(self, dependencies):
         if not self._platforms.is_win32_active():
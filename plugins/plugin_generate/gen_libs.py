@@ -337,7 +337,6 @@ class LibsCompiler(cocos.CCPlugin):
 
     def compile_android(self):
         # build .so for android
-        cmd_path = self._get_cocos_cmd_path()
         engine_dir = self.repo_x
 
         # build the simulator project
@@ -348,10 +347,10 @@ class LibsCompiler(cocos.CCPlugin):
             proj_path = os.path.join(engine_dir, 'tests/js-tests')
 
         for app_abi_item in self.app_abi_list:
-            build_cmd = "%s compile -s %s -p android --no-sign --mode %s --app-abi %s" % (cmd_path, proj_path, self.mode, app_abi_item)
-            if self.android_platform is not None:
-                build_cmd += ' --ap %s' % self.android_platform
-            self._run_cmd(build_cmd)
+            compile_args = cocos.PluginArgs().set("-s", proj_path).set("-p", "android").set("--no-sign", True)
+            compile_args.set("--mode", self.mode).set("--app-abi", app_abi_item)
+            compile_args.set("--ap", self.android_platform)
+            self._run_compile(compile_args)
 
             # copy .a to prebuilt dir
             ANDROID_A_PATH = "proj.android/app/build/intermediates/ndkBuild/%s/obj/local/%s" % (self.mode, app_abi_item)
@@ -413,6 +412,15 @@ class LibsCompiler(cocos.CCPlugin):
             if os.path.exists(strip_cmd_path) and os.path.exists(os.path.join(android_out_dir, "x86")):
                 self.trip_libs(strip_cmd_path, os.path.join(android_out_dir, 'x86'))
 
+    def _run_compile(self, compile_args):
+        cmd_path = self._get_cocos_cmd_path()
+        if os.path.realpath(os.path.dirname(cmd_path)) == os.path.realpath(self.get_console_path()):
+            # the console of the engine is running, compile in this process
+            self._run_plugin("compile", compile_args)
+        else:
+            args_str = ' '.join([ "\"%s\"" % arg for arg in compile_args.to_argv() ])
+            self._run_cmd("%s compile %s" % (cmd_path, args_str))
+
     def _get_cocos_cmd_path(self):
         CONSOLE_PATH = "tools/cocos2d-console/bin"
 
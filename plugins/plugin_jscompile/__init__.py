@@ -20,12 +20,15 @@ import inspect
 import platform
 
 import cocos
+import utils
 from MultiLanguage import MultiLanguage
 
 class CCPluginJSCompile(cocos.CCPlugin):
     """
     compiles (encodes) and minifies JS files
     """
+    MANIFEST_FILE_NAME = ".jscompile_manifest.json"
+
     @staticmethod
     def plugin_name():
         return "jscompile"
@@ -66,9 +69,19 @@ class CCPluginJSCompile(cocos.CCPlugin):
         if options.closure_params is not None:
             self._closure_params = options.closure_params
 
+        if options.jobs is not None and options.jobs > 0:
+            self._jobs = options.jobs
+        else:
+            self._jobs = cocos.get_num_of_cpu()
+
         self._js_files = {}
         self._compressed_js_path = os.path.join(self._dst_dir, options.compressed_filename)
         self._compressed_jsc_path = os.path.join(self._dst_dir, options.compressed_filename+"c")
+        self._rebuild = options.rebuild
+        self._manifest_path = os.path.join(self._dst_dir, CCPluginJSCompile.MANIFEST_FILE_NAME)
+        self._watch = options.watch
+        # the output of jsbcc for all the files
+        self._log_path = cocos.CMDRunner.new_log_path(self.__class__.plugin_name())
 
         if(cocos.os_is_linux()):
             if(platform.architecture()[0] == "32bit"):
@@ -102,24 +115,28 @@ class CCPluginJSCompile(cocos.CCPlugin):
         """
         Gets output file path by source js file
         """
-        # create folder for generated file
-        jsc_filepath = ""
         relative_path = self.get_relative_path(jsfile)+"c"
         jsc_filepath = os.path.join(self._dst_dir, relative_path)
 
-        dst_rootpath = os.path.split(jsc_filepath)[0]
-        try:
-            # print "creating dir (%s)" % (dst_rootpath)
-            os.makedirs(dst_rootpath)
-        except OSError:
-            if os.path.exists(dst_rootpath) == False:
+        # print "return jsc path: "+jsc_filepath
+        return jsc_filepath
+
+    def create_output_dirs(self, output_files):
+        """
+        Creates the folders of all the output files before compiling
+        """
+        dst_dirs = set([os.path.dirname(output_file) for output_file in output_files])
+        for dst_rootpath in sorted(dst_dirs):
+            if os.path.isdir(dst_rootpath):
+                continue
+
+            try:
+                os.makedirs(dst_rootpath)
+            except OSError:
                 # There was an error on creation, so make sure we know about it
                 raise cocos.CCPluginError(MultiLanguage.get_string('LUACOMPILE_ERROR_MKDIR_FAILED_FMT', dst_rootpath),
                                           cocos.CCPluginError.ERROR_PATH_NOT_FOUND)
 
-        # print "return jsc path: "+jsc_filepath
-        return jsc_filepath
-
     def compile_js(self, jsfile, output_file):
         """
         Compiles js file
@@ -127,7 +144,52 @@ class CCPluginJSCompile(cocos.CCPlugin):
         cocos.Logging.debug(MultiLanguage.get_string('JSCOMPILE_DEBUG_COMPILE_FILE_FMT', jsfile))
 
         cmd_str = "\"%s\" \"%s\" \"%s\"" % (self.jsbcc_exe_path, jsfile, output_file)
-        self._run_cmd(cmd_str)
+        self._run_cmd(cmd_str, log_path=self._log_path)
+
+    def _compile_js_task(self, task):
+        """
+        Compiles one js file in the worker threads. Returns the error message on failure.
+        """
+        jsfile, output_file = task
+        try:
+            self.compile_js(jsfile, output_file)
+        except Exception as e:
+            return (jsfile, ' '.join([str(arg) for arg in e.args]))
+
+        return None
+
+    def compile_all_js(self, tasks):
+        """
+        Compiles the js files by running at most `self._jobs` jsbcc processes at once.
+        Returns the list of (jsfile, error message) of the failed files.
+        """
+        self.create_output_dirs([output_file for (jsfile, output_file) in tasks])
+
+        jobs = min(self._jobs, len(tasks))
+        if jobs > 1:
+            # jsbcc runs in sub-processes, so threads are enough
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(jobs)
+            try:
+                # use get() with a timeout, so Ctrl-C can interrupt the waiting
+                results = pool.map_async(self._compile_js_task, tasks).get(0xFFFFFFF)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            results = [self._compile_js_task(task) for task in tasks]
+
+        return [ret for ret in results if ret is not None]
+
+    def raise_compile_errors(self, failed):
+        if len(failed) > 0:
+            details = '\n'.join(["%s: %s" % (jsfile, msg) for (jsfile, msg) in failed])
+            raise cocos.CCPluginError(MultiLanguage.get_string('JSCOMPILE_ERROR_FILES_FAILED_FMT',
+                                                               (len(failed), details)),
+                                      cocos.CCPluginError.ERROR_BUILD_FAILED)
 
     def compress_js(self):
         """
@@ -159,40 +221,33 @@ class CCPluginJSCompile(cocos.CCPlugin):
         - `jsfile`:
         - `l`:
         """
-        index = -1
-
-        for el in l:
-            if jsfile.rfind(el) != -1:
-                # print "index:"+str(index+1)+", el:"+el
-                return index+1
-            index = index + 1
+        for index, el in enumerate(l):
+            if el in jsfile:
+                return index
         return -1
 
-    def js_filename_pre_order_compare(self, a, b):
-        return self._js_filename_compare(a, b, self._pre_order, 1)
-
-    def js_filename_post_order_compare(self, a, b):
-        return self._js_filename_compare(a, b, self._post_order, -1)
-
-    def _js_filename_compare(self, a, b, files, delta):
-        index_a = self.index_in_list(a, files)
-        index_b = self.index_in_list(b, files)
-        is_a_in_list = index_a != -1
-        is_b_in_list = index_b != -1
-
-        if is_a_in_list and not is_b_in_list:
-            return -1 * delta
-        elif not is_a_in_list and is_b_in_list:
-            return 1 * delta
-        elif is_a_in_list and is_b_in_list:
-            if index_a > index_b:
-                return 1
-            elif index_a < index_b:
-                return -1
-            else:
-                return 0
+    def js_filename_order_key(self, jsfile):
+        """
+        The sort key of a js file: the files in pre_order come first, in the order of the list,
+        and the files in post_order come last. Equals to sorting by pre_order, then by post_order.
+        """
+        pre_index = self.index_in_list(jsfile, self._pre_order)
+        post_index = self.index_in_list(jsfile, self._post_order)
+        if pre_index == -1:
+            pre_key = (1, 0)
+        else:
+            pre_key = (0, pre_index)
+        if post_index == -1:
+            post_key = (0, 0)
         else:
-            return 0
+            post_key = (1, post_index)
+        return (post_key, pre_key)
+
+    def is_skipped_js_file(self, jsfile):
+        for exclude_file in self._skip:
+            if exclude_file in jsfile:
+                return True
+        return False
 
     def reorder_js_files(self):
         if self._config == None:
@@ -202,39 +257,113 @@ class CCPluginJSCompile(cocos.CCPlugin):
 
         for src_dir in self._js_files:
             # Remove file in exclude list
-            need_remove_arr = []
-            for jsfile in self._js_files[src_dir]:
-                for exclude_file in self._skip:
-                    if jsfile.rfind(exclude_file) != -1:
-                        # print "remove:" + jsfile
-                        need_remove_arr.append(jsfile)
+            js_files = [ jsfile for jsfile in self._js_files[src_dir] if not self.is_skipped_js_file(jsfile) ]
 
-            for need_remove in need_remove_arr:
-                self._js_files[src_dir].remove(need_remove)
+            # the index in the order lists is computed only once for each file
+            order_keys = {}
+            for jsfile in js_files:
+                order_keys[jsfile] = self.js_filename_order_key(jsfile)
+            js_files.sort(key=order_keys.get)
 
-            self._js_files[src_dir].sort(cmp=self.js_filename_pre_order_compare)
-            self._js_files[src_dir].sort(cmp=self.js_filename_post_order_compare)
+            self._js_files[src_dir] = js_files
 
         # print '-------------------'
         # print "after:" + str(self._js_files)
 
+    def get_build_params(self):
+        """
+        The parameters which affect the content of output files.
+        If any of them changed, all the js files should be compiled again.
+        """
+        params = {
+            "use_closure_compiler": self._use_closure_compiler
+        }
+
+        if os.path.isfile(self.jsbcc_exe_path):
+            jsbcc_stat = os.stat(self.jsbcc_exe_path)
+            params["jsbcc"] = [self.jsbcc_exe_path, jsbcc_stat.st_size, jsbcc_stat.st_mtime]
+
+        if self._config is not None:
+            params["pre_order"] = self._pre_order
+            params["post_order"] = self._post_order
+            params["skip"] = self._skip
+
+        if self._use_closure_compiler:
+            params["closure_params"] = self._closure_params
+            params["output"] = self._compressed_jsc_path
+            compiler_jar_path = os.path.join(self._workingdir, "bin", "compiler.jar")
+            if os.path.isfile(compiler_jar_path):
+                jar_stat = os.stat(compiler_jar_path)
+                params["compiler_jar"] = [compiler_jar_path, jar_stat.st_size, jar_stat.st_mtime]
+
+        return params
+
+    def handle_closure_compile(self, manifest):
+        """
+        Compresses all the js files into one file by closure compiler, then compiles it.
+        Skipped if the input files, their order and the parameters are not changed.
+        """
+        inputs = []
+        changed = []
+        for src_dir in self._src_dir_arr:
+            for jsfile in self._js_files[src_dir]:
+                inputs.append(jsfile)
+                if not manifest.check(jsfile, jsfile):
+                    changed.append(jsfile)
+
+        manifest.data["closure_inputs"] = inputs
+        if len(changed) == 0 and manifest.old_data.get("closure_inputs") == inputs \
+                and os.path.isfile(self._compressed_jsc_path):
+            cocos.Logging.info(MultiLanguage.get_string('JSCOMPILE_INFO_CLOSURE_UP_TO_DATE'))
+            return
+
+        cocos.Logging.info(MultiLanguage.get_string('JSCOMPILE_INFO_COMPRESS_TIP'))
+        self.compress_js()
+        self.compile_js(self._compressed_js_path, self._compressed_jsc_path)
+        # remove tmp compressed file
+        os.remove(self._compressed_js_path)
+
+        for jsfile in changed:
+            manifest.update(jsfile)
+
     def handle_all_js_files(self):
         """
         Arguments:
         - `self`:
         """
+        manifest = utils.BuildManifest(self._manifest_path, self.get_build_params(), self._rebuild)
         if self._use_closure_compiler == True:
-            cocos.Logging.info(MultiLanguage.get_string('JSCOMPILE_INFO_COMPRESS_TIP'))
-            self.compress_js()
-            self.compile_js(self._compressed_js_path, self._compressed_jsc_path)
-            # remove tmp compressed file
-            os.remove(self._compressed_js_path)
+            self.handle_closure_compile(manifest)
+            manifest.save()
         else:
             cocos.Logging.info(MultiLanguage.get_string('JSCOMPILE_INFO_COMPILE_TO_BYTECODE'))
+            tasks = []
+            up_to_date_count = 0
             for src_dir in self._src_dir_arr:
                 for jsfile in self._js_files[src_dir]:
                     self._current_src_dir = src_dir
-                    self.compile_js(jsfile, self.get_output_file_path(jsfile))
+                    output_file = self.get_output_file_path(jsfile)
+                    if manifest.check(output_file, jsfile, [ output_file ]):
+                        up_to_date_count += 1
+                    else:
+                        tasks.append((jsfile, output_file))
+
+            if up_to_date_count > 0:
+                cocos.Logging.info(MultiLanguage.get_string('JSCOMPILE_INFO_SKIP_UP_TO_DATE_FMT', up_to_date_count))
+
+            failed = self.compile_all_js(tasks)
+            failed_files = set([jsfile for (jsfile, msg) in failed])
+            for (jsfile, output_file) in tasks:
+                if jsfile not in failed_files:
+                    manifest.update(output_file)
+
+            # remove the outputs whose source files are removed
+            for output_file in manifest.removed_entries():
+                if os.path.isfile(output_file):
+                    os.remove(output_file)
+
+            manifest.save()
+            self.raise_compile_errors(failed)
 
     # will be called from the cocos.py script
     def run(self, argv, dependencies):
@@ -255,6 +384,16 @@ class CCPluginJSCompile(cocos.CCPlugin):
             download_cmd_path = os.path.join(self._workingdir, os.pardir, os.pardir)
             subprocess.call("python %s -f -r no" % (os.path.join(download_cmd_path, "download-bin.py")), shell=True, cwd=download_cmd_path)
 
+        self.collect_js_files()
+        self.handle_all_js_files()
+        cocos.Logging.info(MultiLanguage.get_string('LUACOMPILE_INFO_FINISHED'))
+
+        if self._watch:
+            import cocos_watch
+            folders = [ (src_dir, True) for src_dir in self._src_dir_arr ]
+            cocos_watch.watch(folders, self.on_js_files_changed, [ '.js' ], [ self._dst_dir ])
+
+    def collect_js_files(self):
         # deep iterate the src directory
         for src_dir in self._src_dir_arr:
             self._current_src_dir = src_dir
@@ -262,6 +401,11 @@ class CCPluginJSCompile(cocos.CCPlugin):
             self.deep_iterate_dir(src_dir)
 
         self.reorder_js_files()
+
+    def on_js_files_changed(self, changed_files):
+        # the added & removed files are found by iterating the src directory again,
+        # only the changed files are compiled according to the manifest
+        self.collect_js_files()
         self.handle_all_js_files()
         cocos.Logging.info(MultiLanguage.get_string('LUACOMPILE_INFO_FINISHED'))
 
@@ -298,6 +442,15 @@ class CCPluginJSCompile(cocos.CCPlugin):
         parser.add_argument("-m", "--closure_params",
                           action="store", dest="closure_params",
                           help=MultiLanguage.get_string('JSCOMPILE_ARG_EXTRA_PARAM'))
+        parser.add_argument("--jobs",
+                          action="store", dest="jobs", type=int,
+                          help=MultiLanguage.get_string('JSCOMPILE_ARG_JOBS'))
+        parser.add_argument("--rebuild",
+                          action="store_true", dest="rebuild", default=False,
+                          help=MultiLanguage.get_string('JSCOMPILE_ARG_REBUILD'))
+        parser.add_argument("--watch",
+                          action="store_true", dest="watch", default=False,
+                          help=MultiLanguage.get_string('JSCOMPILE_ARG_WATCH'))
 
         options = parser.parse_args(argv)
 
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# ----------------------------------------------------------------------------
+# order_benchmark: checks & benchmarks the js file ordering of "jscompile"
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+'''
+Checks that CCPluginJSCompile.reorder_js_files orders the files exactly as the
+two cmp based sorts it replaced, on random file sets & order lists, and prints
+the time of both implementations on a large project.
+
+    python plugins/plugin_jscompile/order_benchmark.py [--sets 300] [--files 3000]
+'''
+
+import os
+import sys
+import time
+import random
+
+_plugins_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(_plugins_dir), 'bin'))
+sys.path.insert(0, _plugins_dir)
+
+from plugin_jscompile import CCPluginJSCompile
+
+
+def _legacy_index_in_list(jsfile, l):
+    index = -1
+    for el in l:
+        if jsfile.rfind(el) != -1:
+            return index + 1
+        index = index + 1
+    return -1
+
+
+def _legacy_compare(a, b, files, delta):
+    index_a = _legacy_index_in_list(a, files)
+    index_b = _legacy_index_in_list(b, files)
+    is_a_in_list = index_a != -1
+    is_b_in_list = index_b != -1
+
+    if is_a_in_list and not is_b_in_list:
+        return -1 * delta
+    elif not is_a_in_list and is_b_in_list:
+        return 1 * delta
+    elif is_a_in_list and is_b_in_list:
+        if index_a > index_b:
+            return 1
+        elif index_a < index_b:
+            return -1
+        else:
+            return 0
+    else:
+        return 0
+
+
+def legacy_reorder(js_files, pre_order, post_order, skip):
+    """
+    The implementation before the order keys. A file matching two skip entries
+    raised a ValueError there, so each file is removed once here.
+    """
+    js_files = list(js_files)
+    need_remove_arr = []
+    for jsfile in js_files:
+        for exclude_file in skip:
+            if jsfile.rfind(exclude_file) != -1 and jsfile not in need_remove_arr:
+                need_remove_arr.append(jsfile)
+
+    for need_remove in need_remove_arr:
+        js_files.remove(need_remove)
+
+    js_files.sort(cmp=lambda a, b: _legacy_compare(a, b, pre_order, 1))
+    js_files.sort(cmp=lambda a, b: _legacy_compare(a, b, post_order, -1))
+    return js_files
+
+
+def reorder(js_files, pre_order, post_order, skip):
+    plugin = CCPluginJSCompile.__new__(CCPluginJSCompile)
+    plugin._config = {}
+    plugin._pre_order = pre_order
+    plugin._post_order = post_order
+    plugin._skip = skip
+    plugin._js_files = { 'src': list(js_files) }
+    plugin.reorder_js_files()
+    return plugin._js_files['src']
+
+
+def generate_case(rnd, file_count, pre_count, post_count, skip_count):
+    """
+    Random paths, and order lists made of whole paths & parts of paths,
+    so a file may match several entries of the lists.
+    """
+    dirs = [ '/proj/src/%s' % '/'.join(rnd.sample('abcdefgh', rnd.randint(1, 3))) for i in range(max(1, file_count / 10)) ]
+    js_files = []
+    for i in range(file_count):
+        js_files.append('%s/file%d.js' % (rnd.choice(dirs), i))
+
+    def entries(count):
+        result = []
+        for i in range(count):
+            path = rnd.choice(js_files)
+            kind = rnd.random()
+            if kind < 0.6:
+                result.append(path)
+            elif kind < 0.8:
+                result.append(os.path.dirname(path) + '/')
+            else:
+                result.append(os.path.basename(path))
+        return result
+
+    return (js_files, entries(pre_count), entries(post_count), entries(skip_count))
+
+
+def check_equivalence(sets, seed=0):
+    rnd = random.Random(seed)
+    for i in range(sets):
+        file_count = rnd.randint(1, 200)
+        case = generate_case(rnd, file_count, rnd.randint(0, 30), rnd.randint(0, 30), rnd.randint(0, 10))
+        expected = legacy_reorder(*case)
+        result = reorder(*case)
+        if result != expected:
+            raise Exception('the order of file set %d is different:\n%s\n%s' % (i, expected, result))
+
+    print('%d random file sets ordered the same as the old implementation' % sets)
+
+
+def benchmark(file_count, seed=0):
+    case = generate_case(random.Random(seed), file_count, file_count / 10, file_count / 10, file_count / 50)
+    for (name, func) in (('old', legacy_reorder), ('new', reorder)):
+        start = time.time()
+        func(*case)
+        print('%s: %d files, %d/%d/%d pre/post/skip entries: %.3fs'
+              % (name, file_count, len(case[1]), len(case[2]), len(case[3]), time.time() - start))
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='Checks & benchmarks the js file ordering of "cocos jscompile".')
+    parser.add_argument('--sets', type=int, default=300, help='The count of the random file sets to check.')
+    parser.add_argument('--files', type=int, default=3000, help='The count of the files in the benchmark.')
+    args = parser.parse_args()
+    check_equivalence(args.sets)
+    benchmark(args.files)
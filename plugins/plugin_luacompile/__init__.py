@@ -19,85 +19,103 @@ import os
 import json
 import inspect
 import shutil
+import hashlib
 
 import cocos
+import utils
 from MultiLanguage import MultiLanguage
 
-############################################################ 
-#http://www.coolcode.org/archives/?article-307.html
-############################################################ 
-
-import struct 
-
-_DELTA = 0x9E3779B9  
-
-def _long2str(v, w):  
-    n = (len(v) - 1) << 2  
-    if w:  
-        m = v[-1]  
-        if (m < n - 3) or (m > n): return ''  
-        n = m  
-    s = struct.pack('<%iL' % len(v), *v)  
-    return s[0:n] if w else s  
-  
-def _str2long(s, w):  
-    n = len(s)  
-    m = (4 - (n & 3) & 3) + n  
-    s = s.ljust(m, "\0")  
-    v = list(struct.unpack('<%iL' % (m >> 2), s))  
-    if w: v.append(n)  
-    return v  
-  
-def encrypt(str, key):  
-    if str == '': return str  
-    v = _str2long(str, True)  
-    k = _str2long(key.ljust(16, "\0"), False)  
-    n = len(v) - 1  
-    z = v[n]  
-    y = v[0]  
-    sum = 0  
-    q = 6 + 52 // (n + 1)  
-    while q > 0:  
-        sum = (sum + _DELTA) & 0xffffffff  
-        e = sum >> 2 & 3  
-        for p in xrange(n):  
-            y = v[p + 1]  
-            v[p] = (v[p] + ((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4) ^ (sum ^ y) + (k[p & 3 ^ e] ^ z))) & 0xffffffff  
-            z = v[p]  
-        y = v[0]  
-        v[n] = (v[n] + ((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4) ^ (sum ^ y) + (k[n & 3 ^ e] ^ z))) & 0xffffffff  
-        z = v[n]  
-        q -= 1  
-    return _long2str(v, False)  
-  
-def decrypt(str, key):  
-    if str == '': return str  
-    v = _str2long(str, False)  
-    k = _str2long(key.ljust(16, "\0"), False)  
-    n = len(v) - 1  
-    z = v[n]  
-    y = v[0]  
-    q = 6 + 52 // (n + 1)  
-    sum = (q * _DELTA) & 0xffffffff  
-    while (sum != 0):  
-        e = sum >> 2 & 3  
-        for p in xrange(n, 0, -1):  
-            z = v[p - 1]  
-            v[p] = (v[p] - ((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4) ^ (sum ^ y) + (k[p & 3 ^ e] ^ z))) & 0xffffffff  
-            y = v[p]  
-        z = v[n]  
-        v[0] = (v[0] - ((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4) ^ (sum ^ y) + (k[0 & 3 ^ e] ^ z))) & 0xffffffff  
-        y = v[0]  
-        sum = (sum - _DELTA) & 0xffffffff  
-    return _long2str(v, True)  
+from xxtea_engine import encrypt, decrypt
+from lua_crypt import write_file_atomically, CCPluginLuaEncrypt, CCPluginLuaDecrypt
 
 
+class LuaJITCompileServer(object):
+    """
+    A long-lived luajit process running bin/compile_server.lua.
+    It compiles the files sent through stdin, which saves launching
+    a shell and a luajit process for every lua file.
+    """
+    def __init__(self, luajit_exe_path, luajit_dir, server_script):
+        self._proc = subprocess.Popen([luajit_exe_path, server_script],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      cwd=luajit_dir, close_fds=not cocos.os_is_win32())
+
+    def compile(self, lua_file, output_file):
+        self._proc.stdin.write("%s\t%s\n" % (lua_file, output_file))
+        self._proc.stdin.flush()
+        ret = self._proc.stdout.readline()
+        if len(ret) == 0:
+            raise cocos.CCPluginError(MultiLanguage.get_string('LUACOMPILE_ERROR_COMPILE_SERVER_EXITED'),
+                                      cocos.CCPluginError.ERROR_RUNNING_CMD)
+
+        ret = ret.rstrip("\r\n")
+        if ret != "OK":
+            raise cocos.CCPluginError(ret[len("ERR "):], cocos.CCPluginError.ERROR_BUILD_FAILED)
+
+    def close(self):
+        if self._proc is None:
+            return
+
+        self._proc.stdin.close()
+        self._proc.wait()
+        self._proc = None
+
+
+# compile servers of current process, only one for each luajit
+_compile_servers = {}
+
+def _get_compile_server(luajit_exe_path, luajit_dir, server_script):
+    key = (luajit_exe_path, server_script)
+    if key not in _compile_servers:
+        _compile_servers[key] = LuaJITCompileServer(luajit_exe_path, luajit_dir, server_script)
+    return _compile_servers[key]
+
+def _close_compile_servers():
+    for key in _compile_servers.keys():
+        _compile_servers.pop(key).close()
+
+def _init_worker_process():
+    # close the compile servers when the worker process exits
+    from multiprocessing.util import Finalize
+    Finalize(None, _close_compile_servers, exitpriority=10)
+
+
+def _process_lua_file(unit):
+    """
+    Compiles and/or encrypts one lua file. Runs in the worker processes,
+    so it only takes plain data and returns the error message on failure.
+    """
+    (lua_file, dst_lua_file, luajit_exe_path, luajit_dir, compile_server,
+     disable_compile, is_encrypt, encrypt_key, encrypt_sign, verbose, log_path) = unit
+    try:
+        if disable_compile:
+            shutil.copy(lua_file, dst_lua_file)
+        elif compile_server is not None:
+            cocos.Logging.debug(MultiLanguage.get_string('LUACOMPILE_DEBUG_COMPILE_FILE_FMT', lua_file))
+            _get_compile_server(luajit_exe_path, luajit_dir, compile_server).compile(lua_file, dst_lua_file)
+        else:
+            cocos.Logging.debug(MultiLanguage.get_string('LUACOMPILE_DEBUG_COMPILE_FILE_FMT', lua_file))
+            cmd_str = "\"%s\" -b \"%s\" \"%s\"" % (luajit_exe_path, lua_file, dst_lua_file)
+            cocos.CMDRunner.run_cmd(cmd_str, verbose, luajit_dir, log_path)
+
+        if is_encrypt:
+            bytesFile = open(dst_lua_file, "rb")
+            encryBytes = encrypt(bytesFile.read(), encrypt_key)
+            bytesFile.close()
+            write_file_atomically(dst_lua_file, encrypt_sign + encryBytes)
+    except Exception as e:
+        return (lua_file, ' '.join([str(arg) for arg in e.args]))
+
+    return None
+
 
 #import cocos
 class CCPluginLuaCompile(cocos.CCPlugin):
     """
     compiles (encodes) and minifies Lua files
     """
+    MANIFEST_FILE_NAME = ".luacompile_manifest.json"
+
     @staticmethod
     def plugin_name():
         return "luacompile"
@@ -125,6 +143,10 @@ class CCPluginLuaCompile(cocos.CCPlugin):
         self._encryptkey = options.encryptkey
         self._encryptsign = options.encryptsign
         self._bytecode_64bit = options.bytecode_64bit
+        if options.jobs is not None and options.jobs > 0:
+            self._jobs = options.jobs
+        else:
+            self._jobs = cocos.get_num_of_cpu()
 
         self._luajit_exe_path = self.get_luajit_path()
         self._disable_compile = options.disable_compile
@@ -134,6 +156,15 @@ class CCPluginLuaCompile(cocos.CCPlugin):
                                       cocos.CCPluginError.ERROR_TOOLS_NOT_FOUND)
 
         self._luajit_dir = os.path.dirname(self._luajit_exe_path)
+        self._rebuild = options.rebuild
+        if options.compile_server:
+            self._compile_server = os.path.join(self._workingdir, "bin", "compile_server.lua")
+        else:
+            self._compile_server = None
+        self._manifest_path = os.path.join(self._dst_dir, CCPluginLuaCompile.MANIFEST_FILE_NAME)
+        self._watch = options.watch
+        # the output of luajit for all the files
+        self._log_path = cocos.CMDRunner.new_log_path(self.__class__.plugin_name())
 
     def normalize_path_in_list(self, list):
         for i in list:
@@ -199,9 +230,8 @@ class CCPluginLuaCompile(cocos.CCPlugin):
         """
         cocos.Logging.debug(MultiLanguage.get_string('LUACOMPILE_DEBUG_COMPILE_FILE_FMT', lua_file))
 
-        with cocos.pushd(self._luajit_dir):
-            cmd_str = "\"%s\" -b \"%s\" \"%s\"" % (self._luajit_exe_path, lua_file, output_file)
-            self._run_cmd(cmd_str)
+        cmd_str = "\"%s\" -b \"%s\" \"%s\"" % (self._luajit_exe_path, lua_file, output_file)
+        self._run_cmd(cmd_str, self._luajit_dir, self._log_path)
 
     # TODO
     # def compress_js(self):
@@ -221,6 +251,36 @@ class CCPluginLuaCompile(cocos.CCPlugin):
     # def _lua_filename_compare(self, a, b, files, delta):
     # def reorder_lua_files(self):
 
+    def get_build_params(self):
+        """
+        The parameters which affect the content of output files.
+        If any of them changed, all the lua files should be processed again.
+        """
+        params = {
+            "disable_compile": self._disable_compile,
+            "bytecode_64bit": self._bytecode_64bit,
+            "encrypt": self._isEncrypt,
+        }
+
+        if not self._disable_compile:
+            luajit_stat = os.stat(self._luajit_exe_path)
+            params["luajit"] = [self._luajit_exe_path, luajit_stat.st_size, luajit_stat.st_mtime]
+
+        if self._isEncrypt:
+            # the manifest may be shipped with the output files, so only a digest of the key is kept
+            params["encrypt_digest"] = hashlib.sha1(self._encryptkey + '\0' + self._encryptsign).hexdigest()
+
+        return params
+
+    def remove_stale_outputs(self, manifest):
+        """
+        Removes the output files whose source files are removed.
+        """
+        for rel_path in manifest.removed_entries():
+            dst_lua_file = os.path.join(self._dst_dir, rel_path)
+            if os.path.isfile(dst_lua_file):
+                os.remove(dst_lua_file)
+
     def handle_all_lua_files(self):
         """
         Arguments:
@@ -228,26 +288,64 @@ class CCPluginLuaCompile(cocos.CCPlugin):
         """
 
         cocos.Logging.info(MultiLanguage.get_string('LUACOMPILE_INFO_PROCESS_FILE'))
-        index = 0
+        manifest = utils.BuildManifest(self._manifest_path, self.get_build_params(), self._rebuild)
+        up_to_date_count = 0
+        pending_files = {}
+        units = []
         for src_dir in self._src_dir_arr:
             for lua_file in self._lua_files[src_dir]:
                 self._current_src_dir = src_dir
                 dst_lua_file = self.get_output_file_path(lua_file)
-                if self._disable_compile:
-                    shutil.copy(lua_file, dst_lua_file)
-                else:
-                    self.compile_lua(lua_file, dst_lua_file)                   
-
-                if self._isEncrypt == True:
-                    bytesFile = open(dst_lua_file, "rb+")
-                    encryBytes = encrypt(bytesFile.read(), self._encryptkey)
-                    encryBytes = self._encryptsign + encryBytes
-                    bytesFile.seek(0)
-                    bytesFile.write(encryBytes)
-                    bytesFile.close()
-                    index = index + 1
-
-
+                rel_path = os.path.relpath(dst_lua_file, self._dst_dir).replace("\\", "/")
+                if manifest.check(rel_path, lua_file, [ dst_lua_file ]):
+                    up_to_date_count += 1
+                    continue
+
+                pending_files[lua_file] = rel_path
+                units.append((lua_file, dst_lua_file, self._luajit_exe_path, self._luajit_dir,
+                              self._compile_server, self._disable_compile, self._isEncrypt,
+                              self._encryptkey, self._encryptsign, self._verbose, self._log_path))
+
+        if up_to_date_count > 0:
+            cocos.Logging.info(MultiLanguage.get_string('LUACOMPILE_INFO_SKIP_UP_TO_DATE_FMT', up_to_date_count))
+
+        jobs = min(self._jobs, len(units))
+        if isinstance(sys.stdout, cocos.ThreadOutput):
+            # several builds are running in threads, forking the worker processes while the other
+            # threads hold the locks of the output may deadlock them, see "cocos compile -p a,b"
+            jobs = 1
+        if jobs > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(jobs, _init_worker_process)
+            try:
+                # use get() with a timeout, so Ctrl-C can interrupt the waiting
+                results = pool.map_async(_process_lua_file, units).get(0xFFFFFFF)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            try:
+                results = [_process_lua_file(unit) for unit in units]
+            finally:
+                _close_compile_servers()
+
+        failed = [ret for ret in results if ret is not None]
+        failed_files = set([lua_file for (lua_file, msg) in failed])
+        for lua_file in pending_files:
+            if lua_file not in failed_files:
+                manifest.update(pending_files[lua_file])
+
+        self.remove_stale_outputs(manifest)
+        manifest.save()
+
+        if len(failed) > 0:
+            details = '\n'.join(["%s: %s" % (lua_file, msg) for (lua_file, msg) in failed])
+            raise cocos.CCPluginError(MultiLanguage.get_string('LUACOMPILE_ERROR_FILES_FAILED_FMT',
+                                                               (len(failed), details)),
+                                      cocos.CCPluginError.ERROR_BUILD_FAILED)
 
     def run(self, argv, dependencies):
         """
@@ -265,12 +363,27 @@ class CCPluginLuaCompile(cocos.CCPlugin):
                                                                    self._dst_dir),
                                           cocos.CCPluginError.ERROR_PATH_NOT_FOUND)
 
+        self.collect_lua_files()
+        self.handle_all_lua_files()
+
+        cocos.Logging.info(MultiLanguage.get_string('LUACOMPILE_INFO_FINISHED'))
+
+        if self._watch:
+            import cocos_watch
+            folders = [ (src_dir, True) for src_dir in self._src_dir_arr ]
+            cocos_watch.watch(folders, self.on_lua_files_changed, [ '.lua' ], [ self._dst_dir ])
+
+    def collect_lua_files(self):
         # deep iterate the src directory
         for src_dir in self._src_dir_arr:
             self._current_src_dir = src_dir
             self._lua_files[self._current_src_dir] = []
             self.deep_iterate_dir(src_dir)
 
+    def on_lua_files_changed(self, changed_files):
+        # the added & removed files are found by iterating the src directory again,
+        # only the changed files are compiled according to the manifest
+        self.collect_lua_files()
         self.handle_all_lua_files()
 
         cocos.Logging.info(MultiLanguage.get_string('LUACOMPILE_INFO_FINISHED'))
@@ -307,6 +420,18 @@ class CCPluginLuaCompile(cocos.CCPlugin):
         parser.add_argument("--bytecode-64bit",
                           action="store_true", dest="bytecode_64bit", default=False,
                           help=MultiLanguage.get_string('LUACOMPILE_ARG_BYTECODE_64BIT'))
+        parser.add_argument("-j", "--jobs",
+                          dest="jobs", type=int,
+                          help=MultiLanguage.get_string('LUACOMPILE_ARG_JOBS'))
+        parser.add_argument("--rebuild",
+                          action="store_true", dest="rebuild", default=False,
+                          help=MultiLanguage.get_string('LUACOMPILE_ARG_REBUILD'))
+        parser.add_argument("--compile-server",
+                          action="store_true", dest="compile_server", default=False,
+                          help=MultiLanguage.get_string('LUACOMPILE_ARG_COMPILE_SERVER'))
+        parser.add_argument("--watch",
+                          action="store_true", dest="watch", default=False,
+                          help=MultiLanguage.get_string('LUACOMPILE_ARG_WATCH'))
 
         options = parser.parse_args(argv)
 
@@ -0,0 +1,44 @@
+-- ----------------------------------------------------------------------------
+-- compile_server.lua: long-lived luajit compiler used by "cocos luacompile"
+--
+-- License: MIT
+-- ----------------------------------------------------------------------------
+-- Reads requests "<lua file>\t<output file>" from stdin, one per line.
+-- Each lua file is compiled to stripped bytecode, the same as
+-- "luajit -b <lua file> <output file>" does for raw output files.
+-- Answers "OK" or "ERR <message>" on stdout, one line per request.
+
+local function compile(src, dst)
+  local f, err = loadfile(src)
+  if not f then return err end
+
+  local s = string.dump(f, true)
+  local fp
+  fp, err = io.open(dst, "wb")
+  if not fp then return "cannot open " .. dst .. ": " .. tostring(err) end
+
+  local ok
+  ok, err = fp:write(s)
+  fp:close()
+  if not ok then return "cannot write " .. dst .. ": " .. tostring(err) end
+
+  return nil
+end
+
+for line in io.lines() do
+  line = string.gsub(line, "\r$", "")
+  local src, dst = string.match(line, "^([^\t]+)\t([^\t]+)$")
+  local err
+  if src then
+    err = compile(src, dst)
+  else
+    err = "bad request: " .. line
+  end
+
+  if err then
+    io.stdout:write("ERR ", (string.gsub(tostring(err), "[\r\n]", " ")), "\n")
+  else
+    io.stdout:write("OK\n")
+  end
+  io.stdout:flush()
+end
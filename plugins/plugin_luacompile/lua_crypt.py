@@ -0,0 +1,255 @@
+#!/usr/bin/python
+# ----------------------------------------------------------------------------
+# cocos "luaencrypt" & "luadecrypt" plugins
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+'''
+"luaencrypt" & "luadecrypt" plugins for cocos command line tool
+'''
+
+__docformat__ = 'restructuredtext'
+
+import os
+import stat
+import shutil
+import tempfile
+
+import cocos
+from MultiLanguage import MultiLanguage
+
+from xxtea_engine import encrypt, decrypt
+
+DEFAULT_ENCRYPT_KEY = "2dxLua"
+DEFAULT_ENCRYPT_SIGN = "XXTEA"
+
+# the mode of a new file created by open(), os.umask() can only be read by changing it
+_umask = os.umask(0)
+os.umask(_umask)
+_NEW_FILE_MODE = 0o666 & ~_umask
+
+
+def write_file_atomically(file_path, data):
+    """
+    Writes the data into a temp file in the same folder, then renames it to the target path.
+    So the target file is never left half written.
+    """
+    dst_dir = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=dst_dir)
+    try:
+        f = os.fdopen(fd, "wb")
+        try:
+            f.write(data)
+        finally:
+            f.close()
+
+        # mkstemp creates the file readable by the owner only, use the mode of a normal file instead
+        if os.path.exists(file_path):
+            mode = stat.S_IMODE(os.stat(file_path).st_mode)
+        else:
+            mode = _NEW_FILE_MODE
+        os.chmod(tmp_path, mode)
+
+        if cocos.os_is_win32() and os.path.exists(file_path):
+            # os.rename can't overwrite an existing file on windows
+            os.remove(file_path)
+        os.rename(tmp_path, file_path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def encrypt_file(src_file, dst_file, key, sign):
+    """
+    Encrypts the src file into dst file. Returns False if the src file is already encrypted.
+    """
+    f = open(src_file, "rb")
+    data = f.read()
+    f.close()
+
+    if len(sign) > 0 and data.startswith(sign):
+        return False
+
+    write_file_atomically(dst_file, sign + encrypt(data, key))
+    return True
+
+
+def decrypt_file(src_file, dst_file, key, sign):
+    """
+    Decrypts the src file into dst file. Returns False if the src file is not encrypted with the sign.
+    """
+    f = open(src_file, "rb")
+    data = f.read()
+    f.close()
+
+    if not data.startswith(sign):
+        return False
+
+    data = data[len(sign):]
+    decrypted = decrypt(data, key)
+    if len(data) > 0 and len(decrypted) == 0:
+        raise cocos.CCPluginError(MultiLanguage.get_string('LUADECRYPT_ERROR_WRONG_KEY'),
+                                  cocos.CCPluginError.ERROR_PARSE_FILE)
+
+    write_file_atomically(dst_file, decrypted)
+    return True
+
+
+class _LuaCryptPlugin(cocos.CCPlugin):
+    """
+    Common parts of the luaencrypt & luadecrypt plugins
+    """
+    LUA_FILE_EXTS = [ ".lua", ".luac" ]
+
+    def _process_file(self, src_file, dst_file):
+        pass
+
+    def _skipped_message(self, count):
+        pass
+
+    def init(self, options):
+        self._verbose = options.verbose
+        self._src_arr = [ os.path.abspath(os.path.normpath(src)) for src in options.src_arr ]
+        if options.dst_dir is None:
+            self._dst_dir = None
+        else:
+            self._dst_dir = os.path.abspath(options.dst_dir)
+        self._key = options.encryptkey
+        self._sign = options.encryptsign
+
+    def gather_files(self):
+        """
+        Returns a list of (src_file, dst_file).
+        The files are processed in place if the destination directory is not specified.
+        """
+        ret = []
+        for src in self._src_arr:
+            if os.path.isfile(src):
+                if self._dst_dir is None:
+                    ret.append((src, src))
+                else:
+                    ret.append((src, os.path.join(self._dst_dir, os.path.basename(src))))
+                continue
+
+            for root, dirs, files in os.walk(src):
+                dirs.sort()
+                for name in sorted(files):
+                    if os.path.splitext(name)[1] not in _LuaCryptPlugin.LUA_FILE_EXTS:
+                        continue
+
+                    src_file = os.path.join(root, name)
+                    if self._dst_dir is None:
+                        dst_file = src_file
+                    else:
+                        dst_file = os.path.join(self._dst_dir, os.path.relpath(src_file, src))
+                    ret.append((src_file, dst_file))
+
+        return ret
+
+    def run(self, argv, dependencies):
+        self.parse_args(argv)
+
+        processed = 0
+        skipped = 0
+        failed = []
+        for (src_file, dst_file) in self.gather_files():
+            if self._verbose:
+                cocos.Logging.debug(MultiLanguage.get_string('LUAENCRYPT_DEBUG_PROCESS_FILE_FMT', src_file))
+
+            try:
+                dst_dir = os.path.dirname(dst_file)
+                if not os.path.isdir(dst_dir):
+                    os.makedirs(dst_dir)
+
+                if self._process_file(src_file, dst_file):
+                    processed += 1
+                else:
+                    skipped += 1
+                    # the output folder should have all the files, the skipped ones are copied as they are
+                    if os.path.normcase(src_file) != os.path.normcase(dst_file):
+                        shutil.copy(src_file, dst_file)
+            except Exception as e:
+                failed.append("%s: %s" % (src_file, ' '.join([str(arg) for arg in e.args])))
+
+        if skipped > 0:
+            cocos.Logging.warning(self._skipped_message(skipped))
+
+        if len(failed) > 0:
+            raise cocos.CCPluginError(MultiLanguage.get_string('LUAENCRYPT_ERROR_FILES_FAILED_FMT',
+                                                               (len(failed), '\n'.join(failed))),
+                                      cocos.CCPluginError.ERROR_OTHERS)
+
+        cocos.Logging.info(MultiLanguage.get_string('LUAENCRYPT_INFO_FINISHED_FMT', processed))
+
+    def parse_args(self, argv):
+        from argparse import ArgumentParser
+
+        parser = ArgumentParser(prog="cocos %s" % self.__class__.plugin_name(),
+                                description=self.__class__.brief_description())
+
+        parser.add_argument("-v", "--verbose",
+                          action="store_true",
+                          dest="verbose",
+                          help=MultiLanguage.get_string('LUACOMPILE_ARG_VERBOSE'))
+        parser.add_argument("-s", "--src", dest="src_arr",
+                          action="append", help=MultiLanguage.get_string('LUAENCRYPT_ARG_SRC'))
+        parser.add_argument("-d", "--dst", dest="dst_dir",
+                          help=MultiLanguage.get_string('LUAENCRYPT_ARG_DST'))
+        parser.add_argument("-k", "--encryptkey",
+                          dest="encryptkey", default=DEFAULT_ENCRYPT_KEY,
+                          help=MultiLanguage.get_string('LUACOMPILE_ARG_ENCRYPT_KEY'))
+        parser.add_argument("-b", "--encryptsign",
+                          dest="encryptsign", default=DEFAULT_ENCRYPT_SIGN,
+                          help=MultiLanguage.get_string('LUACOMPILE_ARG_ENCRYPT_SIGN'))
+
+        options = parser.parse_args(argv)
+
+        if options.src_arr is None:
+            raise cocos.CCPluginError(MultiLanguage.get_string('LUACOMPILE_ERROR_SRC_NOT_SPECIFIED'),
+                                      cocos.CCPluginError.ERROR_WRONG_ARGS)
+
+        for src in options.src_arr:
+            if not os.path.exists(src):
+                raise cocos.CCPluginError(MultiLanguage.get_string('LUACOMPILE_ERROR_DIR_NOT_EXISTED_FMT', src),
+                                          cocos.CCPluginError.ERROR_PATH_NOT_FOUND)
+
+        self.init(options)
+
+
+class CCPluginLuaEncrypt(_LuaCryptPlugin):
+    """
+    encrypts Lua files (or bytecode files) by XXTEA
+    """
+    @staticmethod
+    def plugin_name():
+        return "luaencrypt"
+
+    @staticmethod
+    def brief_description():
+        return MultiLanguage.get_string('LUAENCRYPT_BRIEF')
+
+    def _process_file(self, src_file, dst_file):
+        return encrypt_file(src_file, dst_file, self._key, self._sign)
+
+    def _skipped_message(self, count):
+        return MultiLanguage.get_string('LUAENCRYPT_INFO_SKIP_ENCRYPTED_FMT', count)
+
+
+class CCPluginLuaDecrypt(_LuaCryptPlugin):
+    """
+    decrypts the Lua files (or bytecode files) encrypted by XXTEA
+    """
+    @staticmethod
+    def plugin_name():
+        return "luadecrypt"
+
+    @staticmethod
+    def brief_description():
+        return MultiLanguage.get_string('LUADECRYPT_BRIEF')
+
+    def _process_file(self, src_file, dst_file):
+        return decrypt_file(src_file, dst_file, self._key, self._sign)
+
+    def _skipped_message(self, count):
+        return MultiLanguage.get_string('LUADECRYPT_INFO_SKIP_NOT_ENCRYPTED_FMT', (count, self._sign))
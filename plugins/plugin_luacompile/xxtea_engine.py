@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# ----------------------------------------------------------------------------
+# XXTEA engines for the "luacompile" plugin
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+'''
+XXTEA encryption used by luacompile.
+
+The C implementation from the optional "xxtea" package (pip install xxtea)
+is used when it is installed and gives the same output as the pure python
+implementation. Otherwise the pure python implementation is used.
+
+Run this file directly to check the engines and compare their throughput.
+'''
+
+from __future__ import absolute_import
+
+import struct
+
+############################################################
+#http://www.coolcode.org/archives/?article-307.html
+############################################################
+
+_DELTA = 0x9E3779B9
+
+def _long2str(v, w):
+    n = (len(v) - 1) << 2
+    if w:
+        m = v[-1]
+        if (m < n - 3) or (m > n): return ''
+        n = m
+    s = struct.pack('<%iL' % len(v), *v)
+    return s[0:n] if w else s
+
+def _str2long(s, w):
+    n = len(s)
+    m = (4 - (n & 3) & 3) + n
+    s = s.ljust(m, "\0")
+    v = list(struct.unpack('<%iL' % (m >> 2), s))
+    if w: v.append(n)
+    return v
+
+def py_encrypt(str, key):
+    if str == '': return str
+    v = _str2long(str, True)
+    k = _str2long(key.ljust(16, "\0"), False)
+    n = len(v) - 1
+    z = v[n]
+    y = v[0]
+    sum = 0
+    q = 6 + 52 // (n + 1)
+    while q > 0:
+        sum = (sum + _DELTA) & 0xffffffff
+        e = sum >> 2 & 3
+        for p in xrange(n):
+            y = v[p + 1]
+            v[p] = (v[p] + ((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4) ^ (sum ^ y) + (k[p & 3 ^ e] ^ z))) & 0xffffffff
+            z = v[p]
+        y = v[0]
+        v[n] = (v[n] + ((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4) ^ (sum ^ y) + (k[n & 3 ^ e] ^ z))) & 0xffffffff
+        z = v[n]
+        q -= 1
+    return _long2str(v, False)
+
+def py_decrypt(str, key):
+    if str == '': return str
+    v = _str2long(str, False)
+    k = _str2long(key.ljust(16, "\0"), False)
+    n = len(v) - 1
+    z = v[n]
+    y = v[0]
+    q = 6 + 52 // (n + 1)
+    sum = (q * _DELTA) & 0xffffffff
+    while (sum != 0):
+        e = sum >> 2 & 3
+        for p in xrange(n, 0, -1):
+            z = v[p - 1]
+            v[p] = (v[p] - ((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4) ^ (sum ^ y) + (k[p & 3 ^ e] ^ z))) & 0xffffffff
+            y = v[p]
+        z = v[n]
+        v[0] = (v[0] - ((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4) ^ (sum ^ y) + (k[0 & 3 ^ e] ^ z))) & 0xffffffff
+        y = v[0]
+        sum = (sum - _DELTA) & 0xffffffff
+    return _long2str(v, True)
+
+
+try:
+    import xxtea as _xxtea_c
+except ImportError:
+    _xxtea_c = None
+
+
+def _c_key(key):
+    # only the first 4 words of the key are used by the algorithm
+    return key.ljust(16, "\0")[0:16]
+
+def c_encrypt(str, key):
+    if str == '': return str
+    n = len(str)
+    data = str.ljust((4 - (n & 3) & 3) + n, "\0") + struct.pack('<L', n)
+    return _xxtea_c.encrypt(data, _c_key(key), padding=False)
+
+def c_decrypt(str, key):
+    if str == '': return str
+    n = len(str)
+    if n < 8:
+        # the C engine needs 2 words at least
+        return py_decrypt(str, key)
+    data = str.ljust((4 - (n & 3) & 3) + n, "\0")
+    v = _xxtea_c.decrypt(data, _c_key(key), padding=False)
+    n = len(v) - 4
+    m = struct.unpack('<L', v[n:])[0]
+    if (m < n - 3) or (m > n): return ''
+    return v[0:m]
+
+def _c_engine_works():
+    try:
+        for data in ("a", "2dx", "cocos", "\0" * 7, "LuaQ\x1b" * 33):
+            for key in ("", "2dxLua", "a key longer than 16 bytes"):
+                encrypted = c_encrypt(data, key)
+                if encrypted != py_encrypt(data, key):
+                    return False
+                if c_decrypt(encrypted, key) != data:
+                    return False
+    except Exception:
+        return False
+
+    return True
+
+
+if _xxtea_c is not None and _c_engine_works():
+    ENGINE_NAME = "c"
+    encrypt = c_encrypt
+    decrypt = c_decrypt
+else:
+    ENGINE_NAME = "python"
+    encrypt = py_encrypt
+    decrypt = py_decrypt
+
+
+def benchmark(sizes=(1024, 64 * 1024, 1024 * 1024), key="2dxLua"):
+    """
+    Checks the round-trip of every available engine against the pure python
+    implementation, and prints the throughput of them.
+    """
+    import os
+    import time
+
+    engines = [("python", py_encrypt, py_decrypt)]
+    if _xxtea_c is not None:
+        engines.append(("c", c_encrypt, c_decrypt))
+
+    print("selected engine: %s" % ENGINE_NAME)
+    for size in sizes:
+        data = os.urandom(size)
+        expected = py_encrypt(data, key)
+        for (name, enc, dec) in engines:
+            start = time.time()
+            encrypted = enc(data, key)
+            cost = max(time.time() - start, 1e-6)
+            if encrypted != expected or dec(encrypted, key) != data:
+                raise Exception("engine '%s' failed the round-trip of %d bytes" % (name, size))
+            print("%-8s %10d bytes %10.3f ms %10.2f MB/s" % (name, size, cost * 1000,
+                                                          size / cost / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    benchmark()
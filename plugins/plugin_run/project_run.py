@@ -16,11 +16,13 @@ import sys
 import os
 import cocos
 from MultiLanguage import MultiLanguage
-import BaseHTTPServer
 import webbrowser
 import threading
 import subprocess
 import re
+import json
+
+from web_server import DevServer
 
 class CCPluginRun(cocos.CCPlugin):
     """
@@ -56,6 +58,8 @@ class CCPluginRun(cocos.CCPlugin):
                           help=MultiLanguage.get_string('RUN_ARG_NO_CONSOLE'))
         group.add_argument("--working-dir", dest="working_dir", default='',
                           help=MultiLanguage.get_string('RUN_ARG_WORKING_DIR'))
+        group.add_argument("--watch", action="store_true", dest="watch", default=False,
+                          help=MultiLanguage.get_string('RUN_ARG_WATCH'))
 
     def _check_custom_options(self, args):
         self._port = args.port
@@ -65,6 +69,7 @@ class CCPluginRun(cocos.CCPlugin):
         self._param = args.param
         self._no_console = args.no_console
         self._working_dir = args.working_dir
+        self._watch = args.watch
 
     def get_ios_sim_name(self):
         # get the version of xcodebuild
@@ -252,12 +257,6 @@ class CCPluginRun(cocos.CCPlugin):
         if not self._platforms.is_web_active():
             return
 
-        from SimpleHTTPServer import SimpleHTTPRequestHandler
-        HandlerClass = SimpleHTTPRequestHandler
-        ServerClass  = BaseHTTPServer.HTTPServer
-        Protocol     = "HTTP/1.0"
-        HandlerClass.protocol_version = Protocol
-
         host = self._host
         if self._port is None:
             port = 8000
@@ -277,7 +276,7 @@ class CCPluginRun(cocos.CCPlugin):
             server_address = (host, port)
             try:
                 cocos.Logging.info(MultiLanguage.get_string('RUN_INFO_HOST_PORT_FMT', (host, port)))
-                httpd = ServerClass(server_address, HandlerClass)
+                httpd = DevServer(server_address, run_root, live_reload=self._watch)
             except Exception as e:
                 httpd = None
                 cocos.Logging.warning(MultiLanguage.get_string('RUN_WARNING_SERVER_FAILED_FMT', (host, port, e)))
@@ -296,9 +295,66 @@ class CCPluginRun(cocos.CCPlugin):
         thread.start()
 
         sa = httpd.socket.getsockname()
-        with cocos.pushd(run_root):
-            cocos.Logging.info(MultiLanguage.get_string('RUN_INFO_SERVING_FMT', (sa[0], sa[1])))
+        cocos.Logging.info(MultiLanguage.get_string('RUN_INFO_SERVING_FMT', (sa[0], sa[1])))
+        if not self._watch:
             httpd.serve_forever()
+            return
+
+        server_thread = Thread(target=httpd.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        try:
+            self._watch_web(deploy_dep.compile_dep, httpd)
+        finally:
+            httpd.shutdown()
+
+    def _get_web_watched_folders(self, project_dir):
+        """
+        The project folder itself (index.html, main.js, project.json), the folders of the js files
+        & the resources.
+        """
+        top_dirs = set()
+        f = open(os.path.join(project_dir, "project.json"))
+        try:
+            project_json = json.load(f)
+        finally:
+            f.close()
+        for js_file in project_json.get("jsList", []):
+            top_dirs.add(js_file.replace("\\", "/").split("/")[0])
+
+        cfg_obj = self._platforms.get_current_config()
+        copy_res = cfg_obj.copy_res
+        if copy_res is None:
+            copy_res = [ { "from" : "res" } ]
+        for cfg in copy_res:
+            top_dirs.add(cfg["from"].replace("\\", "/").split("/")[0])
+
+        folders = [ (project_dir, False) ]
+        for name in sorted(top_dirs):
+            path = os.path.join(project_dir, name)
+            if os.path.isdir(path):
+                folders.append((path, True))
+
+        return folders
+
+    def _watch_web(self, compile_dep, httpd):
+        import cocos_watch
+
+        project_dir = self._platforms.project_path()
+        # the published files are changed by the build, and the engine has too many folders
+        excluded = [ os.path.join(project_dir, compile_dep.OUTPUT_DIR_SCRIPT_DEBUG),
+                     os.path.join(project_dir, compile_dep.OUTPUT_DIR_SCRIPT_RELEASE),
+                     os.path.join(project_dir, "frameworks") ]
+
+        def on_changed(changed_files):
+            # only the changed files are published again,
+            # nothing is built in debug mode since the source files are served
+            compile_dep.build_web()
+            paths = [ os.path.relpath(path, project_dir).replace("\\", "/") for path in sorted(changed_files) ]
+            count = httpd.notify_reload(paths)
+            cocos.Logging.info(MultiLanguage.get_string('RUN_INFO_RELOAD_PAGES_FMT', count))
+
+        cocos_watch.watch(self._get_web_watched_folders(project_dir), on_changed, excluded=excluded)
 
     def run_win32(self, dependencies):
         if not self._platforms.is_win32_active():
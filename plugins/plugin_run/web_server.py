@@ -0,0 +1,588 @@
+#!/usr/bin/python
+# ----------------------------------------------------------------------------
+# web_server: the local web server of "cocos run -p web"
+#
+# License: MIT
+# ----------------------------------------------------------------------------
+'''
+A threaded HTTP/1.1 server for the web projects.
+
+The connections are kept alive, and each connection is handled in its own thread,
+so the browser can load the resources of a game in parallel. The files are sent by
+sendfile() if the system supports it. The responses have an ETag & a Last-Modified
+header, so the browser revalidates the files instead of loading them again.
+The js & json files are compressed by gzip, and the compressed data is cached
+until the file is modified.
+
+With live reload, a script is added into the html pages which listens to the server-sent
+events of LIVE_RELOAD_PATH, and reloads the page when notify_reload() is called.
+
+Only the standard modules are used, run this file to benchmark the server:
+
+    python web_server.py <folder to serve> [--clients N] [--rounds N]
+'''
+
+import os
+import sys
+import time
+import gzip
+import errno
+import select
+import socket
+import urllib
+import urlparse
+import posixpath
+import threading
+import collections
+import json
+import Queue
+import BaseHTTPServer
+import SocketServer
+from email.utils import parsedate_tz, mktime_tz
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+# the file types which are compressed by gzip
+GZIP_TYPES = frozenset([ '.js', '.json' ])
+
+# compressing the small files is useless
+GZIP_MIN_SIZE = 1024
+
+# the max size of the compressed data kept in memory
+GZIP_CACHE_SIZE = 64 * 1024 * 1024
+
+# seconds to keep an idle connection
+KEEP_ALIVE_TIMEOUT = 30
+
+# the url of the server-sent events which notify the pages to reload
+LIVE_RELOAD_PATH = '/__cocos_live_reload'
+
+# seconds between two comments sent to keep the event streams open
+LIVE_RELOAD_PING_INTERVAL = 15
+
+LIVE_RELOAD_SCRIPT = '<script>(function () {' \
+                     ' if (!window.EventSource) return;' \
+                     ' var source = new EventSource("%s");' \
+                     ' source.addEventListener("reload", function () { source.close(); location.reload(); });' \
+                     ' })();</script>' % LIVE_RELOAD_PATH
+
+
+def _load_sendfile():
+    """
+    Returns sendfile(out_fd, in_fd, offset, count) which returns the count of the bytes sent,
+    or None if the system doesn't support it.
+    """
+    if hasattr(os, 'sendfile'):
+        return os.sendfile
+
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        c_sendfile = libc.sendfile
+    except (ImportError, OSError, AttributeError):
+        return None
+
+    c_sendfile.argtypes = [ ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t ]
+    c_sendfile.restype = ctypes.c_ssize_t
+
+    def sendfile(out_fd, in_fd, offset, count):
+        c_offset = ctypes.c_int64(offset)
+        sent = c_sendfile(out_fd, in_fd, ctypes.byref(c_offset), count)
+        if sent < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return sent
+
+    return sendfile
+
+_sendfile = _load_sendfile()
+
+
+class GzipCache(object):
+    """
+    The compressed data of the files, the least recently used ones are dropped if the cache is full.
+    """
+
+    def __init__(self, max_size=GZIP_CACHE_SIZE):
+        self._max_size = max_size
+        self._size = 0
+        # path -> (size, mtime, compressed data)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _compress(self, path, mtime):
+        buf = StringIO()
+        f = open(path, 'rb')
+        try:
+            gz = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6, mtime=mtime)
+            try:
+                for chunk in iter(lambda: f.read(65536), ''):
+                    gz.write(chunk)
+            finally:
+                gz.close()
+        finally:
+            f.close()
+
+        return buf.getvalue()
+
+    def get(self, path, st):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                if entry[0] == st.st_size and entry[1] == st.st_mtime:
+                    self._entries[path] = entry
+                    return entry[2]
+                self._size -= len(entry[2])
+
+        # compress without the lock, so the other files can be served
+        data = self._compress(path, int(st.st_mtime))
+
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._size -= len(old[2])
+            if len(data) <= self._max_size:
+                self._entries[path] = (st.st_size, st.st_mtime, data)
+                self._size += len(data)
+            while self._size > self._max_size:
+                self._size -= len(self._entries.popitem(last=False)[1][2])
+
+        return data
+
+
+class LiveReload(object):
+    """
+    The event queues of the pages connected to LIVE_RELOAD_PATH.
+    """
+
+    def __init__(self):
+        self._queues = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        events = Queue.Queue()
+        with self._lock:
+            self._queues.add(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            self._queues.discard(events)
+
+    def notify(self, paths):
+        """
+        Sends the reload event with the changed paths, returns the count of the pages notified.
+        """
+        data = json.dumps(paths)
+        with self._lock:
+            for events in self._queues:
+                events.put(data)
+            return len(self._queues)
+
+
+def _inject_live_reload(content):
+    pos = content.lower().rfind('</body>')
+    if pos < 0:
+        return content + LIVE_RELOAD_SCRIPT
+    return content[:pos] + LIVE_RELOAD_SCRIPT + content[pos:]
+
+
+class DevRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the files in the root folder of the server, see the module docstring.
+    """
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+
+    extensions_map = SimpleHTTPRequestHandler.extensions_map.copy()
+    extensions_map.update({
+        '.js': 'application/javascript',
+        '.json': 'application/json',
+        '.plist': 'application/xml',
+        '.wasm': 'application/wasm',
+        '.webp': 'image/webp',
+        '.mp3': 'audio/mpeg',
+        '.ogg': 'audio/ogg',
+        '.m4a': 'audio/mp4'
+    })
+
+    def setup(self):
+        SimpleHTTPRequestHandler.setup(self)
+        # the headers & the body are sent separately, don't wait for the ack of the headers
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def translate_path(self, path):
+        # the same as SimpleHTTPRequestHandler, but relative to the root folder instead of the working dir
+        path = path.split('?', 1)[0]
+        path = path.split('#', 1)[0]
+        trailing_slash = path.rstrip().endswith('/')
+        path = posixpath.normpath(urllib.unquote(path))
+        words = filter(None, path.split('/'))
+        path = self.server.root_dir
+        for word in words:
+            if os.path.dirname(word) or word in (os.curdir, os.pardir):
+                continue
+            path = os.path.join(path, word)
+        if trailing_slash:
+            path += '/'
+        return path
+
+    def log_message(self, format, *args):
+        if self.server.log_requests:
+            SimpleHTTPRequestHandler.log_message(self, format, *args)
+
+    def _accepts_gzip(self):
+        for item in self.headers.get('Accept-Encoding', '').split(','):
+            parts = item.strip().split(';')
+            if parts[0].strip().lower() != 'gzip':
+                continue
+            for param in parts[1:]:
+                name, _, value = param.partition('=')
+                if name.strip() == 'q':
+                    try:
+                        return float(value) > 0
+                    except ValueError:
+                        return False
+            return True
+
+        return False
+
+    def _is_not_modified(self, etag, mtime):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-Modified-Since is ignored if If-None-Match is sent
+            tags = [ tag.strip() for tag in if_none_match.split(',') ]
+            return '*' in tags or etag in tags or ('W/' + etag) in tags
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            date = parsedate_tz(if_modified_since)
+            if date is not None:
+                return int(mtime) <= mktime_tz(date)
+
+        return False
+
+    def _send_simple_response(self, code, headers):
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        if code != 304:
+            self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _send_file_data(self, f, size):
+        out_fd = self.connection.fileno()
+        in_fd = f.fileno()
+        offset = 0
+        while offset < size:
+            try:
+                sent = _sendfile(out_fd, in_fd, offset, size - offset)
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+                # the socket is non-blocking when it has a timeout
+                if len(select.select([], [ out_fd ], [], self.timeout)[1]) == 0:
+                    raise socket.timeout()
+                continue
+            if sent == 0:
+                # the file is truncated while sending it
+                break
+            offset += sent
+
+        if offset < size:
+            # the length is already sent, the connection can't be used any more
+            self.close_connection = 1
+
+    def _serve_events(self):
+        live_reload = self.server.live_reload
+        events = live_reload.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            # the stream has no length, it's finished by closing the connection
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            # reconnect soon if the server is restarted
+            self.wfile.write('retry: 1000\n\n')
+            while True:
+                try:
+                    data = events.get(timeout=LIVE_RELOAD_PING_INTERVAL)
+                except Queue.Empty:
+                    # the closed connections are found by writing to them
+                    self.wfile.write(': ping\n\n')
+                    continue
+                self.wfile.write('event: reload\ndata: %s\n\n' % data)
+        except socket.error:
+            pass
+        finally:
+            live_reload.unsubscribe(events)
+
+    def _serve(self, with_body):
+        if self.server.live_reload is not None and urlparse.urlsplit(self.path).path == LIVE_RELOAD_PATH:
+            self._serve_events()
+            return
+
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            parts = urlparse.urlsplit(self.path)
+            if not parts.path.endswith('/'):
+                # redirect browser - doing basically what apache does
+                new_url = urlparse.urlunsplit((parts[0], parts[1], parts[2] + '/', parts[3], parts[4]))
+                self._send_simple_response(301, [ ('Location', new_url) ])
+                return
+            for index in 'index.html', 'index.htm':
+                index = os.path.join(path, index)
+                if os.path.exists(index):
+                    path = index
+                    break
+            else:
+                f = self.list_directory(path)
+                if f is not None:
+                    try:
+                        if with_body:
+                            self.copyfile(f, self.wfile)
+                    finally:
+                        f.close()
+                return
+
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            self.send_error(404, 'File not found')
+            return
+
+        try:
+            st = os.fstat(f.fileno())
+            etag = '"%x-%x"' % (int(st.st_mtime * 1000), st.st_size)
+            ext = os.path.splitext(path)[1].lower()
+            inject = self.server.live_reload is not None and ext in ('.html', '.htm')
+            use_gzip = ext in GZIP_TYPES and st.st_size >= GZIP_MIN_SIZE and self._accepts_gzip()
+            if use_gzip:
+                etag = etag[:-1] + '-gz"'
+            elif inject:
+                etag = etag[:-1] + '-lr"'
+
+            headers = [
+                ('ETag', etag),
+                ('Last-Modified', self.date_time_string(st.st_mtime)),
+                # the browser revalidates the files every time, the files may be changed at any time
+                ('Cache-Control', 'no-cache'),
+                ('Vary', 'Accept-Encoding')
+            ]
+            if self._is_not_modified(etag, st.st_mtime):
+                self._send_simple_response(304, headers)
+                return
+
+            data = None
+            if use_gzip:
+                data = self.server.gzip_cache.get(path, st)
+            elif inject:
+                data = _inject_live_reload(f.read())
+
+            self.send_response(200)
+            self.send_header('Content-Type', self.guess_type(path))
+            for name, value in headers:
+                self.send_header(name, value)
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+            if data is not None:
+                self.send_header('Content-Length', str(len(data)))
+            else:
+                self.send_header('Content-Length', str(st.st_size))
+            self.end_headers()
+
+            if not with_body:
+                return
+            if data is not None:
+                self.wfile.write(data)
+            elif _sendfile is not None:
+                self._send_file_data(f, st.st_size)
+            else:
+                self.copyfile(f, self.wfile)
+        finally:
+            f.close()
+
+    def do_GET(self):
+        self._serve(True)
+
+    def do_HEAD(self):
+        self._serve(False)
+
+
+class DevServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Serves the files in `root_dir`, each connection is handled in a thread.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, root_dir, log_requests=True, live_reload=False):
+        self.root_dir = os.path.abspath(root_dir)
+        self.log_requests = log_requests
+        self.gzip_cache = GzipCache()
+        self.live_reload = LiveReload() if live_reload else None
+        BaseHTTPServer.HTTPServer.__init__(self, server_address, DevRequestHandler)
+
+    def notify_reload(self, paths):
+        """
+        Reloads the pages opened with live reload. `paths` are the changed files, relative to the root folder.
+        Returns the count of the pages notified.
+        """
+        if self.live_reload is None:
+            return 0
+        return self.live_reload.notify(paths)
+
+
+def _collect_urls(root_dir, max_count):
+    urls = []
+    for root, dirs, files in os.walk(root_dir):
+        dirs[:] = [ name for name in sorted(dirs) if not name.startswith('.') ]
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            rel_path = os.path.relpath(os.path.join(root, name), root_dir).replace('\\', '/')
+            urls.append('/' + urllib.quote(rel_path))
+            if len(urls) >= max_count:
+                return urls
+
+    return urls
+
+
+def _client_task(args):
+    import httplib
+
+    port, urls, index, rounds, keep_alive, revalidate = args
+    conn = None
+    etags = {}
+    requests = 0
+    received = 0
+    errors = 0
+    for i in range(rounds):
+        # the clients request the files in different orders
+        for url in urls[index:] + urls[:index]:
+            if conn is None or not keep_alive:
+                if conn is not None:
+                    conn.close()
+                conn = httplib.HTTPConnection('127.0.0.1', port)
+            headers = { 'Accept-Encoding': 'gzip' }
+            if revalidate and url in etags:
+                headers['If-None-Match'] = etags[url]
+            try:
+                conn.request('GET', url, headers=headers)
+                resp = conn.getresponse()
+                received += len(resp.read())
+                if resp.getheader('etag'):
+                    etags[url] = resp.getheader('etag')
+                if resp.status not in (200, 304):
+                    errors += 1
+                if resp.will_close:
+                    conn.close()
+                    conn = None
+            except (httplib.HTTPException, socket.error):
+                errors += 1
+                conn.close()
+                conn = None
+            requests += 1
+    if conn is not None:
+        conn.close()
+
+    return (requests, received, errors)
+
+
+def _run_clients(port, urls, clients, rounds, keep_alive, revalidate):
+    # the clients run in processes like the browsers, they don't share the GIL with the server
+    import multiprocessing
+    pool = multiprocessing.Pool(clients)
+    try:
+        tasks = [ (port, urls, i, rounds, keep_alive, revalidate) for i in range(clients) ]
+        start = time.time()
+        start_times = os.times()
+        counts = pool.map_async(_client_task, tasks).get(0xFFFFFFF)
+        end_times = os.times()
+        seconds = time.time() - start
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return {
+        'requests': sum([ c[0] for c in counts ]),
+        'bytes': sum([ c[1] for c in counts ]),
+        'errors': sum([ c[2] for c in counts ]),
+        'seconds': seconds,
+        # the cpu time of this process, the server
+        'cpu': (end_times[0] - start_times[0]) + (end_times[1] - start_times[1])
+    }
+
+
+def benchmark(root_dir, clients, rounds, max_files):
+    """
+    Loads the files in `root_dir` by concurrent clients from the old single-threaded HTTP/1.0 server
+    and from DevServer, and prints the requests per second.
+    """
+    urls = _collect_urls(root_dir, max_files)
+    if len(urls) == 0:
+        print('No files in %s' % root_dir)
+        return 1
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        protocol_version = 'HTTP/1.0'
+
+        def translate_path(self, path):
+            return DevRequestHandler.translate_path.im_func(self, path)
+
+        def log_message(self, format, *args):
+            pass
+
+    old_server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), QuietHandler)
+    old_server.root_dir = os.path.abspath(root_dir)
+    new_server = DevServer(('127.0.0.1', 0), root_dir, log_requests=False)
+
+    cases = [
+        ('HTTP/1.0, single thread', old_server, False, False),
+        ('HTTP/1.1 keep-alive, threaded', new_server, True, False),
+        ('HTTP/1.1 keep-alive, revalidate', new_server, True, True)
+    ]
+    print('%d files, %d clients, %d rounds' % (len(urls), clients, rounds))
+    print('%-34s %9s %8s %8s %16s %8s' % ('server', 'requests', 'seconds', 'req/s', 'server cpu/req', 'MB'))
+    for name, server, keep_alive, revalidate in cases:
+        t = threading.Thread(target=server.serve_forever)
+        t.daemon = True
+        t.start()
+        port = server.server_address[1]
+        try:
+            results = _run_clients(port, urls, clients, rounds, keep_alive, revalidate)
+        finally:
+            server.shutdown()
+            t.join()
+        print('%-34s %9d %8.2f %8.0f %13.3fms %8.1f%s' % (name, results['requests'], results['seconds'],
+                                                          results['requests'] / results['seconds'],
+                                                          results['cpu'] * 1000 / results['requests'],
+                                                          results['bytes'] / 1048576.0,
+                                                          ' (%d errors)' % results['errors'] if results['errors'] else ''))
+
+    old_server.server_close()
+    new_server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='Benchmarks the web server of "cocos run -p web".')
+    parser.add_argument('root_dir', help='The folder to serve, the publish folder of a web project for example.')
+    parser.add_argument('--clients', type=int, default=8, help='The count of the concurrent clients.')
+    parser.add_argument('--rounds', type=int, default=3, help='How many times each client loads the files.')
+    parser.add_argument('--max-files', type=int, default=500, help='The max count of the files to load.')
+    args = parser.parse_args()
+    sys.exit(benchmark(args.root_dir, args.clients, args.rounds, args.max_files))